@@ -0,0 +1,51 @@
+"""
+Benchmark of the consumer message decoding
+
+Usage:
+    python -m benchmarks.bench_decode [--messages 100000] [--batch_size 500]
+
+Compares the per message KafkaDeserializer with the BatchDecoder of the bulk path.
+"""
+import argparse
+import time
+
+from consumer.serializer import KafkaDeserializer, REQUEST_SCHEMA, BatchDecoder
+from core.models import Response
+from core.utils import now
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--batch_size", type=int, default=500)
+    args = parser.parse_args()
+
+    values = [
+        Response(
+            url=f"https://site-{index % 100}.com",
+            status_code=200,
+            load_time=0.25,
+            request_time=now(),
+        ).serialize()
+        for index in range(args.messages)
+    ]
+
+    deserializer = KafkaDeserializer(REQUEST_SCHEMA)
+    start = time.perf_counter()
+    for value in values:
+        deserializer(value)
+    single = args.messages / (time.perf_counter() - start)
+
+    decoder = BatchDecoder()
+    start = time.perf_counter()
+    for index in range(0, args.messages, args.batch_size):
+        decoder(values[index : index + args.batch_size])
+    batched = args.messages / (time.perf_counter() - start)
+
+    print(f"KafkaDeserializer: {single:10.0f} messages/sec")
+    print(f"     BatchDecoder: {batched:10.0f} messages/sec")
+    print(f"          speedup: {batched / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark of the event loop implementations on a socket-heavy workload
+
+Usage:
+    python -m benchmarks.bench_event_loop [--clients 50] [--messages 2000]
+        [--output FILE]
+
+Every client opens a TCP connection to a local echo server and makes a number of
+request/response round trips, the workload is similar to many concurrent site checks.
+A result is appended to a JSON lines file, so the speedup can be compared across
+machines and versions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from core.loop import LOOP_ASYNCIO, LOOP_UVLOOP, LOOP_TYPES, new_event_loop
+
+PAYLOAD = b"x" * 256
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results", "event_loop.jsonl")
+
+
+async def _echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while True:
+        data = await reader.read(4096)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def _client(port: int, messages: int) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(messages):
+        writer.write(PAYLOAD)
+        await writer.drain()
+        await reader.readexactly(len(PAYLOAD))
+    writer.close()
+
+
+async def _workload(clients: int, messages: int) -> float:
+    server = await asyncio.start_server(_echo, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(port, messages) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+def run(clients: int, messages: int) -> Dict[str, float]:
+    """
+    runs the workload on every available loop and returns round trips per second
+    """
+    results = {}
+    for loop_type in LOOP_TYPES:
+        loop = new_event_loop(loop_type)
+        if loop_type != LOOP_ASYNCIO and type(loop).__module__.startswith("asyncio"):
+            loop.close()
+            continue
+        try:
+            elapsed = loop.run_until_complete(_workload(clients, messages))
+        finally:
+            loop.close()
+        results[loop_type] = clients * messages / elapsed
+    return results
+
+
+def record(
+    output: str, clients: int, messages: int, results: Dict[str, float]
+) -> Dict[str, Any]:
+    """
+    appends a result to a JSON lines file and returns it
+    """
+    speedup = None
+    if LOOP_UVLOOP in results:
+        speedup = round(results[LOOP_UVLOOP] / results[LOOP_ASYNCIO], 2)
+    result = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "clients": clients,
+        "messages": messages,
+        "round_trips_per_sec": {name: round(rate) for name, rate in results.items()},
+        "speedup": speedup,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "a") as file_obj:
+        file_obj.write(json.dumps(result) + "\n")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    results = run(args.clients, args.messages)
+    for loop_type, rate in results.items():
+        print(f"{loop_type:>8}: {rate:12.0f} round trips/sec")
+    result = record(args.output, args.clients, args.messages, results)
+    if result["speedup"] is not None:
+        print(f" speedup: {result['speedup']:.2f}x")
+    else:
+        print("uvloop is not installed, the speedup is not measured")
+    print(f"the result is recorded to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
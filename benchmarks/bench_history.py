@@ -0,0 +1,54 @@
+"""
+Benchmark of the history query aggregation
+
+Usage:
+    python -m benchmarks.bench_history
+
+Aggregates a year of hourly rollups of a site into daily buckets and 6 hours of raw
+checks made every second into 5 minute buckets, the database is not used.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+from consumer.queries import aggregate_raw, aggregate_rollups
+from consumer.rollups import SKETCH_BUCKETS
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc).timestamp()
+
+
+def _measure(name: str, func, repeat: int = 20) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        buckets = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:>28}: {elapsed * 1000:8.2f} ms, {len(buckets)} buckets")
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    hours = 365 * 24
+    times = START + np.arange(hours) * 3600.0
+    sketches = rng.integers(0, 5, size=(hours, SKETCH_BUCKETS))
+    checks = sketches.sum(axis=1)
+    _measure(
+        "year of hourly rollups",
+        lambda: aggregate_rollups(
+            times, checks, checks // 10, checks * 0.3, sketches, START, 86400
+        ),
+    )
+
+    seconds = 6 * 3600
+    raw_times = START + np.arange(seconds, dtype=float)
+    load_times = rng.lognormal(-1, 0.5, seconds)
+    is_alive = rng.random(seconds) > 0.01
+    _measure(
+        "6 hours of raw checks",
+        lambda: aggregate_raw(raw_times, load_times, is_alive, START, 300),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Module for alerting on check results
+
+Rules are evaluated on every written check, each rule keeps a small state per site
+which is updated in constant time. An alert is sent when a rule starts firing for a
+site and when it is resolved, so notifiers do not receive duplicates.
+
+Rules are read from a JSON file:
+
+    [
+        {"name": "down", "type": "consecutive_failures", "count": 3},
+        {"name": "slow", "type": "latency", "threshold": 2.0, "duration": 300},
+        {"name": "flaky", "type": "error_rate", "rate": 0.5, "window": 600}
+    ]
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Mapping, Iterable, Callable
+
+import aiohttp
+import trafaret as t
+from loguru import logger
+
+from consumer.metrics import ALERTS_SENT
+from core.reader import JSONFileReader
+from core.utils import JSONEncoder
+
+FIRING = "firing"
+RESOLVED = "resolved"
+# error rate windows are split into slots, old slots are dropped as a whole
+ERROR_RATE_SLOTS = 10
+DEFAULT_MIN_CHECKS = 5
+DEFAULT_WEBHOOK_TIMEOUT = 10  # seconds
+
+
+class Rule(ABC):
+    """
+    Base class for alert rules
+
+    A rule keeps a state per site, ``update`` adds a check to the state and returns
+    whether the rule fires.
+    """
+
+    name: str
+
+    @abstractmethod
+    def new_state(self) -> Any:
+        """
+        returns a state of a new site
+        """
+
+    @abstractmethod
+    def update(self, state: Any, timestamp: float, load_time: float, ok: bool) -> bool:
+        """
+        adds a check to the state and returns whether the rule fires
+        """
+
+    @abstractmethod
+    def describe(self) -> str:
+        """
+        returns a description of the firing rule
+        """
+
+
+@dataclass
+class ConsecutiveFailures(Rule):
+    """
+    fires after a number of failed checks in a row
+    """
+
+    name: str
+    count: int
+
+    def new_state(self) -> List[int]:
+        return [0]
+
+    def update(self, state: List[int], timestamp: float, load_time: float, ok: bool):
+        state[0] = 0 if ok else state[0] + 1
+        return state[0] >= self.count
+
+    def describe(self) -> str:
+        return f"{self.count} consecutive failures"
+
+
+@dataclass
+class SlowResponses(Rule):
+    """
+    fires when load times stay above a threshold for a duration
+    """
+
+    name: str
+    threshold: float
+    duration: float
+
+    def new_state(self) -> List[Optional[float]]:
+        # the time of the first slow check in a row
+        return [None]
+
+    def update(
+        self, state: List[Optional[float]], timestamp: float, load_time: float, ok: bool
+    ) -> bool:
+        if not ok:
+            # the load time of a failed check is not measured, the row goes on
+            return state[0] is not None and timestamp - state[0] >= self.duration
+        if load_time <= self.threshold:
+            state[0] = None
+            return False
+        if state[0] is None:
+            state[0] = timestamp
+        return timestamp - state[0] >= self.duration
+
+    def describe(self) -> str:
+        return f"load time above {self.threshold}s for {self.duration}s"
+
+
+@dataclass
+class ErrorRateState:
+    """
+    ErrorRateState keeps counters of checks in slots of a window
+    """
+
+    checks: List[int] = field(default_factory=lambda: [0] * ERROR_RATE_SLOTS)
+    failures: List[int] = field(default_factory=lambda: [0] * ERROR_RATE_SLOTS)
+    total_checks: int = 0
+    total_failures: int = 0
+    slot: int = -1
+
+
+@dataclass
+class ErrorRate(Rule):
+    """
+    fires when the share of failed checks in a window is above a rate
+    """
+
+    name: str
+    rate: float
+    window: float
+    min_checks: int = DEFAULT_MIN_CHECKS
+
+    def new_state(self) -> ErrorRateState:
+        return ErrorRateState()
+
+    def update(
+        self, state: ErrorRateState, timestamp: float, load_time: float, ok: bool
+    ) -> bool:
+        slot = int(timestamp * ERROR_RATE_SLOTS // self.window)
+        if slot != state.slot:
+            # slots between the previous check and this one are expired, at most
+            # all the slots are cleared
+            for expired in range(
+                max(state.slot + 1, slot - ERROR_RATE_SLOTS + 1), slot + 1
+            ):
+                index = expired % ERROR_RATE_SLOTS
+                state.total_checks -= state.checks[index]
+                state.total_failures -= state.failures[index]
+                state.checks[index] = state.failures[index] = 0
+            state.slot = slot
+        index = slot % ERROR_RATE_SLOTS
+        state.checks[index] += 1
+        state.total_checks += 1
+        if not ok:
+            state.failures[index] += 1
+            state.total_failures += 1
+        return (
+            state.total_checks >= self.min_checks
+            and state.total_failures > self.rate * state.total_checks
+        )
+
+    def describe(self) -> str:
+        return f"more than {self.rate:.0%} of checks failed in {self.window}s"
+
+
+RULE_TYPES = {
+    "consecutive_failures": ConsecutiveFailures,
+    "latency": SlowResponses,
+    "error_rate": ErrorRate,
+}
+
+RULE_SCHEMA = t.Or(
+    t.Dict(
+        {
+            t.Key("name"): t.String,
+            t.Key("type"): t.Atom("consecutive_failures"),
+            t.Key("count"): t.ToInt(gte=1),
+        }
+    ),
+    t.Dict(
+        {
+            t.Key("name"): t.String,
+            t.Key("type"): t.Atom("latency"),
+            t.Key("threshold"): t.ToFloat(gt=0),
+            t.Key("duration"): t.ToFloat(gte=0),
+        }
+    ),
+    t.Dict(
+        {
+            t.Key("name"): t.String,
+            t.Key("type"): t.Atom("error_rate"),
+            t.Key("rate"): t.ToFloat(gte=0, lt=1),
+            t.Key("window"): t.ToFloat(gt=0),
+            t.Key("min_checks", optional=True): t.ToInt(gte=1),
+        }
+    ),
+)
+
+RULES_FILE_SCHEMA = t.List(RULE_SCHEMA)
+
+
+def read_rules(file_name: str) -> List[Rule]:
+    """
+    reads rules from a JSON file
+    """
+    with JSONFileReader(file_name, RULES_FILE_SCHEMA) as reader:
+        return [
+            RULE_TYPES[rule.pop("type")](**rule)  # type: ignore
+            for rule in reader.read()
+        ]
+
+
+@dataclass
+class Alert:
+    """
+    Alert represents a change of a rule state of a site
+    """
+
+    rule: str
+    url: Optional[str]
+    status: str
+    time: datetime
+    description: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        returns the alert as a dictionary
+        """
+        return asdict(self)
+
+    def json_dumps(self) -> str:
+        """
+        returns the alert as JSON
+        """
+        return json.dumps(self.to_dict(), cls=JSONEncoder)
+
+
+class BaseNotifier(ABC):
+    """
+    Base class for notifiers
+    """
+
+    @abstractmethod
+    async def send(self, alert: Alert) -> None:
+        """
+        sends an alert
+        """
+        raise NotImplementedError()
+
+    async def close(self) -> None:
+        """
+        releases resources of the notifier
+        """
+
+
+class LogNotifier(BaseNotifier):
+    """
+    writes alerts to the log
+    """
+
+    async def send(self, alert: Alert) -> None:
+        logger.warning(
+            "Alert {} {} for {}: {}",
+            alert.rule,
+            alert.status,
+            alert.url,
+            alert.description,
+        )
+
+
+@dataclass
+class FileNotifier(BaseNotifier):
+    """
+    appends alerts to a file, a JSON document per line
+    """
+
+    file_name: str
+
+    async def send(self, alert: Alert) -> None:
+        with open(self.file_name, "a") as file_obj:
+            file_obj.write(alert.json_dumps() + "\n")
+
+
+@dataclass
+class WebhookNotifier(BaseNotifier):
+    """
+    posts alerts as JSON to a URL
+    """
+
+    url: str
+    timeout: float = DEFAULT_WEBHOOK_TIMEOUT
+    session: Optional[aiohttp.ClientSession] = None
+
+    async def send(self, alert: Alert) -> None:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        async with self.session.post(
+            self.url,
+            data=alert.json_dumps(),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            response.raise_for_status()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+
+class AlertEngine:
+    """
+    AlertEngine evaluates rules on written checks and sends alerts to notifiers
+
+    Rules are evaluated synchronously, alerts are queued and sent by ``run``, so a slow
+    notifier does not delay writes.
+
+    Attributes:
+       rules: Alert rules
+       notifiers: Notifiers receiving every alert
+    """
+
+    def __init__(self, rules: List[Rule], notifiers: List[BaseNotifier]) -> None:
+        self.rules = rules
+        self.notifiers = notifiers
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # per site states of rules, whether rules fire and the last check time
+        self._states: Dict[int, List[Any]] = {}
+        self._firing: Dict[int, List[bool]] = {}
+        self._last_check: Dict[int, float] = {}
+
+    def process(
+        self,
+        rows: Iterable[Mapping[str, Any]],
+        url_of: Callable[[int], Optional[str]] = lambda site_id: None,
+    ) -> List[Alert]:
+        """
+        evaluates rules on written rows and queues alerts
+        """
+        alerts = []
+        rules = self.rules
+        for row in sorted(rows, key=lambda row: row["request_date"]):
+            site_id = row["site_id"]
+            request_date = row["request_date"]
+            timestamp = request_date.timestamp()
+            states = self._states.get(site_id)
+            if states is None:
+                states = self._states[site_id] = [rule.new_state() for rule in rules]
+                self._firing[site_id] = [False] * len(rules)
+            elif timestamp < self._last_check[site_id]:
+                # a late check does not change the current state
+                continue
+            self._last_check[site_id] = timestamp
+            firing = self._firing[site_id]
+            load_time = float(row["load_time"])
+            ok = row["is_alive"]
+            for index, rule in enumerate(rules):
+                fires = rule.update(states[index], timestamp, load_time, ok)
+                if fires != firing[index]:
+                    firing[index] = fires
+                    alerts.append(
+                        Alert(
+                            rule=rule.name,
+                            url=url_of(site_id),
+                            status=FIRING if fires else RESOLVED,
+                            time=request_date,
+                            description=rule.describe(),
+                        )
+                    )
+        for alert in alerts:
+            self.queue.put_nowait(alert)
+        return alerts
+
+    async def run(self) -> None:
+        """
+        sends queued alerts to notifiers
+        """
+        try:
+            while True:
+                alert = await self.queue.get()
+                for notifier in self.notifiers:
+                    try:
+                        await notifier.send(alert)
+                    except Exception as err:  # pylint: disable=broad-except
+                        logger.error(
+                            "cannot send alert with {} - {}",
+                            type(notifier).__name__,
+                            err,
+                        )
+                    else:
+                        ALERTS_SENT.labels(alert.status).inc()
+                self.queue.task_done()
+        finally:
+            for notifier in self.notifiers:
+                await notifier.close()
+
+
+def create_alert_engine(
+    rules_file: str, webhook: Optional[str] = None, file_name: Optional[str] = None
+) -> AlertEngine:
+    """
+    returns an engine evaluating rules from a file, alerts are always logged
+    """
+    notifiers: List[BaseNotifier] = [LogNotifier()]
+    if webhook:
+        notifiers.append(WebhookNotifier(webhook))
+    if file_name:
+        notifiers.append(FileNotifier(file_name))
+    rules = read_rules(rules_file)
+    logger.info("Evaluating {} alert rules", len(rules))
+    return AlertEngine(rules, notifiers)
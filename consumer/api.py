@@ -0,0 +1,145 @@
+"""
+Module for the read API of the consumer
+
+The API serves the current status and recent checks of sites from memory, the
+database is not queried.
+
+    GET /status              statuses of all sites
+    GET /status?url=<url>    the status of a site
+    GET /history?url=<url>&limit=<n>
+                             recent checks of a site, the newest first
+    GET /history/buckets?url=<url>&start=<time>&end=<time>&bucket=<seconds>
+                             availability and latency percentiles of a site in time
+                             buckets, it is read from the database
+"""
+import json
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from aiohttp import web
+from loguru import logger
+
+from consumer.queries import DEFAULT_BUCKET, DEFAULT_RANGE, HistoryQuery, as_utc
+from consumer.writer import DatabaseWriter
+from core.utils import JSONEncoder, utc
+
+DEFAULT_API_HOST = "0.0.0.0"
+
+WRITER_KEY = web.AppKey("writer", DatabaseWriter)
+QUERY_KEY = web.AppKey("query", HistoryQuery)
+
+
+def _json_response(data: Any) -> web.Response:
+    return web.Response(
+        text=json.dumps(data, cls=JSONEncoder), content_type="application/json"
+    )
+
+
+def _site_id(request: web.Request) -> Optional[int]:
+    writer = request.app[WRITER_KEY]
+    url = request.query.get("url")
+    if url is None:
+        return None
+    site_id = writer.status.urls.get(url)
+    if site_id is None:
+        raise web.HTTPNotFound(reason=f"unknown site {url}")
+    return site_id
+
+
+def _with_error(writer: DatabaseWriter, data: Dict[str, Any]) -> Dict[str, Any]:
+    data["error"] = writer.error_kinds.value(data["error_id"])
+    return data
+
+
+async def get_status(request: web.Request) -> web.Response:
+    """
+    returns statuses of all sites or a site
+    """
+    writer = request.app[WRITER_KEY]
+    sites = writer.status.sites
+    site_id = _site_id(request)
+    if site_id is not None:
+        return _json_response(_with_error(writer, sites[site_id].to_dict()))
+    return _json_response(
+        [_with_error(writer, status.to_dict()) for status in sites.values()]
+    )
+
+
+async def get_history(request: web.Request) -> web.Response:
+    """
+    returns recent checks of a site
+    """
+    writer = request.app[WRITER_KEY]
+    site_id = _site_id(request)
+    if site_id is None:
+        raise web.HTTPBadRequest(reason="url is required")
+    try:
+        limit = int(request.query.get("limit", writer.history.size))
+    except ValueError:
+        raise web.HTTPBadRequest(reason="limit should be a number") from None
+    history = writer.history.get(site_id)
+    checks = history.latest(limit) if history is not None else []
+    return _json_response([_with_error(writer, check) for check in checks])
+
+
+def _parse_time(value: str) -> datetime:
+    return as_utc(datetime.fromisoformat(value))
+
+
+async def get_buckets(request: web.Request) -> web.Response:
+    """
+    returns the history of a site in time buckets
+    """
+    query = request.app[QUERY_KEY]
+    url = request.query.get("url")
+    if url is None:
+        raise web.HTTPBadRequest(reason="url is required")
+    try:
+        end = _parse_time(request.query["end"]) if "end" in request.query else None
+        end = end or datetime.now(utc)
+        start = (
+            _parse_time(request.query["start"])
+            if "start" in request.query
+            else end - DEFAULT_RANGE
+        )
+        bucket = int(request.query.get("bucket", DEFAULT_BUCKET))
+    except ValueError as err:
+        raise web.HTTPBadRequest(reason=str(err)) from None
+    if bucket <= 0 or start >= end:
+        raise web.HTTPBadRequest(reason="invalid range")
+    try:
+        result = await query.run(url, start, end, bucket)
+    except ValueError as err:
+        raise web.HTTPBadRequest(reason=str(err)) from None
+    if result is None:
+        raise web.HTTPNotFound(reason=f"unknown site {url}")
+    return _json_response(result)
+
+
+def create_app(
+    writer: DatabaseWriter, query: Optional[HistoryQuery] = None
+) -> web.Application:
+    """
+    returns the API application reading statuses and histories of the writer
+    """
+    app = web.Application()
+    app[WRITER_KEY] = writer
+    app.router.add_get("/status", get_status)
+    app.router.add_get("/history", get_history)
+    if query is not None:
+        app[QUERY_KEY] = query
+        app.router.add_get("/history/buckets", get_buckets)
+    return app
+
+
+async def start_api_server(
+    host: str, port: int, writer: DatabaseWriter, query: Optional[HistoryQuery] = None
+) -> web.AppRunner:
+    """
+    starts the API server, the returned runner stops it by ``cleanup``
+    """
+    runner = web.AppRunner(create_app(writer, query), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving the API on {}:{}", host, port)
+    return runner
@@ -0,0 +1,401 @@
+"""
+Module for archiving closed days of the monitoring table to columnar files
+
+Every day is written to its own file, ``monitoring_YYYYMMDD.arc``. Rows are streamed
+from the database with a server-side cursor and written in chunks, a chunk stores every
+column as a zlib compressed array, urls and errors are replaced with codes of a chunk
+dictionary. A reader scans a file chunk by chunk and decompresses only the requested
+columns, so reports over months of data do not load whole files into memory.
+
+A file is a magic line followed by chunks, a chunk is the length of its JSON header
+(a little-endian unsigned 32-bit integer), the header and compressed columns:
+
+    {"rows": 2, "columns": [["id", "<i8", 18], ...], "urls": [...], "errors": [...]}
+"""
+import asyncio
+import json
+import os
+import struct
+import zlib
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Iterator, BinaryIO
+
+import asyncpg
+import numpy as np
+from loguru import logger
+
+from consumer.partitions import (
+    MAINTENANCE_LOCK_ID,
+    MONITORING_TABLE,
+    SELECT_PARTITIONS,
+    detach_partition_sql,
+    drop_partition_sql,
+    partition_day,
+    partition_name,
+    today,
+)
+from core.utils import utc
+
+ARCHIVE_MAGIC = b"monitoring-archive 1\n"
+ARCHIVE_SUFFIX = ".arc"
+DEFAULT_CHUNK_ROWS = 100000
+COMPRESSION_LEVEL = 6
+
+KEEP = "keep"
+DETACH = "detach"
+DROP = "drop"
+CLEANUP_MODES = (KEEP, DETACH, DROP)
+
+# names and types of columns, urls and errors are codes of chunk dictionaries
+ARCHIVE_COLUMNS = (
+    ("id", "<i8"),
+    ("url", "<i4"),
+    ("load_time", "<f8"),
+    ("status_code", "<i2"),
+    ("is_alive", "|b1"),
+    ("error", "<i4"),
+    ("request_date", "<f8"),
+    ("check_id", "|S16"),
+    ("anomaly_score", "<f4"),
+)
+# the code of a missing error
+NO_ERROR = -1
+
+SELECT_ARCHIVE = """
+    SELECT monitoring.id, url, load_time::float8, status_code, is_alive, error,
+        extract(epoch FROM request_date)::float8, check_id, anomaly_score
+    FROM monitoring
+        JOIN sites ON sites.id = site_id
+        LEFT JOIN error_kinds ON error_kinds.id = error_id
+    WHERE request_date >= $1 AND request_date < $2
+    ORDER BY request_date
+"""
+
+# writers insert through the parent table, so they wait until the partition is gone
+LOCK_MONITORING = f"LOCK TABLE ONLY {MONITORING_TABLE} IN ACCESS EXCLUSIVE MODE"
+
+_HEADER_SIZE = struct.Struct("<I")
+
+
+def archive_path(directory: str, day: date) -> Path:
+    """
+    returns the path of an archive of the day
+    """
+    return Path(directory) / f"{partition_name(day)}{ARCHIVE_SUFFIX}"
+
+
+def _encode(values: Sequence[Any], none_code: Optional[int] = None):
+    dictionary: Dict[Any, int] = {}
+    codes = []
+    for value in values:
+        if value is None and none_code is not None:
+            codes.append(none_code)
+            continue
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        codes.append(code)
+    return list(dictionary), codes
+
+
+class ArchiveWriter:
+    """
+    ArchiveWriter writes rows to an archive file in chunks
+
+    The file is written under a temporary name and renamed when it is complete, so a
+    failed export does not leave a truncated archive.
+
+    Attributes:
+       path: A path of the archive
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.rows = 0
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file: Optional[BinaryIO] = None
+
+    def __enter__(self) -> "ArchiveWriter":
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(ARCHIVE_MAGIC)
+        return self
+
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        """
+        writes rows in the order of ``ARCHIVE_COLUMNS`` as a chunk
+        """
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        urls, url_codes = _encode(columns[1])
+        errors, error_codes = _encode(columns[5], NO_ERROR)
+        values = {
+            "id": columns[0],
+            "url": url_codes,
+            "load_time": columns[2],
+            "status_code": columns[3],
+            "is_alive": columns[4],
+            "error": error_codes,
+            "request_date": columns[6],
+            "check_id": [
+                check_id.bytes if check_id is not None else b""
+                for check_id in columns[7]
+            ],
+            "anomaly_score": [
+                score if score is not None else np.nan for score in columns[8]
+            ],
+        }
+        blobs = [
+            zlib.compress(
+                np.array(values[name], dtype=dtype).tobytes(), COMPRESSION_LEVEL
+            )
+            for name, dtype in ARCHIVE_COLUMNS
+        ]
+        header = json.dumps(
+            {
+                "rows": len(rows),
+                "columns": [
+                    [name, dtype, len(blob)]
+                    for (name, dtype), blob in zip(ARCHIVE_COLUMNS, blobs)
+                ],
+                "urls": urls,
+                "errors": errors,
+            }
+        ).encode()
+        self._file.write(_HEADER_SIZE.pack(len(header)))
+        self._file.write(header)
+        for blob in blobs:
+            self._file.write(blob)
+        self.rows += len(rows)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if exc_type is not None:
+            os.unlink(self._tmp_path)
+            return False
+        os.replace(self._tmp_path, self.path)
+        return True
+
+
+class ArchiveReader:
+    """
+    ArchiveReader scans an archive file chunk by chunk
+
+    Attributes:
+       path: A path of the archive
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._file: Optional[BinaryIO] = None
+
+    def __enter__(self) -> "ArchiveReader":
+        self._file = open(self.path, "rb")
+        if self._file.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            self._file.close()
+            raise ValueError(f"{self.path} is not a monitoring archive")
+        return self
+
+    def chunks(
+        self, columns: Optional[Sequence[str]] = None
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        yields chunks as arrays of columns, all columns are read if none are given
+
+        ``request_date`` is in seconds since the epoch, urls and errors are decoded,
+        missing errors are None, missing check identifiers are empty, missing scores
+        are NaN.
+        """
+        file_obj = self._file
+        file_obj.seek(len(ARCHIVE_MAGIC))
+        while True:
+            size = file_obj.read(_HEADER_SIZE.size)
+            if not size:
+                return
+            header = json.loads(file_obj.read(_HEADER_SIZE.unpack(size)[0]))
+            chunk: Dict[str, np.ndarray] = {}
+            for name, dtype, length in header["columns"]:
+                if columns is not None and name not in columns:
+                    file_obj.seek(length, os.SEEK_CUR)
+                    continue
+                values = np.frombuffer(zlib.decompress(file_obj.read(length)), dtype)
+                if name == "url":
+                    values = np.array(header["urls"], dtype=object)[values]
+                elif name == "error":
+                    # the missing error code refers to the last item
+                    values = np.array(header["errors"] + [None], dtype=object)[values]
+                chunk[name] = values
+            yield chunk
+
+    def rows(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        yields rows as dictionaries
+        """
+        for chunk in self.chunks(columns):
+            names = list(chunk)
+            for values in zip(*(chunk[name].tolist() for name in names)):
+                yield dict(zip(names, values))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        return False
+
+
+def scan_archive(
+    directory: str,
+    start: date,
+    end: date,
+    columns: Optional[Sequence[str]] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    yields chunks of archived days from the start to the end exclusive
+    """
+    day = start
+    while day < end:
+        path = archive_path(directory, day)
+        if path.exists():
+            with ArchiveReader(path) as reader:
+                yield from reader.chunks(columns)
+        day += timedelta(days=1)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time(), tzinfo=utc)
+
+
+async def export_day(
+    connection: asyncpg.Connection,
+    directory: str,
+    day: date,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> int:
+    """
+    writes rows of the day to its archive and returns the number of rows
+
+    A day without rows does not replace an existing archive.
+    """
+    path = archive_path(directory, day)
+    async with connection.transaction():
+        cursor = await connection.cursor(
+            SELECT_ARCHIVE, _day_start(day), _day_start(day + timedelta(days=1))
+        )
+        rows = await cursor.fetch(chunk_rows)
+        if not rows:
+            return 0
+        with ArchiveWriter(path) as writer:
+            while rows:
+                writer.write(rows)
+                rows = await cursor.fetch(chunk_rows)
+    logger.info("{} rows of {} archived to {}", writer.rows, day, path)
+    return writer.rows
+
+
+async def cleanup_day(
+    connection: asyncpg.Connection, day: date, mode: str, rows: Optional[int] = None
+) -> bool:
+    """
+    detaches or drops the partition of an archived day, returns whether it was done
+
+    If the number of archived rows is given, a partition with other rows is kept, the
+    rows are written to it after the export.
+    """
+    if mode == KEEP:
+        return False
+    async with connection.transaction():
+        # partitions are not changed by the maintenance at the same time
+        await connection.execute("SELECT pg_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID)
+        names = {row[0] for row in await connection.fetch(SELECT_PARTITIONS)}
+        if partition_name(day) not in names:
+            return False
+        await connection.execute(LOCK_MONITORING)
+        if rows is not None:
+            count = await connection.fetchval(
+                f"SELECT count(*) FROM {partition_name(day)}"
+            )
+            if count != rows:
+                logger.warning(
+                    "Partition of {} is kept, it has {} rows, {} rows are archived",
+                    day,
+                    count,
+                    rows,
+                )
+                return False
+        if mode == DETACH:
+            await connection.execute(detach_partition_sql(day))
+        else:
+            await connection.execute(drop_partition_sql(day))
+    logger.info("Partition of {} {}", day, "detached" if mode == DETACH else "dropped")
+    return True
+
+
+async def archive_days(
+    connection: asyncpg.Connection,
+    directory: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    *,
+    cleanup: str = KEEP,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Dict[date, int]:
+    """
+    archives closed days from the start to the end exclusive, returns rows per day
+
+    The current day is not closed, the range ends with the previous day at most. The
+    start is the oldest partition by default.
+    """
+    end = min(end or today(), today())
+    if start is None:
+        days = [
+            partition_day(row[0]) for row in await connection.fetch(SELECT_PARTITIONS)
+        ]
+        days = [day for day in days if day is not None]
+        if not days:
+            return {}
+        start = min(days)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    result: Dict[date, int] = {}
+    day = start
+    while day < end:
+        result[day] = await export_day(connection, directory, day, chunk_rows)
+        # rows written during the export keep the partition until the next archive
+        await cleanup_day(connection, day, cleanup, result[day])
+        day += timedelta(days=1)
+    return result
+
+
+async def main(
+    directory: str,
+    start: Optional[date],
+    end: Optional[date],
+    cleanup: str,
+    chunk_rows: int,
+    pg_connection_params: Dict[str, Any],
+) -> None:
+    """
+    archives closed days of the monitoring table
+    """
+    connection = await asyncpg.connect(**pg_connection_params)
+    try:
+        result = await archive_days(
+            connection, directory, start, end, cleanup=cleanup, chunk_rows=chunk_rows
+        )
+    finally:
+        await connection.close()
+    logger.info("{} rows of {} days archived", sum(result.values()), len(result))
+
+
+def run(
+    directory: str,
+    start: Optional[date],
+    end: Optional[date],
+    cleanup: str,
+    chunk_rows: int,
+    pg_connection_params: Dict[str, Any],
+) -> None:
+    """
+    run an archive export
+    """
+    asyncio.run(main(directory, start, end, cleanup, chunk_rows, pg_connection_params))
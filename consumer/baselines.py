@@ -0,0 +1,210 @@
+"""
+Module for keeping latency baselines of sites and scoring checks against them
+
+A baseline is an exponentially weighted mean and variance of the logarithm of load
+times of successful checks, so a site answering in 50ms and a site answering in 3s are
+scored by their own latency. The score of a check is the number of standard deviations
+between its log load time and the baseline before the check. Baselines of all sites
+are kept in typed arrays, an update takes a few arithmetic operations, and they are
+written to the ``site_baselines`` table periodically, so they survive restarts.
+"""
+import math
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Iterable
+
+import asyncpg
+
+from core.utils import utc
+
+DEFAULT_ALPHA = 0.05
+# checks of a site needed before its checks are scored
+DEFAULT_WARMUP = 20
+DEFAULT_ANOMALY_THRESHOLD = 4.0
+DEFAULT_BASELINE_REFRESH = 60  # seconds
+# the minimal standard deviation of log load times, jitter of a few percent is normal
+MIN_DEVIATION = 0.05
+# load times are clamped to 1ms before the logarithm
+MIN_LOAD_TIME = 0.001
+
+UPSERT_BASELINE = """
+    INSERT INTO site_baselines AS baseline (site_id, mean, variance, checks, updated)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (site_id) DO UPDATE SET
+        mean = excluded.mean,
+        variance = excluded.variance,
+        checks = excluded.checks,
+        updated = excluded.updated
+    WHERE baseline.updated < excluded.updated
+"""
+
+SELECT_BASELINES = """
+    SELECT site_id, mean, variance, checks, extract(epoch FROM updated)::float8
+    FROM site_baselines
+"""
+
+# the mean, the variance, the number of checks and the time of the last check
+Baseline = Tuple[float, float, int, float]
+# a site, a load time, whether the check succeeded and its time
+Check = Tuple[int, float, bool, datetime]
+
+
+class BaselineStore:
+    """
+    BaselineStore keeps latency baselines of sites in memory
+
+    Attributes:
+       alpha: A weight of a new check in the baseline
+       warmup: A number of checks of a site before its checks are scored
+       threshold: A score of a check counted as an anomaly
+       refresh_interval: A period of writing the baseline of a site
+    """
+
+    def __init__(
+        self,
+        alpha: float = DEFAULT_ALPHA,
+        warmup: int = DEFAULT_WARMUP,
+        threshold: float = DEFAULT_ANOMALY_THRESHOLD,
+        refresh_interval: float = DEFAULT_BASELINE_REFRESH,
+    ) -> None:
+        self.alpha = alpha
+        self.warmup = warmup
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        # sites are slots of the arrays
+        self._slots: Dict[int, int] = {}
+        self._mean = array("d")
+        self._variance = array("d")
+        self._checks = array("q")
+        self._updated = array("d")
+        # the time of the last check written to the table
+        self._saved = array("d")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def get(self, site_id: int) -> Optional[Baseline]:
+        """
+        returns the baseline of a site, None if the site has no successful checks
+        """
+        slot = self._slots.get(site_id)
+        if slot is None:
+            return None
+        return (
+            self._mean[slot],
+            self._variance[slot],
+            self._checks[slot],
+            self._updated[slot],
+        )
+
+    def _set(self, site_id: int, baseline: Baseline, saved: float) -> None:
+        slot = self._slots.get(site_id)
+        if slot is None:
+            self._slots[site_id] = len(self._mean)
+            self._mean.append(baseline[0])
+            self._variance.append(baseline[1])
+            self._checks.append(baseline[2])
+            self._updated.append(baseline[3])
+            self._saved.append(saved)
+            return
+        self._mean[slot], self._variance[slot] = baseline[0], baseline[1]
+        self._checks[slot], self._updated[slot] = baseline[2], baseline[3]
+        self._saved[slot] = saved
+
+    async def load(self, connection: asyncpg.Connection) -> None:
+        """
+        reads baselines of all sites
+        """
+        for site_id, mean, variance, checks, updated in await connection.fetch(
+            SELECT_BASELINES
+        ):
+            self._set(site_id, (mean, variance, checks, updated), updated)
+
+    def prepare(
+        self, checks: Iterable[Check]
+    ) -> Tuple[List[Optional[float]], Dict[int, Baseline]]:
+        """
+        returns scores of checks and new baselines of sites, the store is not changed
+
+        Failed checks and checks of sites in the warmup are not scored, failed checks
+        do not change baselines.
+        """
+        checks = list(checks)
+        scores: List[Optional[float]] = [None] * len(checks)
+        changed: Dict[int, Baseline] = {}
+        alpha, threshold = self.alpha, self.threshold
+        for index in sorted(range(len(checks)), key=lambda index: checks[index][3]):
+            site_id, load_time, ok, request_time = checks[index]
+            if not ok:
+                continue
+            timestamp = request_time.timestamp()
+            value = math.log(max(load_time, MIN_LOAD_TIME))
+            baseline = changed.get(site_id) or self.get(site_id)
+            if baseline is None:
+                changed[site_id] = (value, 0.0, 1, timestamp)
+                continue
+            mean, variance, count, updated = baseline
+            if timestamp <= updated:
+                # a late or repeated check does not change the baseline
+                continue
+            deviation = max(math.sqrt(variance), MIN_DEVIATION)
+            diff = value - mean
+            if count >= self.warmup:
+                scores[index] = diff / deviation
+                # an outlier moves the baseline as much as a check at the threshold
+                diff = max(min(diff, threshold * deviation), -threshold * deviation)
+            increment = alpha * diff
+            changed[site_id] = (
+                mean + increment,
+                (1 - alpha) * (variance + diff * increment),
+                count + 1,
+                timestamp,
+            )
+        return scores, changed
+
+    def anomalies(self, scores: Iterable[Optional[float]]) -> int:
+        """
+        returns the number of anomalous scores
+        """
+        threshold = self.threshold
+        return sum(
+            1 for score in scores if score is not None and abs(score) >= threshold
+        )
+
+    def _should_save(self, site_id: int, baseline: Baseline) -> bool:
+        slot = self._slots.get(site_id)
+        return slot is None or baseline[3] - self._saved[slot] >= self.refresh_interval
+
+    async def save(
+        self, connection: asyncpg.Connection, baselines: Dict[int, Baseline]
+    ) -> None:
+        """
+        writes baselines returned by ``apply``
+        """
+        rows = [
+            (site_id, *baseline[:3], datetime.fromtimestamp(baseline[3], utc))
+            for site_id, baseline in sorted(baselines.items())
+        ]
+        if not rows:
+            return
+        # rows are locked in the same order by all consumers, so they do not deadlock
+        await connection.executemany(UPSERT_BASELINE, rows)
+        for site_id, baseline in baselines.items():
+            self._saved[self._slots[site_id]] = baseline[3]
+
+    def apply(self, baselines: Dict[int, Baseline]) -> Dict[int, Baseline]:
+        """
+        updates the store and returns baselines which should be refreshed
+
+        A baseline older than the stored one is skipped.
+        """
+        changed = {}
+        for site_id, baseline in baselines.items():
+            slot = self._slots.get(site_id)
+            if slot is not None and self._updated[slot] >= baseline[3]:
+                continue
+            if self._should_save(site_id, baseline):
+                changed[site_id] = baseline
+            # the baseline is saved when it is written
+            self._set(site_id, baseline, self._saved[slot] if slot is not None else 0.0)
+        return changed
@@ -4,20 +4,52 @@ Module for reading data from Kafka and write them to the PostgreSQL
 from __future__ import annotations
 
 import asyncio
-import ssl
 import sys
-from typing import Set, Any, Optional, Callable
+import time
+from contextlib import asynccontextmanager
+from typing import Set, Any, Callable, Dict, AsyncIterator
 
 import asyncpg
 from aiokafka import AIOKafkaConsumer
 from aiokafka.helpers import create_ssl_context
 from loguru import logger
 
-from consumer.serializer import KafkaDeserializer, REQUEST_SCHEMA
-from core.models import Response
+from consumer.alerts import create_alert_engine
+from consumer.api import DEFAULT_API_HOST, start_api_server
+from consumer.history import HistoryStore
+from consumer.metrics import (
+    MESSAGES_CONSUMED,
+    KAFKA_CONSUME_LATENCY,
+    KAFKA_LAG,
+    QUEUE_SIZE,
+)
+from consumer.offsets import DEFAULT_HIGH_WATER, DEFAULT_LOW_WATER, OffsetManager
+from consumer.partitions import (
+    DEFAULT_RETENTION_DAYS,
+    DEFAULT_PREMAKE_DAYS,
+    run_maintenance,
+)
+from consumer.pipeline import PipelineManager
+from consumer.postgres import pg_params
+from consumer.queries import HistoryQuery
+from consumer.serializer import BatchDecoder
+from consumer.writer import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_LINGER, DatabaseWriter
+from core.loop import DEFAULT_LOOP, new_event_loop
+from core.metrics import (
+    DEFAULT_METRICS_HOST,
+    monitor_loop_lag,
+    start_metrics_server,
+)
+from core.profiling import (
+    DEFAULT_PROFILE_DIR,
+    DEFAULT_SLOW_CALLBACK_DURATION,
+    Profiler,
+)
 
 DEFAULT_POOL_SIZE = 3
-DEFAULT_DB_WORKERS = 3
+DEFAULT_GROUP_ID = "my-group"
+DEFAULT_CLIENT_ID = "client-storage"
+DEFAULT_FETCH_TIMEOUT = 1000  # milliseconds
 
 
 def _cancel_tasks(to_cancel: Set["asyncio.Task[Any]"], loop: asyncio.AbstractEventLoop):
@@ -47,29 +79,33 @@ def _cancel_tasks(to_cancel: Set["asyncio.Task[Any]"], loop: asyncio.AbstractEve
 async def kafka_consumer(
     kafka_servers: str,
     kafka_topic: str,
-    queue: asyncio.Queue[Response],
+    pipelines: PipelineManager,
     *,
-    deserializer: Optional[Callable] = None,
+    kafka_group_id: str = DEFAULT_GROUP_ID,
+    kafka_client_id: str = DEFAULT_CLIENT_ID,
+    decoder: Callable = BatchDecoder(),
+    max_records: int = DEFAULT_BATCH_SIZE,
     kafka_ssl_cafile: str = None,
     kafka_ssl_certfile: str = None,
     kafka_ssl_keyfile: str = None,
 ) -> None:
     """
-    kafka_consumer reads data from kafka and send it to a queue
+    kafka_consumer reads data from kafka and sends it to partition pipelines
+
+    Offsets are committed by pipelines when messages are written to the database.
     """
+    offsets = pipelines.offsets
     loop = asyncio.get_event_loop()
     kafka_kwargs = {
         "loop": loop,
         "bootstrap_servers": kafka_servers,
-        "client_id": "client-storage",
-        "group_id": "my-group",
-        "enable_auto_commit": True,
-        "auto_commit_interval_ms": 1000,  # Autocommit every second
+        "client_id": kafka_client_id,
+        "group_id": kafka_group_id,
+        "enable_auto_commit": False,
         "auto_offset_reset": "earliest",  # start from beginning
-        "value_deserializer": deserializer,
     }
     if not kafka_ssl_cafile:
-        consumer = AIOKafkaConsumer(kafka_topic, **kafka_kwargs)
+        consumer = AIOKafkaConsumer(**kafka_kwargs)
     else:
         context = create_ssl_context(
             cafile=kafka_ssl_cafile,
@@ -77,56 +113,111 @@ async def kafka_consumer(
             keyfile=kafka_ssl_keyfile,
         )
         consumer = AIOKafkaConsumer(
-            kafka_topic,
             security_protocol="SSL",
             ssl_context=context,
             **kafka_kwargs,
         )
+    consumer.subscribe([kafka_topic], listener=pipelines)
+    offsets.consumer = consumer
     await consumer.start()
     try:
-        # Consume messages
-        async for msg in consumer:
-            if msg.value is not None:
-                logger.debug(f"Message received: {msg.value} at {msg.timestamp}")
-                try:
-                    asyncio.get_event_loop().call_soon_threadsafe(
-                        queue.put_nowait, msg.value
+        while True:
+            batches = await consumer.getmany(
+                timeout_ms=DEFAULT_FETCH_TIMEOUT, max_records=max_records
+            )
+            for partition, messages in batches.items():
+                MESSAGES_CONSUMED.inc(len(messages))
+                last = messages[-1]
+                # the message timestamp is set by the producer in milliseconds
+                KAFKA_CONSUME_LATENCY.observe(
+                    max(time.time() - last.timestamp / 1000, 0)
+                )
+                highwater = consumer.highwater(partition)
+                if highwater is not None:
+                    KAFKA_LAG.labels(partition.partition).set(
+                        highwater - last.offset - 1
                     )
-                except asyncio.QueueFull as err:
-                    logger.error("queue is full cannot send a response - {}", err)
+                records = decoder([msg.value for msg in messages])
+                valid = []
+                for msg, record in zip(messages, records):
+                    offsets.track(partition, msg.offset)
+                    if record is None:
+                        offsets.ack(partition, msg.offset)
+                    else:
+                        valid.append((partition, msg.offset, record))
+                pipelines.put_many(partition, valid)
     finally:
-        # Will leave consumer group; perform autocommit if enabled.
+        await pipelines.stop_all()
+        # Will leave consumer group
         await consumer.stop()
 
 
-async def run_worker(
-    worker_id: int, queue: asyncio.Queue[Response], pool: asyncpg.pool.Pool
-) -> None:
+@asynccontextmanager
+async def run_storage(
+    pg_connection_params: Dict[str, Any],
+    *,
+    api_host: str = DEFAULT_API_HOST,
+    api_port: int = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+    high_water: int = DEFAULT_HIGH_WATER,
+    low_water: int = DEFAULT_LOW_WATER,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    alert_rules: str = None,
+    alert_webhook: str = None,
+    alert_file: str = None,
+) -> AsyncIterator[PipelineManager]:
     """
-    Send a response to kafka
+    starts the database writer with its services and yields its pipelines
+
+    Pipelines should be drained by the caller, services are stopped on exit.
     """
-    insert_response = "INSERT INTO monitoring VALUES(DEFAULT, $1, $2, $3, $4, $5, $6)"
-    while True:
-        response = await queue.get()
-        # save a message
+    async with asyncpg.create_pool(
+        min_size=DEFAULT_POOL_SIZE,
+        max_size=DEFAULT_POOL_SIZE,
+        init=DatabaseWriter.init_connection,
+        **pg_connection_params,
+    ) as pool:
+        # recent checks are kept in memory only for the API
+        writer = DatabaseWriter(
+            pool,
+            retention_days=retention_days,
+            history=HistoryStore() if api_port else None,
+            alerts=create_alert_engine(alert_rules, alert_webhook, alert_file)
+            if alert_rules
+            else None,
+        )
         async with pool.acquire() as connection:
-            try:
-                await connection.execute(
-                    insert_response,
-                    response.url,
-                    response.load_time,
-                    response.status_code,
-                    response.ok,
-                    response.error,
-                    response.request_time,
-                )
-            except asyncpg.exceptions.PostgresConnectionError:
-                logger.error(f"[{worker_id}] cannot connect to postgresql")
-            except asyncpg.exceptions.DataError as err:
-                logger.error(f"[{worker_id}] invalid postgres query {err}")
-            except Exception as err:  # pylint: disable=broad-except
-                logger.error(f"[{worker_id}] unexpected error {err}")
-        queue.task_done()
+            await writer.status.load(connection)
+            await writer.baselines.load(connection)
+        if api_port:
+            api_runner = await start_api_server(
+                api_host, api_port, writer, HistoryQuery(pool)
+            )
+        # fetching is paused at the high-water mark, it bounds pipeline queues
+        pipelines = PipelineManager(
+            writer,
+            OffsetManager(high_water, low_water),
+            batch_size=batch_size,
+            batch_linger=batch_linger,
+        )
+        QUEUE_SIZE.set_function(lambda: pipelines.queue_size)
+        if writer.alerts is not None:
+            alerts_task = asyncio.create_task(writer.alerts.run())
+        maintenance = asyncio.create_task(
+            run_maintenance(
+                pool, retention_days=retention_days, premake_days=premake_days
+            )
+        )
+        try:
+            yield pipelines
+        finally:
+            maintenance.cancel()
+            if writer.alerts is not None:
+                alerts_task.cancel()
+            if api_port:
+                await api_runner.cleanup()
 
 
 async def _run_app(
@@ -138,46 +229,67 @@ async def _run_app(
     postgres_user: str,
     postgres_password: str,
     *,
-    deserializer: Optional[Callable] = None,
+    decoder: Callable = BatchDecoder(),
     postgres_ssl: bool = False,
+    kafka_group_id: str = DEFAULT_GROUP_ID,
+    kafka_client_id: str = DEFAULT_CLIENT_ID,
     kafka_ssl_cafile: str = None,
     kafka_ssl_certfile: str = None,
     kafka_ssl_keyfile: str = None,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: int = None,
+    api_host: str = DEFAULT_API_HOST,
+    api_port: int = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+    high_water: int = DEFAULT_HIGH_WATER,
+    low_water: int = DEFAULT_LOW_WATER,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    alert_rules: str = None,
+    alert_webhook: str = None,
+    alert_file: str = None,
 ) -> None:
-    queue: asyncio.Queue[Response] = asyncio.Queue(maxsize=512)
-    asyncio.create_task(
-        kafka_consumer(
-            kafka_servers,
-            kafka_topic,
-            queue,
-            deserializer=deserializer,
-            kafka_ssl_cafile=kafka_ssl_cafile,
-            kafka_ssl_certfile=kafka_ssl_certfile,
-            kafka_ssl_keyfile=kafka_ssl_keyfile,
-        )
-    )
-    pg_connection_params = {
-        "host": postgres_host,
-        "port": postgres_port,
-        "user": postgres_user,
-        "database": postgres_db,
-        "password": postgres_password,
-        "min_size": DEFAULT_POOL_SIZE,
-        "max_size": DEFAULT_POOL_SIZE,
-    }
-    if postgres_ssl:
-        ctx = ssl.create_default_context(cafile="")
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        pg_connection_params["ssl"] = ctx
-
-    async with asyncpg.create_pool(**pg_connection_params) as pool:
-        worker_tasks = [
-            asyncio.create_task(run_worker(index, queue, pool))
-            for index in range(DEFAULT_DB_WORKERS)
-        ]
-
-        await asyncio.gather(*worker_tasks)
+    if metrics_port:
+        metrics_server = await start_metrics_server(metrics_host, metrics_port)
+        asyncio.create_task(monitor_loop_lag())
+    try:
+        async with run_storage(
+            pg_params(
+                postgres_host,
+                postgres_port,
+                postgres_db,
+                postgres_user,
+                postgres_password,
+                postgres_ssl,
+            ),
+            api_host=api_host,
+            api_port=api_port,
+            batch_size=batch_size,
+            batch_linger=batch_linger,
+            high_water=high_water,
+            low_water=low_water,
+            retention_days=retention_days,
+            premake_days=premake_days,
+            alert_rules=alert_rules,
+            alert_webhook=alert_webhook,
+            alert_file=alert_file,
+        ) as pipelines:
+            await kafka_consumer(
+                kafka_servers,
+                kafka_topic,
+                pipelines,
+                kafka_group_id=kafka_group_id,
+                kafka_client_id=kafka_client_id,
+                decoder=decoder,
+                max_records=batch_size,
+                kafka_ssl_cafile=kafka_ssl_cafile,
+                kafka_ssl_certfile=kafka_ssl_certfile,
+                kafka_ssl_keyfile=kafka_ssl_keyfile,
+            )
+    finally:
+        if metrics_port:
+            metrics_server.close()
 
 
 def run_app(
@@ -190,13 +302,33 @@ def run_app(
     postgres_password: str,
     *,
     postgres_ssl: bool = False,
+    kafka_group_id: str = DEFAULT_GROUP_ID,
+    kafka_client_id: str = DEFAULT_CLIENT_ID,
     kafka_ssl_cafile: str = None,
     kafka_ssl_certfile: str = None,
     kafka_ssl_keyfile: str = None,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: int = None,
+    api_host: str = DEFAULT_API_HOST,
+    api_port: int = None,
+    profile: bool = False,
+    profile_dir: str = DEFAULT_PROFILE_DIR,
+    slow_callback_duration: float = DEFAULT_SLOW_CALLBACK_DURATION,
+    loop_type: str = DEFAULT_LOOP,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+    high_water: int = DEFAULT_HIGH_WATER,
+    low_water: int = DEFAULT_LOW_WATER,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    alert_rules: str = None,
+    alert_webhook: str = None,
+    alert_file: str = None,
     debug: bool = False,
 ) -> None:
     """run the consumer"""
-    loop = asyncio.get_event_loop()
+    loop = new_event_loop(loop_type)
+    asyncio.set_event_loop(loop)
     loop.set_debug(debug)
 
     logger.remove()
@@ -206,13 +338,17 @@ def run_app(
         format="<green>{time}</green> <level>{level}</level>: {message}",
         level="DEBUG" if debug else "INFO",
     )
-    deserializer = KafkaDeserializer(REQUEST_SCHEMA)
+    profiler = Profiler(profile_dir, slow_callback_duration) if profile else None
 
+    if profiler is not None:
+        profiler.start(loop)
     try:
         main_task = loop.create_task(
             _run_app(
                 kafka_servers=kafka_servers,
                 kafka_topic=kafka_topic,
+                kafka_group_id=kafka_group_id,
+                kafka_client_id=kafka_client_id,
                 kafka_ssl_cafile=kafka_ssl_cafile,
                 kafka_ssl_certfile=kafka_ssl_certfile,
                 kafka_ssl_keyfile=kafka_ssl_keyfile,
@@ -222,7 +358,19 @@ def run_app(
                 postgres_user=postgres_user,
                 postgres_password=postgres_password,
                 postgres_ssl=postgres_ssl,
-                deserializer=deserializer,
+                metrics_host=metrics_host,
+                metrics_port=metrics_port,
+                api_host=api_host,
+                api_port=api_port,
+                batch_size=batch_size,
+                batch_linger=batch_linger,
+                high_water=high_water,
+                low_water=low_water,
+                retention_days=retention_days,
+                premake_days=premake_days,
+                alert_rules=alert_rules,
+                alert_webhook=alert_webhook,
+                alert_file=alert_file,
             )
         )
         loop.run_forever()
@@ -234,3 +382,5 @@ def run_app(
         loop.run_until_complete(loop.shutdown_asyncgens())
         loop.close()
         asyncio.set_event_loop(None)
+        if profiler is not None:
+            profiler.stop()
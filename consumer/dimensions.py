@@ -0,0 +1,122 @@
+"""
+Module for mapping sites and errors to their identifiers
+
+The monitoring table keeps small integer keys of the ``sites`` and ``error_kinds``
+dimension tables instead of repeating urls and error messages. The consumer caches
+the identifiers in memory and creates missing dimension rows in bulk.
+"""
+from typing import Dict, Iterable, Optional
+
+import asyncpg
+
+DEFAULT_CACHE_SIZE = 100000
+# concurrent consumers can insert the same values, a few attempts resolve them all
+RESOLVE_ATTEMPTS = 3
+
+# rows inserted by the statement are not visible to its SELECT, they are returned by
+# the INSERT, existing rows are found by the SELECT
+RESOLVE_SITES = """
+    WITH input AS (SELECT DISTINCT unnest($1::text[]) AS url),
+    inserted AS (
+        INSERT INTO sites (url) SELECT url FROM input
+        ON CONFLICT DO NOTHING RETURNING id, url
+    )
+    SELECT id, url FROM inserted
+    UNION ALL
+    SELECT sites.id, sites.url FROM sites JOIN input ON sites.url = input.url
+"""
+
+# errors are unique by their hash, so long messages fit into the index
+RESOLVE_ERROR_KINDS = """
+    WITH input AS (SELECT DISTINCT unnest($1::text[]) AS error),
+    inserted AS (
+        INSERT INTO error_kinds (error) SELECT error FROM input
+        ON CONFLICT DO NOTHING RETURNING id, error
+    )
+    SELECT id, error FROM inserted
+    UNION ALL
+    SELECT error_kinds.id, error_kinds.error FROM error_kinds JOIN input
+        ON md5(error_kinds.error) = md5(input.error)
+        AND error_kinds.error = input.error
+"""
+
+
+class DimensionCache:
+    """
+    DimensionCache maps values of a dimension table to their identifiers
+
+    Attributes:
+       query: A query creating missing values and returning pairs of an id and a value
+       size: A maximum number of cached values, the cache is reset when it is full
+    """
+
+    def __init__(self, query: str, size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.query = query
+        self.size = size
+        self._ids: Dict[str, int] = {}
+        self._values: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, value: Optional[str]) -> Optional[int]:
+        """
+        returns the identifier of a cached value, None for None
+        """
+        if value is None:
+            return None
+        return self._ids[value]
+
+    def value(self, dimension_id: Optional[int]) -> Optional[str]:
+        """
+        returns the cached value of an identifier, None if it is not cached
+        """
+        return self._values.get(dimension_id)  # type: ignore
+
+    async def resolve(
+        self, connection: asyncpg.Connection, values: Iterable[Optional[str]]
+    ) -> Dict[str, int]:
+        """
+        returns identifiers of values, values which are not cached are loaded and
+        missing values are created
+
+        The cache can be reset by a concurrent resolve, the identifiers should be taken
+        from the result.
+        """
+        ids, values_by_id = self._ids, self._values
+        wanted = {value for value in values if value is not None}
+        resolved = {value: ids[value] for value in wanted if value in ids}
+        missing = wanted.difference(resolved)
+        if not missing:
+            return resolved
+        if len(ids) + len(missing) > self.size:
+            ids.clear()
+            values_by_id.clear()
+            # values of the batch stay cached
+            ids.update(resolved)
+            values_by_id.update((id_, value) for value, id_ in resolved.items())
+        for _ in range(RESOLVE_ATTEMPTS):
+            rows = await connection.fetch(self.query, list(missing))
+            for dimension_id, value in rows:
+                ids[value] = dimension_id
+                values_by_id[dimension_id] = value
+                resolved[value] = dimension_id
+            missing.difference_update(value for _, value in rows)
+            if not missing:
+                return resolved
+        raise LookupError(f"cannot resolve identifiers of {sorted(missing)}")
+
+
+def sites_cache(size: int = DEFAULT_CACHE_SIZE) -> DimensionCache:
+    """
+    returns a cache of site identifiers
+    """
+    return DimensionCache(RESOLVE_SITES, size)
+
+
+def error_kinds_cache(size: int = DEFAULT_CACHE_SIZE) -> DimensionCache:
+    """
+    returns a cache of error identifiers
+    """
+    return DimensionCache(RESOLVE_ERROR_KINDS, size)
+
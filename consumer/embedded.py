@@ -0,0 +1,244 @@
+"""
+Module for running the monitoring and the consumer in one process without Kafka
+
+Responses of the monitoring are sent to the pipelines of the consumer through an
+in-memory channel. The channel plays the role of Kafka for both sides: it is a writer
+of the monitoring and a source of messages of the consumer, messages are batched by the
+same pipelines and the flow is controlled by the same high-water and low-water marks,
+the monitoring waits while the channel is paused.
+"""
+import asyncio
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from loguru import logger
+
+from consumer.api import DEFAULT_API_HOST
+from consumer.consumer import _cancel_tasks, run_storage
+from consumer.offsets import DEFAULT_HIGH_WATER, DEFAULT_LOW_WATER
+from consumer.partitions import DEFAULT_RETENTION_DAYS, DEFAULT_PREMAKE_DAYS
+from consumer.pipeline import PipelineManager
+from consumer.postgres import pg_params
+from consumer.serializer import BatchDecoder
+from consumer.writer import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_LINGER
+from core.loop import DEFAULT_LOOP, new_event_loop
+from core.metrics import (
+    DEFAULT_METRICS_HOST,
+    monitor_loop_lag,
+    start_metrics_server,
+)
+from core.profiling import (
+    DEFAULT_PROFILE_DIR,
+    DEFAULT_SLOW_CALLBACK_DURATION,
+    Profiler,
+)
+from core.reader import JSONFileReader
+from monitoring.processor import DEFAULT_CHECK_PERIOD, monitor_sites
+from monitoring.schema import FILE_SCHEMA
+from monitoring.writers import BaseWriter
+
+CHANNEL_PARTITION = "channel"
+
+
+@dataclass
+class ChannelWriter(BaseWriter):
+    """
+    ChannelWriter sends messages of the monitoring to pipelines of the consumer
+
+    Messages are numbered like offsets of a single partition. The writer is the
+    consumer of the offset manager: it is paused at the high-water mark, a write waits
+    until it is resumed. Nothing is committed, messages in flight are lost on exit.
+    """
+
+    pipelines: PipelineManager
+    decoder: Callable = field(default_factory=BatchDecoder)
+    partition: Hashable = CHANNEL_PARTITION
+    _offset: int = field(default=0, init=False)
+    _resumed: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+
+    def __post_init__(self):
+        self._resumed.set()
+        self.pipelines.offsets.consumer = self
+
+    async def write(self, message: bytes, *args: Any, **kwargs: Any) -> None:
+        """
+        sends a message to the pipeline
+        """
+        await self._resumed.wait()
+        offsets = self.pipelines.offsets
+        offset = self._offset
+        self._offset += 1
+        offsets.track(self.partition, offset)
+        record = self.decoder([message])[0]
+        if record is None:
+            offsets.ack(self.partition, offset)
+            return
+        self.pipelines.put_many(self.partition, [(self.partition, offset, record)])
+
+    # the interface of a Kafka consumer used by the offset manager
+
+    def assignment(self) -> List[Hashable]:
+        """
+        returns the only partition
+        """
+        return [self.partition]
+
+    def paused(self) -> List[Hashable]:
+        """
+        returns the partition if writes wait
+        """
+        return [] if self._resumed.is_set() else [self.partition]
+
+    def pause(self, *partitions: Hashable) -> None:
+        """
+        makes writes wait
+        """
+        self._resumed.clear()
+
+    def resume(self, *partitions: Hashable) -> None:
+        """
+        lets writes continue
+        """
+        self._resumed.set()
+
+    async def commit(self, offsets: Dict[Hashable, int]) -> None:
+        """
+        written messages are not kept, there is nothing to commit
+        """
+
+
+async def _run_app(
+    sources: List[Dict[str, str]],
+    pg_connection_params: Dict[str, Any],
+    *,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: Optional[int] = None,
+    api_host: str = DEFAULT_API_HOST,
+    api_port: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+    high_water: int = DEFAULT_HIGH_WATER,
+    low_water: int = DEFAULT_LOW_WATER,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    alert_rules: Optional[str] = None,
+    alert_webhook: Optional[str] = None,
+    alert_file: Optional[str] = None,
+    period: int = DEFAULT_CHECK_PERIOD,
+) -> None:
+    if metrics_port:
+        metrics_server = await start_metrics_server(metrics_host, metrics_port)
+        asyncio.create_task(monitor_loop_lag())
+    try:
+        async with run_storage(
+            pg_connection_params,
+            api_host=api_host,
+            api_port=api_port,
+            batch_size=batch_size,
+            batch_linger=batch_linger,
+            high_water=high_water,
+            low_water=low_water,
+            retention_days=retention_days,
+            premake_days=premake_days,
+            alert_rules=alert_rules,
+            alert_webhook=alert_webhook,
+            alert_file=alert_file,
+        ) as pipelines:
+            try:
+                await monitor_sites(sources, ChannelWriter(pipelines), period)
+            finally:
+                await pipelines.stop_all()
+    finally:
+        if metrics_port:
+            metrics_server.close()
+
+
+def run_app(
+    source_file: str,
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    *,
+    postgres_ssl: bool = False,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: int = None,
+    api_host: str = DEFAULT_API_HOST,
+    api_port: int = None,
+    profile: bool = False,
+    profile_dir: str = DEFAULT_PROFILE_DIR,
+    slow_callback_duration: float = DEFAULT_SLOW_CALLBACK_DURATION,
+    loop_type: str = DEFAULT_LOOP,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+    high_water: int = DEFAULT_HIGH_WATER,
+    low_water: int = DEFAULT_LOW_WATER,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    alert_rules: str = None,
+    alert_webhook: str = None,
+    alert_file: str = None,
+    debug: bool = False,
+) -> None:
+    """run the monitoring and the consumer in one process"""
+    loop = new_event_loop(loop_type)
+    asyncio.set_event_loop(loop)
+    loop.set_debug(debug)
+
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<green>{time}</green> <level>{level}</level>: {message}",
+        level="DEBUG" if debug else "INFO",
+    )
+    profiler = Profiler(profile_dir, slow_callback_duration) if profile else None
+
+    with JSONFileReader(source_file, FILE_SCHEMA) as r:
+        try:
+            sources = r.read()
+        except TypeError:
+            return
+
+    if profiler is not None:
+        profiler.start(loop)
+    main_task = loop.create_task(
+        _run_app(
+            sources,
+            pg_params(
+                postgres_host,
+                postgres_port,
+                postgres_db,
+                postgres_user,
+                postgres_password,
+                postgres_ssl,
+            ),
+            metrics_host=metrics_host,
+            metrics_port=metrics_port,
+            api_host=api_host,
+            api_port=api_port,
+            batch_size=batch_size,
+            batch_linger=batch_linger,
+            high_water=high_water,
+            low_water=low_water,
+            retention_days=retention_days,
+            premake_days=premake_days,
+            alert_rules=alert_rules,
+            alert_webhook=alert_webhook,
+            alert_file=alert_file,
+        )
+    )
+    try:
+        loop.run_until_complete(main_task)
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        _cancel_tasks({main_task}, loop)
+        _cancel_tasks(asyncio.all_tasks(loop), loop)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+        asyncio.set_event_loop(None)
+        if profiler is not None:
+            profiler.stop()
@@ -0,0 +1,116 @@
+"""
+Module for keeping recent checks of every site in memory
+
+Checks of a site are kept in a ring buffer of typed arrays, a check takes a few dozen
+bytes and adding one does not allocate objects.
+"""
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Mapping, Any, Iterable
+
+from core.utils import utc
+
+DEFAULT_HISTORY_SIZE = 100
+# error_id of a check without an error
+NO_ERROR = -1
+
+
+class SiteHistory:
+    """
+    SiteHistory is a ring buffer of recent checks of a site
+
+    Attributes:
+       size: A maximum number of checks, the oldest ones are overwritten
+    """
+
+    def __init__(self, size: int = DEFAULT_HISTORY_SIZE) -> None:
+        self.size = size
+        self.count = 0
+        self._next = 0
+        self._request_time = array("d", bytes(8 * size))
+        self._load_time = array("d", bytes(8 * size))
+        self._status_code = array("h", bytes(2 * size))
+        self._is_alive = array("b", bytes(size))
+        self._error_id = array("l", [NO_ERROR]) * size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(
+        self,
+        request_time: datetime,
+        load_time: float,
+        status_code: int,
+        is_alive: bool,
+        error_id: Optional[int],
+    ) -> None:
+        """
+        adds a check
+        """
+        index = self._next
+        self._request_time[index] = request_time.timestamp()
+        self._load_time[index] = load_time
+        self._status_code[index] = status_code
+        self._is_alive[index] = is_alive
+        self._error_id[index] = NO_ERROR if error_id is None else error_id
+        self._next = (index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def latest(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        returns recent checks, the newest first
+        """
+        limit = self.count if limit is None else min(limit, self.count)
+        checks = []
+        for offset in range(1, limit + 1):
+            index = (self._next - offset) % self.size
+            error_id = self._error_id[index]
+            checks.append(
+                {
+                    "request_time": datetime.fromtimestamp(
+                        self._request_time[index], utc
+                    ),
+                    "load_time": self._load_time[index],
+                    "status_code": self._status_code[index],
+                    "is_alive": bool(self._is_alive[index]),
+                    "error_id": None if error_id == NO_ERROR else error_id,
+                }
+            )
+        return checks
+
+
+class HistoryStore:
+    """
+    HistoryStore keeps a ring buffer of recent checks per site
+
+    Attributes:
+       size: A maximum number of checks of a site
+    """
+
+    def __init__(self, size: int = DEFAULT_HISTORY_SIZE) -> None:
+        self.size = size
+        self.sites: Dict[int, SiteHistory] = {}
+
+    def get(self, site_id: int) -> Optional[SiteHistory]:
+        """
+        returns the history of a site, None if the site has no checks
+        """
+        return self.sites.get(site_id)
+
+    def add(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        """
+        adds written rows in the order of checks
+        """
+        sites = self.sites
+        for row in sorted(rows, key=lambda row: row["request_date"]):
+            history = sites.get(row["site_id"])
+            if history is None:
+                history = sites[row["site_id"]] = SiteHistory(self.size)
+            history.append(
+                row["request_date"],
+                float(row["load_time"]),
+                row["status_code"],
+                row["is_alive"],
+                row["error_id"],
+            )
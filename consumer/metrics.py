@@ -0,0 +1,51 @@
+"""
+This module represents metrics of the consumer service
+"""
+from core.metrics import Counter, Gauge, Histogram
+
+MESSAGES_CONSUMED = Counter(
+    "consumer_messages_consumed_total", "Number of messages read from Kafka"
+)
+MESSAGES_INVALID = Counter(
+    "consumer_messages_invalid_total", "Number of messages failed the validation"
+)
+KAFKA_CONSUME_LATENCY = Histogram(
+    "consumer_kafka_consume_latency_seconds",
+    "Delay between producing a message and reading it from Kafka",
+)
+KAFKA_LAG = Gauge(
+    "consumer_kafka_lag", "Number of messages behind the partition end", ("partition",)
+)
+QUEUE_SIZE = Gauge(
+    "consumer_queue_size", "Number of messages waiting to be written to the database"
+)
+DB_INSERT_DURATION = Histogram(
+    "consumer_db_insert_duration_seconds", "Duration of a database insert"
+)
+DB_BATCH_SIZE = Histogram(
+    "consumer_db_batch_size",
+    "Number of rows written by a database insert",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+DB_ERRORS = Counter(
+    "consumer_db_errors_total", "Number of failed database inserts", ("error",)
+)
+OFFSET_COMMITS = Counter(
+    "consumer_offset_commits_total", "Number of Kafka offset commits"
+)
+FETCH_PAUSED = Gauge(
+    "consumer_fetch_paused", "1 if fetching is paused because of the backpressure"
+)
+DB_DUPLICATES = Counter(
+    "consumer_db_duplicates_total", "Number of skipped duplicate check results"
+)
+ALERTS_SENT = Counter(
+    "consumer_alerts_sent_total", "Number of alerts sent to notifiers", ("status",)
+)
+ANOMALIES = Counter(
+    "consumer_anomalies_total", "Number of checks deviating from the site baseline"
+)
+RECORDS_EXPIRED = Counter(
+    "consumer_records_expired_total",
+    "Number of skipped check results older than the retention period",
+)
@@ -1,30 +1,246 @@
 """
 Create a monitoring table
+
+The table is partitioned by ``request_date``, one partition per day, and refers to
+urls and errors by identifiers of the ``sites`` and ``error_kinds`` tables. A table
+created by older versions is migrated: it is renamed to ``monitoring_legacy``, its rows
+within the retention period are copied to the new table and the legacy table is kept
+until it is dropped manually.
 """
 import asyncio
+import ssl
+from datetime import timedelta
 
 import asyncpg
 from loguru import logger
 
+from consumer.partitions import (
+    DEFAULT_RETENTION_DAYS,
+    DEFAULT_PREMAKE_DAYS,
+    MONITORING_TABLE,
+    create_partitions,
+    maintain_partitions,
+    today,
+)
+from consumer.rollups import ROLLUP_TABLES, SKETCH_BOUNDS
+
+LEGACY_TABLE = "monitoring_legacy"
+
+CREATE_SITES_TABLE = """
+    CREATE TABLE IF NOT EXISTS sites(
+        id SERIAL PRIMARY KEY,
+        url VARCHAR(1500) NOT NULL UNIQUE
+    );
+    """
+
+# error messages can be long, they are unique by their hash
+CREATE_ERROR_KINDS_TABLE = """
+    CREATE TABLE IF NOT EXISTS error_kinds(
+        id SERIAL PRIMARY KEY,
+        error TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_error_kinds_error on error_kinds (md5(error));
+    """
+
+# the primary key and unique indexes of a partitioned table include the partition key
 CREATE_MONITORING_TABLE = """
     CREATE TABLE IF NOT EXISTS monitoring(
-        id SERIAL PRIMARY KEY,
-        url VARCHAR(1500) NOT NULL,
+        id BIGSERIAL,
+        site_id integer NOT NULL REFERENCES sites,
         load_time  numeric(10,2) NOT NULL,
         status_code smallint NOT NULL,
         is_alive boolean NOT NULL,
-        error TEXT NULL,
-        request_date TIMESTAMPTZ
-    );
+        error_id integer NULL REFERENCES error_kinds,
+        request_date TIMESTAMPTZ NOT NULL,
+        check_id UUID,
+        anomaly_score real NULL,
+        PRIMARY KEY (id, request_date)
+    ) PARTITION BY RANGE (request_date);
     """
 
+# tables created by older versions do not have the score of checks
+ADD_ANOMALY_SCORE_COLUMN = """
+    ALTER TABLE monitoring ADD COLUMN IF NOT EXISTS anomaly_score real NULL;
+"""
+
 CREATE_SIMPLE_INDEX = """
-    CREATE INDEX idx_monitoring_name on monitoring (url, request_date);
+    CREATE INDEX IF NOT EXISTS idx_monitoring_site on monitoring (site_id, request_date);
+"""
+
+# rows are appended in time order, a BRIN index of time ranges stays tiny
+CREATE_REQUEST_DATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_monitoring_request_date
+        on monitoring USING BRIN (request_date);
 """
 
+# the arbiter of ON CONFLICT DO NOTHING, a check result is written once
+CREATE_CHECK_ID_INDEX = """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_monitoring_check_id
+        on monitoring (check_id, request_date);
+"""
+
+# sketches are histograms with the same buckets, they are merged by adding counters
+CREATE_SKETCH_FUNCTIONS = f"""
+    CREATE OR REPLACE FUNCTION sketch_merge(a integer[], b integer[])
+    RETURNS integer[] LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT array_agg(coalesce(x, 0) + coalesce(y, 0) ORDER BY i)
+        FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i)
+    $$;
+    CREATE OR REPLACE FUNCTION sketch_quantile(sketch integer[], q double precision)
+    RETURNS double precision LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT bounds[i] FROM (
+            SELECT i, sum(c) OVER (ORDER BY i) AS seen, sum(c) OVER () AS total
+            FROM unnest(sketch) WITH ORDINALITY AS t(c, i)
+        ) s, (SELECT '{{{", ".join(map(str, SKETCH_BOUNDS))}}}'::double precision[]
+            AS bounds) b
+        WHERE total > 0 AND seen >= q * total ORDER BY i LIMIT 1
+    $$;
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'sketch_sum') THEN
+            CREATE AGGREGATE sketch_sum(integer[])
+                (SFUNC = sketch_merge, STYPE = integer[], PARALLEL = SAFE);
+        END IF;
+    END $$;
+"""
+
+CREATE_ROLLUP_TABLE = """
+    CREATE TABLE IF NOT EXISTS {table}(
+        site_id integer NOT NULL REFERENCES sites,
+        bucket TIMESTAMPTZ NOT NULL,
+        checks integer NOT NULL,
+        failures integer NOT NULL,
+        min_load_time double precision NOT NULL,
+        max_load_time double precision NOT NULL,
+        sum_load_time double precision NOT NULL,
+        sketch integer[] NOT NULL,
+        PRIMARY KEY (site_id, bucket)
+    );
+    """
+
+CREATE_SITE_STATUS_TABLE = """
+    CREATE TABLE IF NOT EXISTS site_status(
+        site_id integer PRIMARY KEY REFERENCES sites,
+        last_check TIMESTAMPTZ NOT NULL,
+        is_alive boolean NOT NULL,
+        status_code smallint NOT NULL,
+        load_time numeric(10,2) NOT NULL,
+        error_id integer NULL REFERENCES error_kinds,
+        last_change TIMESTAMPTZ NOT NULL,
+        consecutive_failures integer NOT NULL
+    );
+    """
+
+CREATE_SITE_BASELINES_TABLE = """
+    CREATE TABLE IF NOT EXISTS site_baselines(
+        site_id integer PRIMARY KEY REFERENCES sites,
+        mean double precision NOT NULL,
+        variance double precision NOT NULL,
+        checks bigint NOT NULL,
+        updated TIMESTAMPTZ NOT NULL
+    );
+    """
+
+# an ordinary table (relkind "r") or a partitioned one ("p") with urls is a legacy one
+SELECT_LEGACY_TABLE = """
+    SELECT relkind = 'r' OR EXISTS(
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = pg_class.oid AND attname = 'url' AND NOT attisdropped
+    )
+    FROM pg_class
+    WHERE relname = 'monitoring' AND relnamespace = 'public'::regnamespace
+"""
+
+RENAME_LEGACY_TABLE = f"""
+    ALTER TABLE monitoring RENAME TO {LEGACY_TABLE};
+    ALTER INDEX IF EXISTS idx_monitoring_name RENAME TO idx_{LEGACY_TABLE}_name;
+    ALTER INDEX IF EXISTS idx_monitoring_check_id RENAME TO idx_{LEGACY_TABLE}_check_id;
+    ALTER INDEX IF EXISTS idx_monitoring_request_date
+        RENAME TO idx_{LEGACY_TABLE}_request_date;
+    ALTER TABLE {LEGACY_TABLE} RENAME CONSTRAINT monitoring_pkey TO {LEGACY_TABLE}_pkey;
+    ALTER TABLE {LEGACY_TABLE} ADD COLUMN IF NOT EXISTS check_id UUID;
+"""
+
+SELECT_LEGACY_RANGE = f"""
+    SELECT min(request_date)::date, max(request_date)::date FROM {LEGACY_TABLE}
+    WHERE request_date >= $1
+"""
+
+COPY_LEGACY_SITES = f"""
+    INSERT INTO sites (url)
+    SELECT DISTINCT url FROM {LEGACY_TABLE} WHERE request_date >= $1
+    ON CONFLICT DO NOTHING
+"""
+
+COPY_LEGACY_ERROR_KINDS = f"""
+    INSERT INTO error_kinds (error)
+    SELECT DISTINCT error FROM {LEGACY_TABLE}
+    WHERE request_date >= $1 AND error IS NOT NULL
+    ON CONFLICT DO NOTHING
+"""
+
+COPY_LEGACY_ROWS = f"""
+    INSERT INTO monitoring
+        (id, site_id, load_time, status_code, is_alive, error_id, request_date, check_id)
+    SELECT legacy.id, sites.id, load_time, status_code, is_alive, error_kinds.id,
+        request_date, check_id
+    FROM {LEGACY_TABLE} legacy
+        JOIN sites ON sites.url = legacy.url
+        LEFT JOIN error_kinds ON md5(error_kinds.error) = md5(legacy.error)
+            AND error_kinds.error = legacy.error
+    WHERE request_date >= $1
+"""
+
+# partitions of a legacy partitioned table free names of new partitions
+SELECT_LEGACY_PARTITIONS = f"""
+    SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = '{LEGACY_TABLE}'::regclass
+"""
+
+RESET_ID_SEQUENCE = f"""
+    SELECT setval(pg_get_serial_sequence('monitoring', 'id'), max(id))
+    FROM {LEGACY_TABLE} HAVING max(id) IS NOT NULL
+"""
+
+
+async def migrate_legacy_table(
+    connection: asyncpg.Connection, retention_days: int = DEFAULT_RETENTION_DAYS
+) -> None:
+    """
+    moves the rows of a legacy monitoring table to the current one
+    """
+    since = today() - timedelta(days=retention_days)
+    async with connection.transaction():
+        await connection.execute(RENAME_LEGACY_TABLE)
+        for (name,) in await connection.fetch(SELECT_LEGACY_PARTITIONS):
+            legacy_name = name.replace(MONITORING_TABLE, LEGACY_TABLE, 1)
+            await connection.execute(f"ALTER TABLE {name} RENAME TO {legacy_name}")
+        await connection.execute(CREATE_SITES_TABLE)
+        await connection.execute(CREATE_ERROR_KINDS_TABLE)
+        await connection.execute(CREATE_MONITORING_TABLE)
+        first, last = await connection.fetchrow(SELECT_LEGACY_RANGE, since)
+        if first is not None:
+            await create_partitions(connection, first, last)
+        await connection.execute(COPY_LEGACY_SITES, since)
+        await connection.execute(COPY_LEGACY_ERROR_KINDS, since)
+        status = await connection.execute(COPY_LEGACY_ROWS, since)
+        await connection.execute(RESET_ID_SEQUENCE)
+    logger.info(
+        "Legacy rows copied ({}), drop the {} table when it is not needed",
+        status,
+        LEGACY_TABLE,
+    )
+
 
 async def main(
-    host: str, port: int, database: str, user: str, password: str, ssl: bool
+    host: str,
+    port: int,
+    database: str,
+    user: str,
+    password: str,
+    postgres_ssl: bool,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
 ):
     """
     create a table
@@ -37,25 +253,63 @@ async def main(
         "password": password,
     }
 
-    if ssl:
+    if postgres_ssl:
         ctx = ssl.create_default_context(cafile="")
         ctx.check_hostname = False
         ctx.verify_mode = ssl.CERT_NONE
         pg_connection_params["ssl"] = ctx
 
     connection = await asyncpg.connect(**pg_connection_params)
-    statements = [CREATE_MONITORING_TABLE, CREATE_SIMPLE_INDEX]
 
     logger.info("Creating the product database...")
+    if await connection.fetchval(SELECT_LEGACY_TABLE):
+        logger.info("Migrating the legacy monitoring table...")
+        await migrate_legacy_table(connection, retention_days)
+    statements = [
+        CREATE_SITES_TABLE,
+        CREATE_ERROR_KINDS_TABLE,
+        CREATE_MONITORING_TABLE,
+        ADD_ANOMALY_SCORE_COLUMN,
+        CREATE_SIMPLE_INDEX,
+        CREATE_REQUEST_DATE_INDEX,
+        CREATE_CHECK_ID_INDEX,
+        CREATE_SKETCH_FUNCTIONS,
+        *(CREATE_ROLLUP_TABLE.format(table=table) for table in ROLLUP_TABLES),
+        CREATE_SITE_STATUS_TABLE,
+        CREATE_SITE_BASELINES_TABLE,
+    ]
     for statement in statements:
         status = await connection.execute(statement)
         print(status)
+    await maintain_partitions(
+        connection, retention_days=retention_days, premake_days=premake_days
+    )
     logger.info("Finished creating the product database!")
     await connection.close()
 
 
-def run(host: str, port: int, database: str, user: str, password: str, postgres_ssl: bool):
+def run(
+    host: str,
+    port: int,
+    database: str,
+    user: str,
+    password: str,
+    postgres_ssl: bool,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+):
     """
     run a migration
     """
-    asyncio.run(main(host, port, database, user, password, postgres_ssl))
+    asyncio.run(
+        main(
+            host,
+            port,
+            database,
+            user,
+            password,
+            postgres_ssl,
+            retention_days,
+            premake_days,
+        )
+    )
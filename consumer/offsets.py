@@ -0,0 +1,152 @@
+"""
+Module for the manual management of Kafka offsets
+"""
+import asyncio
+from collections import deque
+from typing import Dict, Set, Deque, Hashable, Any, Iterable, Tuple, Optional
+
+from loguru import logger
+
+from consumer.metrics import OFFSET_COMMITS, FETCH_PAUSED
+
+DEFAULT_HIGH_WATER = 4000
+DEFAULT_LOW_WATER = 2000
+
+
+class OffsetManager:
+    """
+    OffsetManager keeps offsets of messages in flight and commits processed ones
+
+    An offset is committed when the message and all the messages before it in the
+    partition are acknowledged, i.e. written to the database. Offsets are committed per
+    partition up to the highest contiguous acknowledged offset, so the delivery is
+    at least once.
+
+    The manager also controls the flow: fetching is paused on all assigned partitions
+    when the number of messages in flight reaches the high-water mark and resumed when
+    it drops to the low-water mark, so nothing is dropped and the memory is bounded.
+
+    Attributes:
+       high_water: A number of messages in flight which pauses fetching
+       low_water: A number of messages in flight which resumes fetching
+       consumer: A Kafka consumer, set when the consumer is started
+    """
+
+    def __init__(
+        self,
+        high_water: Optional[int] = DEFAULT_HIGH_WATER,
+        low_water: Optional[int] = DEFAULT_LOW_WATER,
+    ) -> None:
+        self.high_water = high_water
+        self.low_water = low_water
+        self.paused = False
+        self.consumer: Any = None
+        self._outstanding = 0
+        self._pending: Dict[Hashable, Deque[int]] = {}
+        self._acked: Dict[Hashable, Set[int]] = {}
+        self._positions: Dict[Hashable, int] = {}
+        self._committed: Dict[Hashable, int] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def outstanding(self) -> int:
+        """
+        returns the number of tracked and not acknowledged messages
+        """
+        return self._outstanding
+
+    def track(self, partition: Hashable, offset: int) -> None:
+        """
+        track adds an offset of a received message
+        """
+        pending = self._pending.get(partition)
+        if pending is None:
+            pending = self._pending[partition] = deque()
+            self._acked[partition] = set()
+        pending.append(offset)
+        self._outstanding += 1
+        if (
+            self.high_water
+            and not self.paused
+            and self._outstanding >= self.high_water
+        ):
+            self._pause()
+
+    def ack(self, partition: Hashable, offset: int) -> None:
+        """
+        ack marks an offset as processed
+        """
+        pending = self._pending.get(partition)
+        if pending is None:
+            # the partition was revoked, the message will be processed again
+            return
+        acked = self._acked[partition]
+        acked.add(offset)
+        while pending and pending[0] in acked:
+            acked.discard(pending[0])
+            self._positions[partition] = pending.popleft() + 1
+            self._outstanding -= 1
+        self._check_resume()
+
+    def ack_many(self, offsets: Iterable[Tuple[Hashable, int]]) -> None:
+        """
+        ack_many marks pairs of a partition and an offset as processed
+        """
+        for partition, offset in offsets:
+            self.ack(partition, offset)
+
+    def committable(self) -> Dict[Hashable, int]:
+        """
+        returns positions which are not committed yet
+        """
+        return {
+            partition: position
+            for partition, position in self._positions.items()
+            if self._committed.get(partition) != position
+        }
+
+    def forget(self, partition: Hashable) -> None:
+        """
+        forget removes a partition, e.g. when it is revoked
+        """
+        self._outstanding -= len(self._pending.pop(partition, ()))
+        self._acked.pop(partition, None)
+        self._positions.pop(partition, None)
+        self._committed.pop(partition, None)
+        self._check_resume()
+
+    def _check_resume(self) -> None:
+        if self.paused and self._outstanding <= (self.low_water or 0):
+            self._resume()
+
+    def _pause(self) -> None:
+        self.paused = True
+        FETCH_PAUSED.set(1)
+        if self.consumer is not None:
+            self.consumer.pause(*self.consumer.assignment())
+        logger.info("{} messages in flight, fetching is paused", self._outstanding)
+
+    def _resume(self) -> None:
+        self.paused = False
+        FETCH_PAUSED.set(0)
+        if self.consumer is not None:
+            self.consumer.resume(*self.consumer.paused())
+        logger.info("{} messages in flight, fetching is resumed", self._outstanding)
+
+    async def commit(self) -> None:
+        """
+        commits new positions
+        """
+        async with self._lock:
+            offsets = self.committable()
+            if not offsets or self.consumer is None:
+                return
+            try:
+                await self.consumer.commit(offsets)
+            except Exception as err:  # pylint: disable=broad-except
+                # the messages will be delivered again
+                logger.warning("cannot commit offsets {} - {}", offsets, err)
+                return
+            OFFSET_COMMITS.inc()
+            self._committed.update(offsets)
+            logger.debug("Offsets committed: {}", offsets)
@@ -0,0 +1,167 @@
+"""
+Module for managing daily partitions of the monitoring table
+
+The monitoring table is partitioned by ``request_date``, one partition per UTC day.
+Partitions are created ahead of time, partitions of past days are created by the writer
+when it gets their rows. Partitions older than the retention period are dropped, so
+the retention does not delete rows and does not load the vacuum.
+"""
+import asyncio
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional, Iterable
+
+import asyncpg
+from loguru import logger
+
+MONITORING_TABLE = "monitoring"
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_PREMAKE_DAYS = 7
+DEFAULT_MAINTENANCE_INTERVAL = 3600  # seconds
+# serializes maintenance of several consumers, the value is arbitrary
+MAINTENANCE_LOCK_ID = 74011
+
+PARTITION_NAME_RE = re.compile(rf"^{MONITORING_TABLE}_(\d{{8}})$")
+
+SELECT_PARTITIONS = f"""
+    SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = '{MONITORING_TABLE}'
+"""
+
+
+def partition_name(day: date) -> str:
+    """
+    returns the name of a partition of the day
+    """
+    return f"{MONITORING_TABLE}_{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[date]:
+    """
+    returns the day of a partition, None if the table is not a daily partition
+    """
+    match = PARTITION_NAME_RE.match(name)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d").date()
+
+
+def _day_start(day: date) -> str:
+    return datetime.combine(day, time(), tzinfo=timezone.utc).isoformat()
+
+
+def create_partition_sql(day: date) -> str:
+    """
+    returns a statement creating a partition of the day
+    """
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} "
+        f"PARTITION OF {MONITORING_TABLE} FOR VALUES "
+        f"FROM ('{_day_start(day)}') TO ('{_day_start(day + timedelta(days=1))}')"
+    )
+
+
+def drop_partition_sql(day: date) -> str:
+    """
+    returns a statement dropping a partition of the day
+    """
+    return f"DROP TABLE IF EXISTS {partition_name(day)}"
+
+
+def detach_partition_sql(day: date) -> str:
+    """
+    returns a statement detaching a partition of the day, its rows are kept
+    """
+    return f"ALTER TABLE {MONITORING_TABLE} DETACH PARTITION {partition_name(day)}"
+
+
+def record_day(moment: datetime) -> date:
+    """
+    returns the UTC day of a partition of a row, naive times are in UTC
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.date()
+
+
+def today() -> date:
+    """
+    returns the current UTC day
+    """
+    return datetime.now(timezone.utc).date()
+
+
+def days_between(first: date, last: date) -> List[date]:
+    """
+    returns days from the first to the last inclusive
+    """
+    return [first + timedelta(days=days) for days in range((last - first).days + 1)]
+
+
+def expired_days(
+    days: Iterable[date], current: date, retention_days: int = DEFAULT_RETENTION_DAYS
+) -> List[date]:
+    """
+    returns days which are entirely older than the retention period
+    """
+    oldest = current - timedelta(days=retention_days)
+    return sorted(day for day in days if day < oldest)
+
+
+async def create_partitions(
+    connection: asyncpg.Connection, first: date, last: date
+) -> None:
+    """
+    creates partitions of days from the first to the last
+    """
+    for day in days_between(first, last):
+        await connection.execute(create_partition_sql(day))
+
+
+async def maintain_partitions(
+    connection: asyncpg.Connection,
+    *,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    current: Optional[date] = None,
+) -> List[date]:
+    """
+    creates partitions ahead of time, drops expired partitions and returns their days
+    """
+    current = current or today()
+    async with connection.transaction():
+        await connection.execute("SELECT pg_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID)
+        await create_partitions(
+            connection, current, current + timedelta(days=premake_days)
+        )
+        names = [row[0] for row in await connection.fetch(SELECT_PARTITIONS)]
+        days = [day for day in map(partition_day, names) if day is not None]
+        expired = expired_days(days, current, retention_days)
+        for day in expired:
+            await connection.execute(drop_partition_sql(day))
+    if expired:
+        logger.info("Expired partitions dropped: {}", [str(day) for day in expired])
+    return expired
+
+
+async def run_maintenance(
+    pool: asyncpg.pool.Pool,
+    *,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    premake_days: int = DEFAULT_PREMAKE_DAYS,
+    interval: float = DEFAULT_MAINTENANCE_INTERVAL,
+) -> None:
+    """
+    runs the partition maintenance periodically
+    """
+    while True:
+        try:
+            async with pool.acquire() as connection:
+                await maintain_partitions(
+                    connection, retention_days=retention_days, premake_days=premake_days
+                )
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error("cannot maintain partitions - {}", err)
+        await asyncio.sleep(interval)
@@ -0,0 +1,143 @@
+"""
+Module for processing Kafka partitions in separate pipelines
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable
+
+from aiokafka import ConsumerRebalanceListener
+from loguru import logger
+
+from consumer.offsets import OffsetManager
+from consumer.records import Message
+from consumer.writer import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_LINGER,
+    DatabaseWriter,
+    run_writer,
+)
+
+DEFAULT_DRAIN_TIMEOUT = 30
+
+
+@dataclass
+class PartitionPipeline:
+    """
+    PartitionPipeline writes messages of a partition in order
+
+    Attributes:
+       partition: A Kafka partition
+       task: A task writing messages from the queue
+    """
+
+    partition: Hashable
+    task: asyncio.Task
+    queue: asyncio.Queue[Message]
+
+    async def stop(self, timeout: float = DEFAULT_DRAIN_TIMEOUT) -> None:
+        """
+        waits until received messages are written and stops the pipeline
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "{} messages of {} are not written, they will be delivered again",
+                self.queue.qsize(),
+                self.partition,
+            )
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+@dataclass
+class PipelineManager(ConsumerRebalanceListener):
+    """
+    PipelineManager keeps a pipeline for every assigned partition
+
+    Pipelines of revoked partitions are drained and their offsets are committed before
+    the partitions are handed over to another consumer of the group.
+    """
+
+    writer: DatabaseWriter
+    offsets: OffsetManager
+    batch_size: int = DEFAULT_BATCH_SIZE
+    batch_linger: float = DEFAULT_BATCH_LINGER
+    pipelines: Dict[Hashable, PartitionPipeline] = field(default_factory=dict)
+
+    @property
+    def queue_size(self) -> int:
+        """
+        returns the number of messages waiting in all pipelines
+        """
+        return sum(pipeline.queue.qsize() for pipeline in self.pipelines.values())
+
+    def get(self, partition: Hashable) -> PartitionPipeline:
+        """
+        returns a pipeline of the partition, a new one is started if required
+        """
+        pipeline = self.pipelines.get(partition)
+        if pipeline is None:
+            queue: asyncio.Queue[Message] = asyncio.Queue()
+            task = asyncio.create_task(
+                run_writer(
+                    partition,
+                    queue,
+                    self.writer,
+                    self.offsets,
+                    batch_size=self.batch_size,
+                    batch_linger=self.batch_linger,
+                )
+            )
+            pipeline = self.pipelines[partition] = PartitionPipeline(
+                partition, task, queue
+            )
+        return pipeline
+
+    async def put(self, message: Message) -> None:
+        """
+        sends a message to the pipeline of its partition
+        """
+        await self.get(message[0]).queue.put(message)
+
+    def put_many(self, partition: Hashable, messages: Iterable[Message]) -> None:
+        """
+        sends messages of a partition to its pipeline
+        """
+        queue = self.get(partition).queue
+        for message in messages:
+            # pipeline queues are not bounded, the flow is controlled by offsets
+            queue.put_nowait(message)
+
+    async def stop(self, partitions: Iterable[Hashable]) -> None:
+        """
+        drains pipelines of the partitions and commits their offsets
+        """
+        pipelines = [
+            self.pipelines.pop(partition)
+            for partition in partitions
+            if partition in self.pipelines
+        ]
+        await asyncio.gather(*(pipeline.stop() for pipeline in pipelines))
+        await self.offsets.commit()
+        for pipeline in pipelines:
+            self.offsets.forget(pipeline.partition)
+
+    async def stop_all(self) -> None:
+        """
+        drains all pipelines
+        """
+        await self.stop(list(self.pipelines))
+
+    async def on_partitions_revoked(self, revoked):
+        logger.info("Partitions revoked: {}", revoked)
+        await self.stop(revoked)
+
+    async def on_partitions_assigned(self, assigned):
+        logger.info("Partitions assigned: {}", assigned)
+        for partition in assigned:
+            self.get(partition)
+        if self.offsets.paused and self.offsets.consumer is not None:
+            self.offsets.consumer.pause(*assigned)
@@ -0,0 +1,33 @@
+"""
+Module for parameters of PostgreSQL connections
+
+It does not import the database driver, so commands import it before parsing options.
+"""
+import ssl
+from typing import Any, Dict
+
+
+def pg_params(
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    postgres_ssl: bool = False,
+) -> Dict[str, Any]:
+    """
+    returns parameters of PostgreSQL connections
+    """
+    pg_connection_params: Dict[str, Any] = {
+        "host": postgres_host,
+        "port": postgres_port,
+        "user": postgres_user,
+        "database": postgres_db,
+        "password": postgres_password,
+    }
+    if postgres_ssl:
+        ctx = ssl.create_default_context(cafile="")
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        pg_connection_params["ssl"] = ctx
+    return pg_connection_params
@@ -0,0 +1,320 @@
+"""
+Module for querying the history of a site in time buckets
+
+A query returns the availability and latency percentiles of a site per bucket. Short
+ranges are aggregated from raw rows with exact percentiles, long ranges are aggregated
+from the coarsest rollups matching the bucket width with sketch percentiles, the
+bucket width of a long range is rounded to a multiple of the finest rollup. Columns
+are fetched as arrays and aggregated with NumPy, recent results are cached.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+import numpy as np
+from loguru import logger
+
+from consumer.rollups import ROLLUP_SECONDS, SKETCH_BOUNDS
+from core.cache import LRUCache
+from core.utils import JSONEncoder, utc
+
+DEFAULT_BUCKET = 3600  # seconds
+DEFAULT_RANGE = timedelta(days=1)
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 30  # seconds
+# longer ranges are read from rollups
+RAW_RANGE_LIMIT = 6 * 3600  # seconds
+
+SELECT_SITE_ID = "SELECT id FROM sites WHERE url = $1"
+
+SELECT_RAW = """
+    SELECT array_agg(extract(epoch FROM request_date)::float8),
+        array_agg(load_time::float8), array_agg(is_alive)
+    FROM monitoring
+    WHERE site_id = $1 AND request_date >= $2 AND request_date < $3
+"""
+
+SELECT_ROLLUPS = """
+    SELECT array_agg(extract(epoch FROM bucket)::float8), array_agg(checks),
+        array_agg(failures), array_agg(sum_load_time), array_agg(sketch)
+    FROM {table}
+    WHERE site_id = $1 AND bucket >= $2 AND bucket < $3
+"""
+
+_BOUNDS = np.array(SKETCH_BOUNDS)
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    returns an aware time, a naive time is considered UTC
+    """
+    return value if value.tzinfo else value.replace(tzinfo=utc)
+
+
+def snap_bucket(range_seconds: float, bucket: int) -> int:
+    """
+    returns the bucket of a long range rounded to the nearest multiple of the finest
+    rollup, so the range is read from rollups
+    """
+    if range_seconds <= RAW_RANGE_LIMIT:
+        return bucket
+    finest = min(ROLLUP_SECONDS.values())
+    return max(round(bucket / finest), 1) * finest
+
+
+def choose_source(range_seconds: float, bucket: int) -> Optional[str]:
+    """
+    returns the coarsest rollup table for buckets, None if raw rows should be read
+
+    A ValueError is raised if buckets of a long range cannot be read from rollups.
+    """
+    if range_seconds <= RAW_RANGE_LIMIT:
+        return None
+    for table, seconds in sorted(
+        ROLLUP_SECONDS.items(), key=lambda item: item[1], reverse=True
+    ):
+        if bucket % seconds == 0:
+            return table
+    raise ValueError(
+        f"a bucket of a range longer than {RAW_RANGE_LIMIT}s should be a multiple "
+        f"of {min(ROLLUP_SECONDS.values())}s"
+    )
+
+
+def align(start: datetime, end: datetime, bucket: int) -> Tuple[datetime, datetime]:
+    """
+    extends a range to bucket boundaries, buckets are aligned to the epoch
+    """
+    first = start.timestamp() // bucket * bucket
+    last = -(-end.timestamp() // bucket) * bucket
+    return datetime.fromtimestamp(first, utc), datetime.fromtimestamp(last, utc)
+
+
+def _result(
+    start: float,
+    bucket: int,
+    keys: np.ndarray,
+    checks: np.ndarray,
+    failures: np.ndarray,
+    sums: np.ndarray,
+    percentiles: Dict[str, np.ndarray],
+) -> List[Dict[str, Any]]:
+    result = []
+    columns = {name: values.tolist() for name, values in percentiles.items()}
+    for index, (key, count, failed, total) in enumerate(
+        zip(keys.tolist(), checks.tolist(), failures.tolist(), sums.tolist())
+    ):
+        succeeded = count - failed
+        item = {
+            "bucket": datetime.fromtimestamp(start + key * bucket, utc),
+            "checks": int(count),
+            "failures": int(failed),
+            "availability": 1 - failed / count,
+            # load times of failed checks are not measured
+            "avg_load_time": total / succeeded if succeeded else None,
+        }
+        for name, values in columns.items():
+            item[name] = values[index] if succeeded else None
+        result.append(item)
+    return result
+
+
+def _name(quantile: float) -> str:
+    return f"p{quantile * 100:g}"
+
+
+def aggregate_raw(
+    times: np.ndarray,
+    load_times: np.ndarray,
+    is_alive: np.ndarray,
+    start: float,
+    bucket: int,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+) -> List[Dict[str, Any]]:
+    """
+    aggregates raw checks by buckets, percentiles of successful checks are exact
+    """
+    if not len(times):
+        return []
+    buckets = ((times - start) // bucket).astype(np.int64)
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    size = len(keys)
+    checks = np.bincount(inverse, minlength=size)
+    failures = np.bincount(inverse, weights=~is_alive, minlength=size)
+    # sorted by buckets and load times, every bucket is a sorted slice
+    slots, load_times = inverse[is_alive], load_times[is_alive]
+    order = np.lexsort((load_times, slots))
+    slots, load_times = slots[order], load_times[order]
+    counts = np.bincount(slots, minlength=size)
+    first = np.cumsum(counts) - counts
+    sums = np.bincount(slots, weights=load_times, minlength=size)
+    # buckets without successful checks point to any value, it is not reported
+    last = max(len(load_times) - 1, 0)
+    padded = load_times if len(load_times) else np.zeros(1)
+    percentiles = {
+        # the nearest rank
+        _name(quantile): padded[
+            np.minimum(
+                first + np.maximum(np.ceil(quantile * counts).astype(np.int64) - 1, 0),
+                last,
+            )
+        ]
+        for quantile in quantiles
+    }
+    return _result(start, bucket, keys, checks, failures, sums, percentiles)
+
+
+def aggregate_rollups(
+    times: np.ndarray,
+    checks: np.ndarray,
+    failures: np.ndarray,
+    sums: np.ndarray,
+    sketches: np.ndarray,
+    start: float,
+    bucket: int,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+) -> List[Dict[str, Any]]:
+    """
+    merges rollups by buckets, percentiles are upper bounds of sketch buckets
+    """
+    if not len(times):
+        return []
+    buckets = ((times - start) // bucket).astype(np.int64)
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    size = len(keys)
+    merged = np.zeros((size, sketches.shape[1]), dtype=np.int64)
+    np.add.at(merged, inverse, sketches)
+    cumulative = np.cumsum(merged, axis=1)
+    totals = cumulative[:, -1:]
+    percentiles = {
+        _name(quantile): _BOUNDS[np.argmax(cumulative >= quantile * totals, axis=1)]
+        for quantile in quantiles
+    }
+    return _result(
+        start,
+        bucket,
+        keys,
+        np.bincount(inverse, weights=checks, minlength=size),
+        np.bincount(inverse, weights=failures, minlength=size),
+        np.bincount(inverse, weights=sums, minlength=size),
+        percentiles,
+    )
+
+
+class HistoryQuery:
+    """
+    HistoryQuery returns the history of a site in time buckets
+
+    Attributes:
+       pool: A connection pool
+       cache: Recent results
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool, cache: Optional[LRUCache] = None):
+        self.pool = pool
+        if cache is None:
+            cache = LRUCache(DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL)
+        self.cache = cache
+
+    async def run(
+        self,
+        url: str,
+        start: datetime,
+        end: datetime,
+        bucket: int = DEFAULT_BUCKET,
+        quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        returns buckets of the range, None if the site is unknown
+
+        Buckets of a long range are rounded to a multiple of the finest rollup.
+        """
+        aligned = align(start, end, bucket)
+        snapped = snap_bucket((aligned[1] - aligned[0]).total_seconds(), bucket)
+        if snapped != bucket:
+            # buckets of rollups are aligned to their width
+            bucket, aligned = snapped, align(start, end, snapped)
+        start, end = aligned
+        key = (url, start, end, bucket, tuple(quantiles))
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        table = choose_source((end - start).total_seconds(), bucket)
+        async with self.pool.acquire() as connection:
+            site_id = await connection.fetchval(SELECT_SITE_ID, url)
+            if site_id is None:
+                return None
+            if table is None:
+                row = await connection.fetchrow(SELECT_RAW, site_id, start, end)
+            else:
+                row = await connection.fetchrow(
+                    SELECT_ROLLUPS.format(table=table), site_id, start, end
+                )
+        if row[0] is None:
+            result = []
+        elif table is None:
+            result = aggregate_raw(
+                np.array(row[0]),
+                np.array(row[1]),
+                np.array(row[2], dtype=bool),
+                start.timestamp(),
+                bucket,
+                quantiles,
+            )
+        else:
+            result = aggregate_rollups(
+                np.array(row[0]),
+                np.array(row[1]),
+                np.array(row[2]),
+                np.array(row[3]),
+                np.array(row[4], dtype=np.int64),
+                start.timestamp(),
+                bucket,
+                quantiles,
+            )
+        logger.debug(
+            "History of {} from {}: {} buckets", url, table or "monitoring", len(result)
+        )
+        self.cache.set(key, result)
+        return result
+
+
+async def main(
+    url: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    bucket: int,
+    pg_connection_params: Dict[str, Any],
+) -> None:
+    """
+    prints the history of a site, a bucket per line
+    """
+    end = as_utc(end) if end else datetime.now(utc)
+    start = as_utc(start) if start else end - DEFAULT_RANGE
+    async with asyncpg.create_pool(min_size=1, max_size=1, **pg_connection_params) as pool:
+        try:
+            result = await HistoryQuery(pool).run(url, start, end, bucket)
+        except ValueError as err:
+            logger.error("Invalid query - {}", err)
+            return
+    if result is None:
+        logger.error("Unknown site {}", url)
+        return
+    for item in result:
+        print(json.dumps(item, cls=JSONEncoder))
+
+
+def run(
+    url: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    bucket: int,
+    pg_connection_params: Dict[str, Any],
+) -> None:
+    """
+    run a history query
+    """
+    asyncio.run(main(url, start, end, bucket, pg_connection_params))
@@ -0,0 +1,37 @@
+"""
+Module for records of check results, rows of the monitoring table
+"""
+from datetime import datetime
+from typing import Hashable, Optional, Tuple
+
+from core.models import Response
+
+Record = Tuple[str, float, int, bool, Optional[str], datetime, str]
+# a record with identifiers of the url and the error
+Row = Tuple[int, float, int, bool, Optional[int], datetime, str]
+# a row with the anomaly score of the check
+ScoredRow = Tuple[int, float, int, bool, Optional[int], datetime, str, Optional[float]]
+# positions of fields in a record
+URL = 0
+LOAD_TIME = 1
+IS_ALIVE = 3
+ERROR = 4
+REQUEST_TIME = 5
+CHECK_ID = 6
+# a partition, an offset and a record of a Kafka message
+Message = Tuple[Hashable, int, Record]
+
+
+def to_record(response: Response) -> Record:
+    """
+    to_record converts a response to a row of the monitoring table
+    """
+    return (
+        response.url,
+        response.load_time,
+        response.status_code,
+        response.ok,
+        response.error,
+        response.request_time,
+        response.check_id,
+    )
@@ -0,0 +1,325 @@
+"""
+Module for replaying check results through the consumer write path
+
+Messages are read from JSON lines files, a message per line as it is sent to Kafka, or
+from an offset range of Kafka partitions. They are decoded, deduplicated and written by
+the same decoder and writer as the consumer, so rollups, statuses and baselines are
+updated and messages which are already written are skipped. Batches are written by
+several workers as soon as they are read, without the linger of the live consumer,
+and the replay can be limited to a rate. Workers share the writer, so partitions of
+past days are created once and statuses and baselines are updated by every batch in
+turn. Checks older than the retention period are skipped.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+import asyncpg
+from aiokafka import AIOKafkaConsumer, TopicPartition
+from aiokafka.helpers import create_ssl_context
+from loguru import logger
+
+from consumer.partitions import DEFAULT_RETENTION_DAYS
+from consumer.records import Record
+from consumer.serializer import BatchDecoder
+from consumer.writer import DEFAULT_BATCH_SIZE, DatabaseWriter
+
+DEFAULT_WORKERS = 3
+DEFAULT_PROGRESS_INTERVAL = 5  # seconds
+DEFAULT_FETCH_TIMEOUT = 1000  # milliseconds
+
+
+async def read_files(
+    file_names: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE
+) -> AsyncIterator[List[bytes]]:
+    """
+    yields batches of lines of JSON lines files, empty lines are skipped
+    """
+    for file_name in file_names:
+        batch: List[bytes] = []
+        with open(file_name, "rb") as file_obj:
+            for line in file_obj:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(line)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+                    # other tasks run between batches
+                    await asyncio.sleep(0)
+        if batch:
+            yield batch
+
+
+async def read_kafka(
+    kafka_servers: str,
+    kafka_topic: str,
+    partitions: Sequence[int] = (),
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    kafka_ssl_cafile: str = None,
+    kafka_ssl_certfile: str = None,
+    kafka_ssl_keyfile: str = None,
+) -> AsyncIterator[List[bytes]]:
+    """
+    yields batches of message values of an offset range of partitions
+
+    The range starts at the beginning of partitions and ends at their end when the
+    replay starts by default, offsets are not committed.
+    """
+    kafka_kwargs: Dict[str, Any] = {
+        "bootstrap_servers": kafka_servers,
+        "enable_auto_commit": False,
+        # an offset removed by the retention starts at the oldest kept message
+        "auto_offset_reset": "earliest",
+    }
+    if kafka_ssl_cafile:
+        kafka_kwargs["security_protocol"] = "SSL"
+        kafka_kwargs["ssl_context"] = create_ssl_context(
+            cafile=kafka_ssl_cafile,
+            certfile=kafka_ssl_certfile,
+            keyfile=kafka_ssl_keyfile,
+        )
+    consumer = AIOKafkaConsumer(**kafka_kwargs)
+    await consumer.start()
+    try:
+        if not partitions:
+            # fetches metadata of topics
+            await consumer.topics()
+            partitions = sorted(consumer.partitions_for_topic(kafka_topic) or ())
+        assigned = [TopicPartition(kafka_topic, partition) for partition in partitions]
+        consumer.assign(assigned)
+        ends = await consumer.end_offsets(assigned)
+        if end_offset is not None:
+            ends = {tp: min(end, end_offset) for tp, end in ends.items()}
+        if start_offset is None:
+            await consumer.seek_to_beginning(*assigned)
+        else:
+            for tp in assigned:
+                consumer.seek(tp, start_offset)
+        remaining = {tp for tp in assigned if await consumer.position(tp) < ends[tp]}
+        while remaining:
+            batches = await consumer.getmany(
+                *remaining, timeout_ms=DEFAULT_FETCH_TIMEOUT, max_records=batch_size
+            )
+            for tp, messages in batches.items():
+                values = [msg.value for msg in messages if msg.offset < ends[tp]]
+                if messages[-1].offset + 1 >= ends[tp]:
+                    remaining.discard(tp)
+                if values:
+                    yield values
+            if not batches:
+                # a reset position may be past the end of the range
+                for tp in list(remaining):
+                    if await consumer.position(tp) >= ends[tp]:
+                        remaining.discard(tp)
+    finally:
+        await consumer.stop()
+
+
+class RateLimiter:
+    """
+    RateLimiter spreads messages evenly over time
+
+    Attributes:
+       rate: A maximum number of messages per second, the rate is not limited if 0
+    """
+
+    def __init__(self, rate: float = 0) -> None:
+        self.rate = rate
+        self._next = time.monotonic()
+
+    async def wait(self, count: int) -> None:
+        """
+        waits until a number of messages can be sent
+        """
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(self._next, now)
+        self._next = start + count / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+@dataclass
+class ReplayProgress:
+    """
+    ReplayProgress counts replayed messages
+    """
+
+    read: int = 0
+    invalid: int = 0
+    written: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def rate(self) -> float:
+        """
+        returns written rows per second
+        """
+        return self.written / max(time.monotonic() - self.started, 1e-9)
+
+    def report(self) -> None:
+        """
+        logs the progress
+        """
+        logger.info(
+            "{} messages read, {} invalid, {} rows written, {:.0f} rows/sec",
+            self.read,
+            self.invalid,
+            self.written,
+            self.rate,
+        )
+
+
+async def _report(progress: ReplayProgress, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        progress.report()
+
+
+async def _write(
+    queue: "asyncio.Queue[Optional[List[Record]]]",
+    writer: DatabaseWriter,
+    progress: ReplayProgress,
+) -> None:
+    while True:
+        records = await queue.get()
+        if records is None:
+            return
+        progress.written += await writer.write(records)
+
+
+async def _put(queue: asyncio.Queue, item: Any, tasks: List[asyncio.Future]) -> None:
+    # waits for free space in the queue unless a worker fails
+    put = asyncio.ensure_future(queue.put(item))
+    done, _ = await asyncio.wait([put, *tasks], return_when=asyncio.FIRST_COMPLETED)
+    if put not in done:
+        put.cancel()
+        for task in done:
+            task.result()
+
+
+async def _stop(queue: asyncio.Queue, workers: int) -> None:
+    for _ in range(workers):
+        await queue.put(None)
+
+
+async def replay(
+    batches: AsyncIterator[List[bytes]],
+    writer: DatabaseWriter,
+    *,
+    decoder: Callable = BatchDecoder(),
+    workers: int = DEFAULT_WORKERS,
+    rate: float = 0,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+) -> ReplayProgress:
+    """
+    decodes and writes batches of messages by several workers
+
+    An error of a worker stops the replay, messages are written again by the next
+    replay without duplicates.
+    """
+    progress = ReplayProgress()
+    limiter = RateLimiter(rate)
+    # a worker has a batch in progress and another one waiting
+    queue: "asyncio.Queue[Optional[List[Record]]]" = asyncio.Queue(workers)
+    tasks = [
+        asyncio.ensure_future(_write(queue, writer, progress)) for _ in range(workers)
+    ]
+    reporter = asyncio.ensure_future(_report(progress, progress_interval))
+    stop: Optional[asyncio.Future] = None
+    try:
+        async for values in batches:
+            await limiter.wait(len(values))
+            records = [record for record in decoder(values) if record is not None]
+            progress.read += len(values)
+            progress.invalid += len(values) - len(records)
+            if records:
+                await _put(queue, records, tasks)
+        stop = asyncio.ensure_future(_stop(queue, workers))
+        await asyncio.gather(*tasks)
+    finally:
+        reporter.cancel()
+        for task in tasks:
+            task.cancel()
+        if stop is not None:
+            stop.cancel()
+    progress.report()
+    return progress
+
+
+async def main(
+    source: Callable[[], AsyncIterator[List[bytes]]],
+    pg_connection_params: Dict[str, Any],
+    *,
+    workers: int = DEFAULT_WORKERS,
+    rate: float = 0,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+) -> None:
+    """
+    replays messages of the source
+    """
+    async with asyncpg.create_pool(
+        min_size=workers,
+        max_size=workers,
+        init=DatabaseWriter.init_connection,
+        **pg_connection_params,
+    ) as pool:
+        writer = DatabaseWriter(pool, retention_days=retention_days)
+        async with pool.acquire() as connection:
+            await writer.status.load(connection)
+            await writer.baselines.load(connection)
+        await replay(source(), writer, workers=workers, rate=rate)
+
+
+def run(
+    file_names: Sequence[str],
+    pg_connection_params: Dict[str, Any],
+    *,
+    kafka_servers: str = None,
+    kafka_topic: str = None,
+    kafka_partitions: Sequence[int] = (),
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    kafka_ssl_cafile: str = None,
+    kafka_ssl_certfile: str = None,
+    kafka_ssl_keyfile: str = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    rate: float = 0,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+) -> None:
+    """
+    run a replay of files or of a Kafka offset range
+    """
+
+    def source() -> AsyncIterator[List[bytes]]:
+        if file_names:
+            return read_files(file_names, batch_size)
+        return read_kafka(
+            kafka_servers,
+            kafka_topic,
+            kafka_partitions,
+            start_offset,
+            end_offset,
+            batch_size=batch_size,
+            kafka_ssl_cafile=kafka_ssl_cafile,
+            kafka_ssl_certfile=kafka_ssl_certfile,
+            kafka_ssl_keyfile=kafka_ssl_keyfile,
+        )
+
+    asyncio.run(
+        main(
+            source,
+            pg_connection_params,
+            workers=workers,
+            rate=rate,
+            retention_days=retention_days,
+        )
+    )
@@ -0,0 +1,163 @@
+"""
+Module for maintaining per-site rollups of monitoring data
+
+Rollups keep the number of checks and failures, min, max and the sum of load times and
+a latency sketch per site and a minute, an hour or a day. Load times are aggregated of
+successful checks only. The sketch is a histogram of load times with logarithmic
+buckets, sketches are merged by adding their counters, so percentiles of any period
+are computed from a few rollup rows.
+"""
+import math
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Tuple, Iterable, Callable, Mapping, Any
+
+import asyncpg
+
+# bucket upper bounds grow by 20% from 1ms, the last bucket is unbounded
+SKETCH_MIN = 0.001
+SKETCH_GROWTH = 1.2
+SKETCH_BUCKETS = 60
+SKETCH_BOUNDS = tuple(
+    round(SKETCH_MIN * SKETCH_GROWTH ** index, 6) for index in range(SKETCH_BUCKETS - 1)
+) + (math.inf,)
+
+
+def _truncate_minute(value: datetime) -> datetime:
+    return value.replace(second=0, microsecond=0)
+
+
+def _truncate_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _truncate_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# tables of rollups and functions truncating a time to their buckets
+ROLLUP_TABLES: Dict[str, Callable[[datetime], datetime]] = {
+    "rollup_minute": _truncate_minute,
+    "rollup_hour": _truncate_hour,
+    "rollup_day": _truncate_day,
+}
+
+# bucket widths of rollups in seconds
+ROLLUP_SECONDS: Dict[str, int] = {
+    "rollup_minute": 60,
+    "rollup_hour": 3600,
+    "rollup_day": 86400,
+}
+
+UPSERT_ROLLUP = """
+    INSERT INTO {table} AS rollup (
+        site_id, bucket, checks, failures,
+        min_load_time, max_load_time, sum_load_time, sketch
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    ON CONFLICT (site_id, bucket) DO UPDATE SET
+        checks = rollup.checks + excluded.checks,
+        failures = rollup.failures + excluded.failures,
+        min_load_time = least(rollup.min_load_time, excluded.min_load_time),
+        max_load_time = greatest(rollup.max_load_time, excluded.max_load_time),
+        sum_load_time = rollup.sum_load_time + excluded.sum_load_time,
+        sketch = sketch_merge(rollup.sketch, excluded.sketch)
+"""
+
+
+def sketch_index(load_time: float) -> int:
+    """
+    returns the sketch bucket of a load time
+    """
+    return bisect_left(SKETCH_BOUNDS, load_time)
+
+
+def sketch_quantile(sketch: List[int], quantile: float) -> float:
+    """
+    returns the upper bound of the bucket containing the quantile, NaN if it is empty
+    """
+    total = sum(sketch)
+    if not total:
+        return math.nan
+    seen = 0
+    for index, count in enumerate(sketch):
+        seen += count
+        if seen >= quantile * total:
+            return SKETCH_BOUNDS[index]
+    return SKETCH_BOUNDS[-1]
+
+
+@dataclass
+class Rollup:
+    """
+    Rollup aggregates checks of a site in a time bucket
+    """
+
+    checks: int = 0
+    failures: int = 0
+    min_load_time: float = math.inf
+    max_load_time: float = -math.inf
+    sum_load_time: float = 0.0
+    sketch: List[int] = field(default_factory=lambda: [0] * SKETCH_BUCKETS)
+
+    def add(self, load_time: float, is_alive: bool) -> None:
+        """
+        adds a check
+        """
+        self.checks += 1
+        if not is_alive:
+            # the latency of a failed check is not measured
+            self.failures += 1
+            return
+        if load_time < self.min_load_time:
+            self.min_load_time = load_time
+        if load_time > self.max_load_time:
+            self.max_load_time = load_time
+        self.sum_load_time += load_time
+        self.sketch[sketch_index(load_time)] += 1
+
+
+def aggregate(
+    rows: Iterable[Mapping[str, Any]], truncate: Callable[[datetime], datetime]
+) -> Dict[Tuple[int, datetime], Rollup]:
+    """
+    aggregates written rows by sites and buckets
+    """
+    rollups: Dict[Tuple[int, datetime], Rollup] = {}
+    for row in rows:
+        key = (row["site_id"], truncate(row["request_date"]))
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = Rollup()
+        rollup.add(float(row["load_time"]), row["is_alive"])
+    return rollups
+
+
+async def update_rollups(
+    connection: asyncpg.Connection, rows: List[Mapping[str, Any]]
+) -> None:
+    """
+    adds written rows to rollups of all resolutions
+    """
+    if not rows:
+        return
+    for table, truncate in ROLLUP_TABLES.items():
+        rollups = aggregate(rows, truncate)
+        # rows are locked in the same order by all consumers, so they do not deadlock
+        await connection.executemany(
+            UPSERT_ROLLUP.format(table=table),
+            [
+                (
+                    site_id,
+                    bucket,
+                    rollup.checks,
+                    rollup.failures,
+                    rollup.min_load_time,
+                    rollup.max_load_time,
+                    rollup.sum_load_time,
+                    rollup.sketch,
+                )
+                for (site_id, bucket), rollup in sorted(rollups.items())
+            ],
+        )
@@ -2,15 +2,24 @@
 Deserializer
 """
 import json
+import uuid
 from dataclasses import dataclass
+from datetime import datetime
 from json import JSONDecodeError
-from typing import Optional, Any
+from typing import Optional, Any, List, Dict
 
 import trafaret as t
 from loguru import logger
 
+from consumer.metrics import MESSAGES_INVALID
+from consumer.records import Record
 from core.models import Response
 
+# failed checks have the status code -1, status codes are smallint
+MIN_STATUS_CODE = -1
+MAX_STATUS_CODE = 999
+# load times are numeric(10,2)
+MAX_LOAD_TIME = 10 ** 8
 
 REQUEST_SCHEMA = t.Dict(
     {
@@ -19,6 +28,7 @@ REQUEST_SCHEMA = t.Dict(
         t.Key("request_time"): t.ToDateTime("%Y-%m-%dT%H:%M:%S.%f%z"),
         t.Key("status_code"): t.ToInt,
         t.Key("error"): t.String | t.Null,
+        t.Key("check_id", optional=True): t.String,
     }
 ).ignore_extra("*")
 
@@ -47,3 +57,84 @@ class KafkaDeserializer:
             logger.error("invalid document structure object, {}", err)
             return
         return Response(**data)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    parse_timestamp parses an ISO 8601 timestamp written by datetime.isoformat()
+
+    It is several times faster than strptime and accepts timestamps without
+    microseconds.
+    """
+    return datetime.fromisoformat(value)
+
+
+def document_to_record(document: Dict[str, Any]) -> Record:
+    """
+    document_to_record validates a decoded message and returns a row of the monitoring
+    table
+
+    Messages of old producers have no check identifier, it is derived from the url and
+    the request time, so duplicates of such messages are skipped as well.
+    """
+    url = document["url"]
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        raise ValueError(f"invalid url {url}")
+    error = document.get("error")
+    if error is not None and not isinstance(error, str):
+        raise ValueError(f"invalid error {error}")
+    request_time = document["request_time"]
+    check_id = document.get("check_id")
+    if check_id is None:
+        check_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{url}#{request_time}").hex
+    elif not isinstance(check_id, str) or len(check_id) not in (32, 36):
+        raise ValueError(f"invalid check_id {check_id}")
+    load_time = float(document["load_time"])
+    if not 0 <= load_time < MAX_LOAD_TIME:
+        raise ValueError(f"invalid load_time {load_time}")
+    status_code = int(document["status_code"])
+    if not MIN_STATUS_CODE <= status_code <= MAX_STATUS_CODE:
+        raise ValueError(f"invalid status_code {status_code}")
+    return (
+        url,
+        load_time,
+        status_code,
+        error is None,
+        error,
+        parse_timestamp(request_time),
+        check_id,
+    )
+
+
+class BatchDecoder:
+    """
+    Decoder of a batch of Kafka messages
+
+    Messages are decoded one by one, so a malformed message cannot be spliced with its
+    neighbours, and validated without building intermediate objects. Rows of invalid
+    messages are None.
+    """
+
+    _decode = json.JSONDecoder().decode
+
+    def _loads(self, values: List[bytes]) -> List[Any]:
+        documents = []
+        for value in values:
+            try:
+                # skips the encoding detection of json.loads
+                documents.append(self._decode(value.decode("utf-8")))
+            except (JSONDecodeError, UnicodeDecodeError):
+                documents.append(None)
+        return documents
+
+    def __call__(self, values: List[Optional[bytes]]) -> List[Optional[Record]]:
+        records: List[Optional[Record]] = [None] * len(values)
+        indexes = [index for index, value in enumerate(values) if value]
+        documents = self._loads([values[index] for index in indexes])
+        for index, document in zip(indexes, documents):
+            try:
+                records[index] = document_to_record(document)
+            except (KeyError, TypeError, ValueError) as err:
+                logger.error("invalid document structure object, {}", err)
+        MESSAGES_INVALID.inc(records.count(None))
+        return records
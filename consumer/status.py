@@ -0,0 +1,197 @@
+"""
+Module for keeping the current status of every site
+
+The ``site_status`` table has one row per site with the last check, the time of the
+last change of the site availability and the number of consecutive failures. The
+consumer keeps the same data in memory and updates the table in batches when the
+status changes, the time of the last check is refreshed periodically.
+"""
+from dataclasses import dataclass, replace, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Mapping, Any, Iterable, Callable
+
+import asyncpg
+
+DEFAULT_STATUS_REFRESH = 60  # seconds
+
+STATUS_COLUMNS = (
+    "site_id",
+    "last_check",
+    "is_alive",
+    "status_code",
+    "load_time",
+    "error_id",
+    "last_change",
+    "consecutive_failures",
+)
+
+# concurrent consumers never replace a newer status with an older one
+UPSERT_STATUS = f"""
+    INSERT INTO site_status AS status ({", ".join(STATUS_COLUMNS)})
+    VALUES ({", ".join(f"${index}" for index in range(1, len(STATUS_COLUMNS) + 1))})
+    ON CONFLICT (site_id) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in STATUS_COLUMNS[1:])}
+    WHERE status.last_check < excluded.last_check
+"""
+
+SELECT_STATUS = f"""
+    SELECT {", ".join(f"site_status.{column}" for column in STATUS_COLUMNS)}, url
+    FROM site_status JOIN sites ON sites.id = site_status.site_id
+"""
+
+
+@dataclass
+class SiteStatus:
+    """
+    SiteStatus represents the current status of a site
+    """
+
+    site_id: int
+    url: Optional[str]
+    last_check: datetime
+    is_alive: bool
+    status_code: int
+    load_time: float
+    error_id: Optional[int]
+    last_change: datetime
+    consecutive_failures: int = 0
+
+    @property
+    def state(self) -> tuple:
+        """
+        returns fields which are written to the table as soon as they change
+        """
+        return self.is_alive, self.status_code, self.error_id, self.consecutive_failures
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        returns the status as a dictionary
+        """
+        return asdict(self)
+
+    def to_row(self) -> tuple:
+        """
+        returns the status as a row of the site_status table
+        """
+        return tuple(getattr(self, column) for column in STATUS_COLUMNS)
+
+
+class StatusCache:
+    """
+    StatusCache keeps the current status of sites in memory
+
+    Attributes:
+       refresh_interval: A period of writing the last check time of a stable site
+    """
+
+    def __init__(self, refresh_interval: float = DEFAULT_STATUS_REFRESH) -> None:
+        self.refresh_interval = refresh_interval
+        self.sites: Dict[int, SiteStatus] = {}
+        self.urls: Dict[str, int] = {}
+        # the last check time written to the table
+        self._saved: Dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    async def load(self, connection: asyncpg.Connection) -> None:
+        """
+        reads the statuses of all sites
+        """
+        for row in await connection.fetch(SELECT_STATUS):
+            status = SiteStatus(**row)
+            status.load_time = float(status.load_time)
+            self.sites[status.site_id] = status
+            self.urls[status.url] = status.site_id
+            self._saved[status.site_id] = status.last_check
+
+    def prepare(
+        self,
+        rows: Iterable[Mapping[str, Any]],
+        url_of: Callable[[int], Optional[str]] = lambda site_id: None,
+    ) -> List[SiteStatus]:
+        """
+        returns new statuses of sites after written rows, the cache is not changed
+        """
+        changed: Dict[int, SiteStatus] = {}
+        for row in sorted(rows, key=lambda row: row["request_date"]):
+            site_id = row["site_id"]
+            current = changed.get(site_id) or self.sites.get(site_id)
+            request_date = row["request_date"]
+            if current is not None and request_date <= current.last_check:
+                continue
+            is_alive = row["is_alive"]
+            if current is None:
+                status = SiteStatus(
+                    site_id=site_id,
+                    url=url_of(site_id),
+                    last_check=request_date,
+                    is_alive=is_alive,
+                    status_code=row["status_code"],
+                    load_time=float(row["load_time"]),
+                    error_id=row["error_id"],
+                    last_change=request_date,
+                    consecutive_failures=0 if is_alive else 1,
+                )
+            else:
+                status = replace(
+                    current,
+                    last_check=request_date,
+                    is_alive=is_alive,
+                    status_code=row["status_code"],
+                    load_time=float(row["load_time"]),
+                    error_id=row["error_id"],
+                    last_change=(
+                        current.last_change
+                        if is_alive == current.is_alive
+                        else request_date
+                    ),
+                    consecutive_failures=(
+                        0 if is_alive else current.consecutive_failures + 1
+                    ),
+                )
+            changed[site_id] = status
+        return list(changed.values())
+
+    def _should_save(self, status: SiteStatus) -> bool:
+        current = self.sites.get(status.site_id)
+        if current is None or current.state != status.state:
+            return True
+        saved = self._saved.get(status.site_id)
+        return (
+            saved is None
+            or (status.last_check - saved).total_seconds() >= self.refresh_interval
+        )
+
+    async def save(
+        self, connection: asyncpg.Connection, statuses: List[SiteStatus]
+    ) -> None:
+        """
+        writes statuses returned by ``apply``
+        """
+        if not statuses:
+            return
+        # rows are locked in the same order by all consumers, so they do not deadlock
+        await connection.executemany(
+            UPSERT_STATUS, sorted(status.to_row() for status in statuses)
+        )
+        for status in statuses:
+            self._saved[status.site_id] = status.last_check
+
+    def apply(self, statuses: List[SiteStatus]) -> List[SiteStatus]:
+        """
+        updates the cache and returns statuses which changed or should be refreshed
+
+        A status older than the cached one is skipped.
+        """
+        changed = []
+        for status in statuses:
+            current = self.sites.get(status.site_id)
+            if current is not None and current.last_check >= status.last_check:
+                continue
+            if self._should_save(status):
+                changed.append(status)
+            self.sites[status.site_id] = status
+            if status.url is not None:
+                self.urls[status.url] = status.site_id
+        return changed
@@ -0,0 +1,126 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from consumer.alerts import (
+    FIRING,
+    RESOLVED,
+    AlertEngine,
+    ConsecutiveFailures,
+    ErrorRate,
+    FileNotifier,
+    SlowResponses,
+    read_rules,
+)
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc)
+
+
+def make_row(seconds, is_alive=True, load_time=0.1, site_id=1):
+    return {
+        "site_id": site_id,
+        "request_date": START + timedelta(seconds=seconds),
+        "load_time": load_time,
+        "is_alive": is_alive,
+    }
+
+
+def evaluate(rule, checks):
+    state = rule.new_state()
+    return [
+        rule.update(state, seconds, load_time, ok) for seconds, load_time, ok in checks
+    ]
+
+
+def test_consecutive_failures():
+    rule = ConsecutiveFailures("down", count=2)
+    checks = [(0, 0.1, False), (1, 0.1, False), (2, 0.1, False), (3, 0.1, True)]
+    assert evaluate(rule, checks) == [False, True, True, False]
+
+
+def test_slow_responses():
+    rule = SlowResponses("slow", threshold=1.0, duration=60)
+    checks = [(0, 2.0, True), (30, 2.0, True), (60, 2.0, True), (70, 0.5, True)]
+    assert evaluate(rule, checks) == [False, False, True, False]
+
+
+def test_slow_responses_skip_failed_checks():
+    rule = SlowResponses("slow", threshold=1.0, duration=60)
+    # failed checks are stored with a zero load time
+    checks = [(0, 2.0, True), (30, 0.0, False), (60, 2.0, True), (90, 0.0, False)]
+    assert evaluate(rule, checks) == [False, False, True, True]
+    assert evaluate(rule, [(0, 0.0, False), (60, 0.0, False)]) == [False, False]
+
+
+def test_error_rate_drops_expired_checks():
+    rule = ErrorRate("flaky", rate=0.5, window=100, min_checks=2)
+    checks = [(0, 0.1, False), (10, 0.1, False), (50, 0.1, True), (150, 0.1, True)]
+    # the failures are out of the window at 150
+    assert evaluate(rule, checks) == [False, True, True, False]
+    state = rule.new_state()
+    rule.update(state, 0, 0.1, False)
+    rule.update(state, 1000, 0.1, True)
+    assert (state.total_checks, state.total_failures) == (1, 0)
+
+
+def test_engine_deduplicates_alerts():
+    engine = AlertEngine([ConsecutiveFailures("down", count=2)], [])
+    urls = {1: "https://google.com"}
+    alerts = engine.process(
+        [make_row(seconds, is_alive=False) for seconds in (2, 1, 0)], urls.get
+    )
+    assert [(alert.status, alert.time) for alert in alerts] == [
+        (FIRING, START + timedelta(seconds=1))
+    ]
+    assert alerts[0].url == "https://google.com"
+    assert engine.process([make_row(3, is_alive=False)]) == []
+    # a late check is ignored
+    assert engine.process([make_row(0, is_alive=True)]) == []
+    alerts = engine.process([make_row(4, is_alive=True)])
+    assert [alert.status for alert in alerts] == [RESOLVED]
+    assert engine.queue.qsize() == 2
+
+
+def test_engine_keeps_sites_apart():
+    engine = AlertEngine([ConsecutiveFailures("down", count=2)], [])
+    rows = [make_row(0, False, site_id=1), make_row(1, False, site_id=2)]
+    assert engine.process(rows) == []
+
+
+def test_read_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"name": "down", "type": "consecutive_failures", "count": 3},
+                {"name": "slow", "type": "latency", "threshold": 2, "duration": 60},
+                {"name": "flaky", "type": "error_rate", "rate": 0.5, "window": 600},
+            ]
+        )
+    )
+    rules = read_rules(str(path))
+    assert rules[0] == ConsecutiveFailures("down", 3)
+    assert rules[1] == SlowResponses("slow", 2.0, 60.0)
+    assert rules[2] == ErrorRate("flaky", 0.5, 600.0)
+    path.write_text(json.dumps([{"name": "down", "type": "unknown"}]))
+    with pytest.raises(TypeError):
+        read_rules(str(path))
+
+
+@pytest.mark.asyncio
+async def test_engine_sends_alerts_to_notifiers(tmp_path):
+    path = tmp_path / "alerts.log"
+    engine = AlertEngine(
+        [ConsecutiveFailures("down", count=1)], [FileNotifier(str(path))]
+    )
+    task = asyncio.create_task(engine.run())
+    engine.process([make_row(0, is_alive=False), make_row(1, is_alive=True)])
+    await asyncio.wait_for(engine.queue.join(), 1)
+    task.cancel()
+    alerts = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [alert["status"] for alert in alerts] == [FIRING, RESOLVED]
+    assert alerts[0]["rule"] == "down"
+    assert alerts[0]["time"] == START.isoformat()
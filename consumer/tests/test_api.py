@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from consumer.api import create_app
+from consumer.history import HistoryStore
+from consumer.queries import HistoryQuery
+from consumer.tests.test_queries import START, FakeConnection as QueryConnection
+from consumer.tests.test_writer import FakeConnection, FakePool, make_record
+from consumer.records import ERROR
+from consumer.writer import DatabaseWriter
+
+
+@pytest.mark.asyncio
+async def test_api_serves_status_and_history():
+    writer = DatabaseWriter(FakePool(FakeConnection()), history=HistoryStore())
+    failed = make_record(status_code=500)
+    # the failed check is the last one
+    failed = failed[:ERROR] + (
+        "Internal Server Error",
+        failed[ERROR + 1] + timedelta(seconds=1),
+    ) + failed[ERROR + 2 :]
+    await writer.write([make_record(), failed])
+
+    async with TestClient(TestServer(create_app(writer))) as client:
+        response = await client.get("/status")
+        assert response.status == 200
+        (status,) = await response.json()
+        assert status["url"] == "https://google.com"
+        assert status["error"] == "Internal Server Error"
+
+        response = await client.get("/status", params={"url": "https://google.com"})
+        assert (await response.json())["status_code"] == 500
+
+        response = await client.get(
+            "/history", params={"url": "https://google.com", "limit": "1"}
+        )
+        (check,) = await response.json()
+        assert check["status_code"] == 500
+
+        response = await client.get("/status", params={"url": "https://unknown.com"})
+        assert response.status == 404
+        response = await client.get("/history")
+        assert response.status == 400
+
+
+@pytest.mark.asyncio
+async def test_api_serves_history_buckets():
+    connection = QueryConnection(([START + 10], [0.1], [True]))
+    writer = DatabaseWriter(FakePool(FakeConnection()))
+    app = create_app(writer, HistoryQuery(FakePool(connection)))
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get(
+            "/history/buckets",
+            params={
+                "url": "https://google.com",
+                "start": "2020-01-01T00:00:00",
+                "end": "2020-01-01T01:00:00",
+                "bucket": "600",
+            },
+        )
+        (bucket,) = await response.json()
+        assert bucket["bucket"] == "2020-01-01T00:00:00+00:00"
+        assert bucket["checks"] == 1
+
+        response = await client.get(
+            "/history/buckets", params={"url": "https://google.com", "bucket": "x"}
+        )
+        assert response.status == 400
+
+
+class InvalidQuery:
+    async def run(self, url, start, end, bucket):
+        raise ValueError("invalid bucket")
+
+
+@pytest.mark.asyncio
+async def test_api_rejects_invalid_queries():
+    writer = DatabaseWriter(FakePool(FakeConnection()))
+    async with TestClient(TestServer(create_app(writer, InvalidQuery()))) as client:
+        response = await client.get(
+            "/history/buckets", params={"url": "https://google.com"}
+        )
+        assert response.status == 400
+        assert response.reason == "invalid bucket"
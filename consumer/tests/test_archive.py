@@ -0,0 +1,169 @@
+import math
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import pytest
+
+from consumer import archive
+from consumer.archive import (
+    DROP,
+    KEEP,
+    ArchiveReader,
+    ArchiveWriter,
+    archive_days,
+    archive_path,
+    scan_archive,
+)
+from consumer.partitions import partition_day, partition_name
+
+DAY = date(2020, 1, 1)
+START = 1577836800.0  # the start of the day
+
+
+def make_rows(count, start=0):
+    return [
+        (
+            start + index,
+            f"https://site-{index % 3}.com",
+            0.25,
+            200 if index % 2 else 500,
+            bool(index % 2),
+            None if index % 2 else "timeout",
+            START + start + index,
+            uuid.UUID(int=start + index + 1),
+            None if index % 4 else 1.5,
+        )
+        for index in range(count)
+    ]
+
+
+def test_archive_round_trip(tmp_path):
+    path = tmp_path / "day.arc"
+    rows = make_rows(10)
+    with ArchiveWriter(path) as writer:
+        writer.write(rows[:6])
+        writer.write(rows[6:])
+    assert not (tmp_path / "day.arc.tmp").exists()
+
+    with ArchiveReader(path) as reader:
+        chunks = list(reader.chunks())
+        read = list(reader.rows())
+    assert [len(chunk["id"]) for chunk in chunks] == [6, 4]
+    assert [row["url"] for row in read] == [row[1] for row in rows]
+    assert [row["error"] for row in read] == [row[5] for row in rows]
+    assert [row["request_date"] for row in read] == [row[6] for row in rows]
+    assert read[0]["check_id"] == uuid.UUID(int=1).bytes
+    assert read[0]["anomaly_score"] == 1.5
+    assert math.isnan(read[1]["anomaly_score"])
+
+
+def test_archive_reads_requested_columns(tmp_path):
+    path = tmp_path / "day.arc"
+    with ArchiveWriter(path) as writer:
+        writer.write(make_rows(5))
+    with ArchiveReader(path) as reader:
+        (chunk,) = reader.chunks(["load_time", "is_alive"])
+    assert sorted(chunk) == ["is_alive", "load_time"]
+    assert chunk["is_alive"].sum() == 2
+
+
+def test_archive_is_not_written_on_error(tmp_path):
+    path = tmp_path / "day.arc"
+    with pytest.raises(RuntimeError):
+        with ArchiveWriter(path) as writer:
+            writer.write(make_rows(5))
+            raise RuntimeError("connection lost")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / "day.arc"
+    path.write_bytes(b"PAR1")
+    with pytest.raises(ValueError):
+        with ArchiveReader(path):
+            pass
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, count):
+        rows, self.rows = self.rows[:count], self.rows[count:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, days):
+        # rows of days
+        self.days = days
+        self.executed = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def cursor(self, query, start, end):
+        return FakeCursor(self.days.get(start.date(), []))
+
+    async def fetch(self, query):
+        return [(partition_name(day),) for day in self.days]
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+
+    async def fetchval(self, query):
+        # the count of rows of a partition
+        return len(self.days[partition_day(query.split()[-1])])
+
+
+@pytest.mark.asyncio
+async def test_archive_days(tmp_path):
+    connection = FakeConnection({DAY: make_rows(5), DAY + timedelta(days=2): []})
+    result = await archive_days(
+        connection, str(tmp_path), end=DAY + timedelta(days=3), chunk_rows=2
+    )
+    assert result == {DAY: 5, DAY + timedelta(days=1): 0, DAY + timedelta(days=2): 0}
+    assert [path.name for path in tmp_path.iterdir()] == ["monitoring_20200101.arc"]
+    assert connection.executed == []
+    chunks = list(scan_archive(str(tmp_path), DAY, DAY + timedelta(days=3), ["id"]))
+    assert [chunk["id"].tolist() for chunk in chunks] == [[0, 1], [2, 3], [4]]
+
+    # an empty day does not replace an archive
+    connection = FakeConnection({DAY: []})
+    await archive_days(connection, str(tmp_path), DAY, DAY + timedelta(days=1))
+    assert archive_path(str(tmp_path), DAY).exists()
+
+
+@pytest.mark.asyncio
+async def test_archive_days_drops_partitions(tmp_path):
+    connection = FakeConnection({DAY: make_rows(3)})
+    await archive_days(
+        connection, str(tmp_path), DAY, DAY + timedelta(days=1), cleanup=DROP
+    )
+    assert connection.executed[-1] == f"DROP TABLE IF EXISTS {partition_name(DAY)}"
+    connection = FakeConnection({DAY: make_rows(3)})
+    await archive_days(
+        connection, str(tmp_path), DAY, DAY + timedelta(days=1), cleanup=KEEP
+    )
+    assert connection.executed == []
+
+
+@pytest.mark.asyncio
+async def test_archive_days_keeps_partitions_with_new_rows(tmp_path, monkeypatch):
+    connection = FakeConnection({DAY: make_rows(3)})
+    export = archive.export_day
+
+    async def export_day(*args):
+        rows = await export(*args)
+        # a late check is written after the export
+        connection.days[DAY].extend(make_rows(1, start=3))
+        return rows
+
+    monkeypatch.setattr(archive, "export_day", export_day)
+    result = await archive_days(
+        connection, str(tmp_path), DAY, DAY + timedelta(days=1), cleanup=DROP
+    )
+    assert result == {DAY: 3}
+    assert not any(query.startswith("DROP") for query in connection.executed)
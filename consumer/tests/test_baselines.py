@@ -0,0 +1,126 @@
+import asyncio
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from consumer.baselines import BaselineStore
+from consumer.tests.test_writer import FakePool, SlowConnection, make_record
+from consumer.writer import DatabaseWriter
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc)
+
+
+def make_checks(load_times, site_id=1, ok=True, start=0):
+    return [
+        (site_id, load_time, ok, START + timedelta(seconds=start + seconds))
+        for seconds, load_time in enumerate(load_times)
+    ]
+
+
+def warm_up(store, load_time, count, site_id=1):
+    scores, baselines = store.prepare(make_checks([load_time] * count, site_id))
+    store.apply(baselines)
+    return scores
+
+
+def test_checks_are_scored_after_warmup():
+    store = BaselineStore(warmup=5)
+    assert warm_up(store, 0.05, 5) == [None] * 5
+    mean, variance, count, _ = store.get(1)
+    assert mean == pytest.approx(math.log(0.05))
+    assert variance == pytest.approx(0)
+    assert count == 5
+
+    scores, _ = store.prepare(make_checks([0.05, 0.5], start=10))
+    assert scores[0] == pytest.approx(0)
+    assert store.anomalies(scores) == 1
+
+
+def test_sites_are_scored_by_their_own_latency():
+    store = BaselineStore(warmup=5)
+    warm_up(store, 0.05, 10, site_id=1)
+    warm_up(store, 3.0, 10, site_id=2)
+    checks = make_checks([3.0], site_id=1, start=20) + make_checks(
+        [3.0], site_id=2, start=20
+    )
+    scores, _ = store.prepare(checks)
+    assert scores[0] > store.threshold
+    assert scores[1] == pytest.approx(0)
+
+
+def test_failed_and_late_checks_do_not_change_baselines():
+    store = BaselineStore(warmup=5)
+    warm_up(store, 0.05, 10)
+    baseline = store.get(1)
+    scores, baselines = store.prepare(
+        make_checks([10.0], ok=False, start=20) + make_checks([10.0], start=0)
+    )
+    assert scores == [None, None]
+    assert baselines == {}
+    assert store.get(1) == baseline
+
+
+def test_outliers_are_clamped():
+    store = BaselineStore(warmup=5, alpha=0.5, threshold=4)
+    warm_up(store, 1.0, 10)
+    _, baselines = store.prepare(make_checks([1000.0], start=20))
+    mean = baselines[1][0]
+    # the baseline moves by half of 4 minimal deviations
+    assert mean == pytest.approx(0.5 * 4 * 0.05)
+
+
+class FakeConnection:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.saved = []
+
+    async def fetch(self, query):
+        return self.rows
+
+    async def executemany(self, query, args):
+        self.saved.extend(args)
+
+
+@pytest.mark.asyncio
+async def test_baselines_are_saved_periodically():
+    store = BaselineStore(warmup=5, refresh_interval=60)
+    connection = FakeConnection()
+    _, baselines = store.prepare(make_checks([0.1] * 3))
+    await store.save(connection, store.apply(baselines))
+    assert [row[0] for row in connection.saved] == [1]
+    assert connection.saved[0][4] == START + timedelta(seconds=2)
+
+    _, baselines = store.prepare(make_checks([0.1], start=30))
+    await store.save(connection, store.apply(baselines))
+    assert len(connection.saved) == 1
+
+    _, baselines = store.prepare(make_checks([0.1], start=70))
+    await store.save(connection, store.apply(baselines))
+    assert len(connection.saved) == 2
+
+    restored = BaselineStore()
+    await restored.load(FakeConnection([(1, *baselines[1])]))
+    assert restored.get(1) == baselines[1]
+
+
+def test_apply_keeps_newer_baseline():
+    store = BaselineStore()
+    _, newer = store.prepare(make_checks([0.1, 0.2]))
+    _, older = store.prepare(make_checks([0.1]))
+    store.apply(newer)
+    store.apply(older)
+    assert store.get(1) == newer[1]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_update_baselines():
+    writer = DatabaseWriter(FakePool(SlowConnection()), status=None)
+    moment = datetime.now(utc)
+    records = [
+        make_record(request_time=moment + timedelta(seconds=seconds))
+        for seconds in range(3)
+    ]
+    await asyncio.gather(*(writer.write([record]) for record in records))
+    assert writer.baselines.get(1)[2] == 3
@@ -0,0 +1,74 @@
+import pytest
+
+from consumer.dimensions import DimensionCache
+
+
+class FakeConnection:
+    def __init__(self, lost=()):
+        self.ids = {}
+        self.queries = []
+        # values inserted by another consumer, the first query does not return them
+        self.lost = set(lost)
+
+    async def fetch(self, query, values):
+        self.queries.append(sorted(values))
+        rows = []
+        for value in sorted(values):
+            dimension_id = self.ids.setdefault(value, len(self.ids) + 1)
+            if value in self.lost:
+                self.lost.discard(value)
+            else:
+                rows.append((dimension_id, value))
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_resolve_creates_missing_values_in_bulk():
+    connection = FakeConnection()
+    cache = DimensionCache("query")
+    await cache.resolve(connection, ["a", "b", None, "a"])
+    await cache.resolve(connection, ["a", "b", "c"])
+    assert connection.queries == [["a", "b"], ["c"]]
+    assert [cache.get(value) for value in ("a", "b", "c", None)] == [1, 2, 3, None]
+    assert cache.value(3) == "c"
+    assert cache.value(None) is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_retries_concurrently_inserted_values():
+    connection = FakeConnection(lost={"b"})
+    cache = DimensionCache("query")
+    await cache.resolve(connection, ["a", "b"])
+    assert connection.queries == [["a", "b"], ["b"]]
+    assert cache.get("b") == 2
+
+
+@pytest.mark.asyncio
+async def test_full_cache_is_reset():
+    connection = FakeConnection()
+    cache = DimensionCache("query", size=2)
+    await cache.resolve(connection, ["a", "b"])
+    await cache.resolve(connection, ["b", "c"])
+    assert len(cache) == 2
+    assert cache.get("b") == 2
+    with pytest.raises(KeyError):
+        cache.get("a")
+
+
+@pytest.mark.asyncio
+async def test_resolve_returns_ids_after_a_concurrent_reset():
+    connection = FakeConnection()
+    cache = DimensionCache("query", size=2)
+    await cache.resolve(connection, ["a"])
+
+    class ResettingConnection(FakeConnection):
+        async def fetch(self, query, values):
+            rows = await connection.fetch(query, values)
+            # another pipeline resets the full cache
+            await cache.resolve(connection, ["x", "y"])
+            return rows
+
+    ids = await cache.resolve(ResettingConnection(), ["a", "b"])
+    assert ids == {"a": 1, "b": 2}
+    with pytest.raises(KeyError):
+        cache.get("a")
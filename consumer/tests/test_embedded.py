@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from consumer.embedded import ChannelWriter
+from consumer.offsets import OffsetManager
+from consumer.pipeline import PipelineManager
+from consumer.tests.test_writer import FakeConnection, FakePool
+from consumer.writer import DatabaseWriter
+from core.models import Response
+from core.utils import now
+
+
+def make_message(index):
+    return Response(
+        url=f"https://site-{index}.com",
+        status_code=200,
+        load_time=0.1,
+        request_time=now(),
+    ).serialize()
+
+
+@pytest.mark.asyncio
+async def test_channel_writes_messages_in_batches():
+    connection = FakeConnection()
+    offsets = OffsetManager()
+    pipelines = PipelineManager(
+        DatabaseWriter(FakePool(connection)), offsets, batch_size=3, batch_linger=0.01
+    )
+    channel = ChannelWriter(pipelines)
+    for index in range(7):
+        await channel.write(make_message(index))
+    await channel.write(b"{}")
+    await asyncio.wait_for(pipelines.stop_all(), 1)
+
+    assert len(connection.rows) == 7
+    assert connection.calls == 3
+    assert offsets.outstanding == 0
+
+
+@pytest.mark.asyncio
+async def test_channel_waits_at_high_water():
+    connection = FakeConnection()
+    offsets = OffsetManager(high_water=2, low_water=0)
+    pipelines = PipelineManager(
+        DatabaseWriter(FakePool(connection)), offsets, batch_size=10, batch_linger=0.05
+    )
+    channel = ChannelWriter(pipelines)
+    await channel.write(make_message(0))
+    await channel.write(make_message(1))
+    assert channel.paused() == ["channel"]
+
+    # the write continues when the batch is written
+    await asyncio.wait_for(channel.write(make_message(2)), 1)
+    assert len(connection.rows) == 2
+    await asyncio.wait_for(pipelines.stop_all(), 1)
+    assert len(connection.rows) == 3
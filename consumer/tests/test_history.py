@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from consumer.history import HistoryStore, SiteHistory
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc)
+
+
+def test_site_history_overwrites_oldest_checks():
+    history = SiteHistory(size=3)
+    assert history.latest() == []
+    for seconds in range(5):
+        history.append(START + timedelta(seconds=seconds), 0.1, 200, True, seconds or None)
+    assert len(history) == 3
+    checks = history.latest()
+    assert [check["request_time"] for check in checks] == [
+        START + timedelta(seconds=seconds) for seconds in (4, 3, 2)
+    ]
+    assert [check["error_id"] for check in checks] == [4, 3, 2]
+    assert history.latest(1)[0]["is_alive"] is True
+
+
+def test_history_store_adds_rows_in_order():
+    store = HistoryStore(size=10)
+    rows = [
+        {
+            "site_id": 1,
+            "request_date": START + timedelta(seconds=seconds),
+            "load_time": 0.5,
+            "status_code": 200,
+            "is_alive": True,
+            "error_id": None,
+        }
+        for seconds in (2, 1)
+    ]
+    store.add(rows)
+    assert store.get(2) is None
+    checks = store.get(1).latest()
+    assert checks[0]["request_time"] == START + timedelta(seconds=2)
+    assert checks[1]["error_id"] is None
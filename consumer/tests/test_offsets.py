@@ -0,0 +1,85 @@
+import pytest
+
+from consumer.offsets import OffsetManager
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = []
+
+    async def commit(self, offsets):
+        self.commits.append(dict(offsets))
+
+
+@pytest.mark.asyncio
+async def test_commit_contiguous_offsets():
+    offsets = OffsetManager()
+    offsets.consumer = FakeConsumer()
+    for offset in (10, 11, 12, 15):
+        offsets.track("p0", offset)
+    offsets.track("p1", 0)
+    assert offsets.outstanding == 5
+
+    offsets.ack_many([("p0", 11), ("p0", 12)])
+    assert offsets.committable() == {}
+
+    offsets.ack("p0", 10)
+    offsets.ack("p1", 0)
+    assert offsets.committable() == {"p0": 13, "p1": 1}
+    await offsets.commit()
+    assert offsets.consumer.commits == [{"p0": 13, "p1": 1}]
+    assert offsets.outstanding == 1
+
+    # nothing new to commit
+    await offsets.commit()
+    assert len(offsets.consumer.commits) == 1
+
+    offsets.ack("p0", 15)
+    await offsets.commit()
+    assert offsets.consumer.commits[-1] == {"p0": 16}
+
+
+def test_forget_partition():
+    offsets = OffsetManager()
+    offsets.track("p0", 1)
+    offsets.forget("p0")
+    offsets.ack("p0", 1)
+    assert offsets.committable() == {}
+    assert offsets.outstanding == 0
+
+
+class FakeFlowConsumer(FakeConsumer):
+    def __init__(self):
+        super().__init__()
+        self.partitions = {"p0", "p1"}
+        self.paused_partitions = set()
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def paused(self):
+        return set(self.paused_partitions)
+
+    def pause(self, *partitions):
+        self.paused_partitions.update(partitions)
+
+    def resume(self, *partitions):
+        self.paused_partitions.difference_update(partitions)
+
+
+def test_pause_and_resume_fetching():
+    offsets = OffsetManager(high_water=4, low_water=1)
+    offsets.consumer = FakeFlowConsumer()
+    for offset in range(3):
+        offsets.track("p0", offset)
+    assert not offsets.paused
+
+    offsets.track("p1", 0)
+    assert offsets.paused
+    assert offsets.consumer.paused_partitions == {"p0", "p1"}
+
+    offsets.ack_many([("p0", 0), ("p0", 1)])
+    assert offsets.paused
+    offsets.ack("p0", 2)
+    assert not offsets.paused
+    assert offsets.consumer.paused_partitions == set()
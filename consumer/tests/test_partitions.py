@@ -0,0 +1,67 @@
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+from consumer.partitions import (
+    create_partition_sql,
+    expired_days,
+    maintain_partitions,
+    partition_day,
+    partition_name,
+)
+
+
+class FakeConnection:
+    def __init__(self, partitions):
+        self.partitions = set(partitions)
+        self.statements = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, statement, *args):
+        self.statements.append(statement)
+        if statement.startswith("CREATE TABLE"):
+            self.partitions.add(statement.split()[5])
+        elif statement.startswith("DROP TABLE"):
+            self.partitions.discard(statement.split()[-1])
+
+    async def fetch(self, query):
+        return [(name,) for name in self.partitions]
+
+
+def test_partition_name():
+    day = date(2020, 2, 29)
+    assert partition_name(day) == "monitoring_20200229"
+    assert partition_day("monitoring_20200229") == day
+    assert partition_day("monitoring_legacy") is None
+    assert create_partition_sql(day).endswith(
+        "FROM ('2020-02-29T00:00:00+00:00') TO ('2020-03-01T00:00:00+00:00')"
+    )
+
+
+def test_expired_days():
+    days = [date(2020, 1, day) for day in range(1, 11)]
+    assert expired_days(days, date(2020, 1, 10), retention_days=7) == [
+        date(2020, 1, 1),
+        date(2020, 1, 2),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions():
+    connection = FakeConnection(
+        ["monitoring_20200101", "monitoring_20200105", "monitoring_legacy"]
+    )
+    expired = await maintain_partitions(
+        connection, retention_days=3, premake_days=2, current=date(2020, 1, 5)
+    )
+    assert expired == [date(2020, 1, 1)]
+    assert connection.partitions == {
+        "monitoring_20200105",
+        "monitoring_20200106",
+        "monitoring_20200107",
+        "monitoring_legacy",
+    }
@@ -0,0 +1,50 @@
+import pytest
+
+from consumer.offsets import OffsetManager
+from consumer.pipeline import PipelineManager
+from consumer.tests.test_offsets import FakeConsumer
+from consumer.tests.test_writer import FakeConnection, FakePool
+from consumer.records import to_record
+from consumer.writer import DatabaseWriter
+from core.models import Response
+from core.utils import now
+
+
+def make_message(partition, offset):
+    response = Response(
+        url=f"https://google.com/{partition}/{offset}",
+        status_code=200,
+        load_time=0.1,
+        request_time=now(),
+    )
+    return partition, offset, to_record(response)
+
+
+@pytest.mark.asyncio
+async def test_revoked_partition_is_drained_and_committed():
+    connection = FakeConnection()
+    offsets = OffsetManager()
+    offsets.consumer = FakeConsumer()
+    pipelines = PipelineManager(
+        DatabaseWriter(FakePool(connection)), offsets, batch_size=2, batch_linger=0
+    )
+    await pipelines.on_partitions_assigned({"p0", "p1"})
+    for offset in range(5):
+        for partition in ("p0", "p1"):
+            offsets.track(partition, offset)
+            await pipelines.put(make_message(partition, offset))
+
+    await pipelines.on_partitions_revoked({"p0"})
+    assert set(pipelines.pipelines) == {"p1"}
+    committed = {}
+    for commit in offsets.consumer.commits:
+        committed.update(commit)
+    assert committed["p0"] == 5
+    urls = [connection.value(row[0]) for row in connection.rows]
+    written = [url for url in urls if "/p0/" in url]
+    assert written == [f"https://google.com/p0/{offset}" for offset in range(5)]
+
+    await pipelines.stop_all()
+    assert pipelines.pipelines == {}
+    assert len(connection.rows) == 10
+    assert offsets.outstanding == 0
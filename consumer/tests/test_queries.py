@@ -0,0 +1,136 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from consumer.queries import (
+    HistoryQuery,
+    aggregate_raw,
+    aggregate_rollups,
+    align,
+    choose_source,
+    snap_bucket,
+)
+from consumer.rollups import SKETCH_BUCKETS, sketch_index
+from consumer.tests.test_writer import FakePool
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc).timestamp()
+
+
+class FakeConnection:
+    def __init__(self, row):
+        self.row = row
+        self.queries = []
+
+    async def fetchval(self, query, url):
+        return 1 if url == "https://google.com" else None
+
+    async def fetchrow(self, query, *args):
+        self.queries.append(query)
+        return self.row
+
+
+def test_choose_source():
+    assert choose_source(3600, 60) is None
+    assert choose_source(7 * 86400, 86400) == "rollup_day"
+    assert choose_source(7 * 86400, 7200) == "rollup_hour"
+    assert choose_source(7 * 86400, 300) == "rollup_minute"
+    with pytest.raises(ValueError):
+        choose_source(7 * 86400, 90)
+
+
+def test_snap_bucket():
+    assert snap_bucket(3600, 90) == 90
+    assert snap_bucket(7 * 86400, 90) == 120
+    assert snap_bucket(7 * 86400, 20) == 60
+    assert snap_bucket(7 * 86400, 7200) == 7200
+
+
+def test_align():
+    start = datetime(2020, 1, 1, 10, 30, tzinfo=utc)
+    end = datetime(2020, 1, 1, 12, 10, tzinfo=utc)
+    assert align(start, end, 3600) == (
+        datetime(2020, 1, 1, 10, tzinfo=utc),
+        datetime(2020, 1, 1, 13, tzinfo=utc),
+    )
+
+
+def test_aggregate_raw():
+    times = START + np.array([10.0, 20, 30, 3700, 3800])
+    load_times = np.array([0.3, 0.1, 0.2, 1.0, 2.0])
+    is_alive = np.array([True, True, False, True, True])
+    first, second = aggregate_raw(times, load_times, is_alive, START, 3600)
+    assert first["bucket"] == datetime(2020, 1, 1, tzinfo=utc)
+    assert (first["checks"], first["failures"]) == (3, 1)
+    assert first["availability"] == pytest.approx(2 / 3)
+    assert first["avg_load_time"] == pytest.approx(0.2)
+    # the failed check is not a part of latency
+    assert (first["p50"], first["p99"]) == (0.1, 0.3)
+    assert second["checks"] == 2
+    assert second["p50"] == 1.0
+    (failed,) = aggregate_raw(
+        times[2:3], load_times[2:3], is_alive[2:3], START, 3600
+    )
+    assert (failed["availability"], failed["avg_load_time"]) == (0, None)
+    assert failed["p50"] is None
+    assert aggregate_raw(np.array([]), np.array([]), np.array([]), START, 60) == []
+
+
+def test_aggregate_rollups():
+    sketches = np.zeros((3, SKETCH_BUCKETS), dtype=np.int64)
+    sketches[0, sketch_index(0.1)] = 9
+    sketches[1, sketch_index(2.0)] = 1
+    sketches[2, sketch_index(0.5)] = 4
+    times = START + np.array([0.0, 3600, 86400])
+    (first, second) = aggregate_rollups(
+        times,
+        np.array([9, 2, 4]),
+        np.array([0, 1, 0]),
+        np.array([0.9, 2.0, 2.0]),
+        sketches,
+        START,
+        86400,
+    )
+    assert (first["checks"], first["failures"]) == (11, 1)
+    assert first["avg_load_time"] == pytest.approx(0.29)
+    assert 0.1 <= first["p50"] < 0.12
+    assert 2.0 <= first["p99"] < 2.4
+    assert second["bucket"] == datetime(2020, 1, 2, tzinfo=utc)
+
+
+@pytest.mark.asyncio
+async def test_history_query_caches_results():
+    connection = FakeConnection(
+        ([START + 10, START + 20], [0.1, 0.2], [True, False])
+    )
+    query = HistoryQuery(FakePool(connection))
+    start = datetime(2020, 1, 1, tzinfo=utc)
+    end = datetime(2020, 1, 1, 1, tzinfo=utc)
+    (bucket,) = await query.run("https://google.com", start, end, 3600)
+    assert bucket["failures"] == 1
+    assert await query.run("https://google.com", start, end, 3600) == [bucket]
+    assert len(connection.queries) == 1
+    assert "FROM monitoring" in connection.queries[0]
+    assert await query.run("https://unknown.com", start, end, 3600) is None
+
+
+@pytest.mark.asyncio
+async def test_history_query_snaps_buckets_of_long_ranges():
+    connection = FakeConnection((None,))
+    query = HistoryQuery(FakePool(connection))
+    start = datetime(2020, 1, 1, tzinfo=utc)
+    end = datetime(2020, 1, 8, tzinfo=utc)
+    assert await query.run("https://google.com", start, end, 90) == []
+    assert "FROM rollup_minute" in connection.queries[0]
+
+
+@pytest.mark.asyncio
+async def test_history_query_snaps_buckets_of_aligned_ranges():
+    connection = FakeConnection((None,))
+    query = HistoryQuery(FakePool(connection))
+    # the range is 6 hours, it is longer when it is aligned to 90 seconds buckets
+    start = datetime(2020, 1, 1, 0, 0, 30, tzinfo=utc)
+    end = datetime(2020, 1, 1, 6, 0, 30, tzinfo=utc)
+    assert await query.run("https://google.com", start, end, 90) == []
+    assert "FROM rollup_minute" in connection.queries[0]
@@ -0,0 +1,158 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import pytest
+
+from consumer.partitions import today
+from consumer import replay as replay_module
+from consumer.replay import RateLimiter, read_files, read_kafka, replay
+from consumer.tests.test_writer import FakeConnection, FakePool, SlowConnection
+from consumer.writer import DatabaseWriter
+from core.models import Response
+from core.utils import now
+
+
+def make_message(index, request_time=None, error=None):
+    return Response(
+        url=f"https://site-{index}.com",
+        status_code=200,
+        load_time=0.1,
+        request_time=request_time or now(),
+        error=error,
+    ).json_dumps()
+
+
+async def iterate(batches):
+    for batch in batches:
+        yield batch
+
+
+@pytest.mark.asyncio
+async def test_read_files_skips_empty_lines(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text("\n".join(["a", "", "b", "c"]) + "\n\n")
+    batches = [batch async for batch in read_files([str(path), str(path)], 2)]
+    assert batches == [[b"a", b"b"], [b"c"], [b"a", b"b"], [b"c"]]
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(1000)
+    start = time.monotonic()
+    for _ in range(3):
+        await limiter.wait(20)
+    # the first batch is not delayed
+    assert time.monotonic() - start >= 0.04
+    await RateLimiter().wait(10 ** 6)
+
+
+@pytest.mark.asyncio
+async def test_replay_writes_valid_messages_once():
+    connection = FakeConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    messages = [make_message(index).encode() for index in range(10)]
+    batches = [messages[:4], messages[4:8] + [b"{}"], messages[8:] + messages[:2]]
+
+    progress = await replay(iterate(batches), writer, workers=2)
+    assert (progress.read, progress.invalid, progress.written) == (13, 1, 10)
+    assert len(connection.rows) == 10
+
+    assert progress.rate > 0
+
+    progress = await replay(iterate(batches), writer, workers=2)
+    # the rate counts written rows
+    assert (progress.written, progress.rate) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_replay_stops_on_write_error():
+    connection = FakeConnection(failures=100)
+    writer = DatabaseWriter(FakePool(connection), retries=0, retry_delay=0)
+    batches = [[make_message(index).encode()] for index in range(10)]
+    with pytest.raises(Exception, match="connection lost"):
+        await replay(iterate(batches), writer, workers=2)
+    assert connection.calls < 10
+
+
+@pytest.mark.asyncio
+async def test_replay_creates_partitions_of_past_days():
+    connection = FakeConnection(partitions={today()})
+    writer = DatabaseWriter(FakePool(connection), retention_days=7)
+    batches = [
+        [make_message(days, now() - timedelta(days=days)).encode()]
+        for days in (1, 3, 10)
+    ]
+
+    progress = await replay(iterate(batches), writer, workers=2)
+    # checks older than the retention period are skipped
+    assert progress.written == 2
+    assert connection.partitions == {
+        today() - timedelta(days=days) for days in (0, 1, 3)
+    }
+
+
+@pytest.mark.asyncio
+async def test_replay_workers_keep_site_statuses():
+    writer = DatabaseWriter(FakePool(SlowConnection()))
+    start = now() - timedelta(days=1)
+    batches = [
+        [make_message(0, start + timedelta(minutes=minutes), "timeout").encode()]
+        for minutes in range(6)
+    ]
+
+    await replay(iterate(batches), writer, workers=3)
+    (status,) = writer.status.sites.values()
+    assert status.consecutive_failures == 6
+
+
+KafkaMessage = namedtuple("KafkaMessage", ["offset", "value"])
+
+
+class FakeKafkaConsumer:
+    # a partition keeps offsets from 5 to 9, older ones are removed by the retention
+    def __init__(self, **kwargs):
+        self.reset = kwargs.get("auto_offset_reset", "latest")
+        self.positions = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def assign(self, partitions):
+        self.partitions = partitions
+
+    async def end_offsets(self, partitions):
+        return {tp: 10 for tp in partitions}
+
+    def seek(self, tp, offset):
+        if offset < 5:
+            offset = 5 if self.reset == "earliest" else 10
+        self.positions[tp] = offset
+
+    async def position(self, tp):
+        return self.positions[tp]
+
+    async def getmany(self, *partitions, timeout_ms, max_records):
+        batches = {}
+        for tp in partitions:
+            start = self.positions[tp]
+            offsets = range(start, min(start + max_records, 10))
+            if offsets:
+                batches[tp] = [KafkaMessage(offset, b"%d" % offset) for offset in offsets]
+                self.positions[tp] = offsets[-1] + 1
+        return batches
+
+
+@pytest.mark.asyncio
+async def test_read_kafka_starts_at_the_oldest_kept_offset(monkeypatch):
+    monkeypatch.setattr(replay_module, "AIOKafkaConsumer", FakeKafkaConsumer)
+    batches = [
+        batch
+        async for batch in read_kafka(
+            "kafka:9093", "monitoring", [0], start_offset=0, batch_size=3
+        )
+    ]
+    assert batches == [[b"5", b"6", b"7"], [b"8", b"9"]]
@@ -0,0 +1,78 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from consumer.rollups import (
+    SKETCH_BOUNDS,
+    SKETCH_BUCKETS,
+    aggregate,
+    sketch_index,
+    sketch_quantile,
+    update_rollups,
+    ROLLUP_TABLES,
+)
+from consumer.tests.test_writer import FakeConnection, FakePool, make_record
+from consumer.writer import DatabaseWriter, RecentIds
+from core.utils import utc
+
+
+def make_row(site_id, minute, load_time, is_alive=True):
+    return {
+        "site_id": site_id,
+        "load_time": load_time,
+        "is_alive": is_alive,
+        "request_date": datetime(2020, 1, 1, 10, minute, 30, tzinfo=utc),
+    }
+
+
+def test_sketch_quantile():
+    assert len(SKETCH_BOUNDS) == SKETCH_BUCKETS
+    assert sketch_index(0) == 0
+    assert sketch_index(10 ** 6) == SKETCH_BUCKETS - 1
+    sketch = [0] * SKETCH_BUCKETS
+    for load_time in [0.1] * 90 + [2.0] * 10:
+        sketch[sketch_index(load_time)] += 1
+    # a quantile is within a bucket, i.e. 20% of the exact value
+    assert 0.1 <= sketch_quantile(sketch, 0.5) < 0.12
+    assert 2.0 <= sketch_quantile(sketch, 0.95) < 2.4
+    assert math.isnan(sketch_quantile([0] * SKETCH_BUCKETS, 0.5))
+
+
+def test_aggregate():
+    rows = [
+        make_row(1, 0, 0.5),
+        make_row(1, 0, 1.5, is_alive=False),
+        make_row(1, 1, 1.0),
+        make_row(2, 0, 0.2),
+    ]
+    minutes = aggregate(rows, ROLLUP_TABLES["rollup_minute"])
+    assert len(minutes) == 3
+    hours = aggregate(rows, ROLLUP_TABLES["rollup_hour"])
+    rollup = hours[1, datetime(2020, 1, 1, 10, tzinfo=utc)]
+    assert (rollup.checks, rollup.failures) == (3, 1)
+    # load times of failed checks are not aggregated
+    assert (rollup.min_load_time, rollup.max_load_time) == (0.5, 1.0)
+    assert rollup.sum_load_time == 1.5
+    assert sum(rollup.sketch) == 2
+
+
+@pytest.mark.asyncio
+async def test_update_rollups():
+    connection = FakeConnection()
+    await update_rollups(connection, [make_row(2, 0, 0.2), make_row(1, 0, 0.5)])
+    assert [query.split()[2] for query, _ in connection.rollups] == list(ROLLUP_TABLES)
+    # rows are sorted by sites and buckets
+    assert [args[0] for args in connection.rollups[0][1]] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_rollups_count_written_rows_once():
+    connection = FakeConnection()
+    # duplicates are skipped by the database, not by the cache
+    writer = DatabaseWriter(FakePool(connection), recent_ids=RecentIds(0))
+    records = [make_record(), make_record()]
+    await writer.write(records)
+    await writer.write(records)
+    days = [args for query, args in connection.rollups if "rollup_day" in query]
+    assert [rollup[2] for args in days for rollup in args] == [2]
@@ -1,4 +1,4 @@
-from consumer.serializer import KafkaDeserializer, REQUEST_SCHEMA
+from consumer.serializer import KafkaDeserializer, REQUEST_SCHEMA, BatchDecoder
 
 
 def test_serializer():
@@ -13,3 +13,75 @@ def test_serializer():
     assert response.url == "https://google.com"
     assert response.request_time.isoformat() == "2021-01-31T07:46:52.504364+00:00"
 
+
+def test_batch_decoder():
+    decoder = BatchDecoder()
+    records = decoder(
+        [
+            b'{"url": "https://google.com", "error": null, "status_code": 200, '
+            b'"load_time": 0.32332, "request_time": "2021-01-31T07:46:52.504364+00:00"}',
+            b'{"url": "https://google.com", "error": "returns 500 response", '
+            b'"status_code": 500, "load_time": 1, '
+            b'"request_time": "2021-01-31T07:46:52+00:00"}',
+        ]
+    )
+    assert records[0][:5] == ("https://google.com", 0.32332, 200, True, None)
+    assert records[0][5].isoformat() == "2021-01-31T07:46:52.504364+00:00"
+    assert records[1][3] is False
+    assert records[1][5].isoformat() == "2021-01-31T07:46:52+00:00"
+
+
+def test_batch_decoder_invalid_messages():
+    decoder = BatchDecoder()
+    valid = (
+        b'{"url": "https://google.com", "error": null, "status_code": 200, '
+        b'"load_time": 0.3, "request_time": "2021-01-31T07:46:52.504364+00:00"}'
+    )
+    records = decoder(
+        [b"aa", valid, None, b'{"test": "test"}', b"{}, {}", valid.replace(b"https", b"ftp")]
+    )
+    assert [record is not None for record in records] == [
+        False,
+        True,
+        False,
+        False,
+        False,
+        False,
+    ]
+
+
+def test_batch_decoder_does_not_splice_messages():
+    decoder = BatchDecoder()
+    valid = (
+        b'{"url": "https://google.com", "error": null, "status_code": 200, '
+        b'"load_time": 0.3, "request_time": "2021-01-31T07:46:52.504364+00:00"}'
+    )
+    # joined into an array, both values make two valid documents
+    records = decoder([valid + b', {"key": "', b'"}', valid])
+    assert [record is not None for record in records] == [False, False, True]
+
+
+def test_batch_decoder_rejects_values_out_of_range():
+    decoder = BatchDecoder()
+    valid = (
+        b'{"url": "https://google.com", "error": null, "status_code": 200, '
+        b'"load_time": 0.3, "request_time": "2021-01-31T07:46:52.504364+00:00"}'
+    )
+    records = decoder(
+        [
+            valid,
+            valid.replace(b"200", b"70000"),
+            valid.replace(b"200", b'"x"'),
+            valid.replace(b"0.3", b"-1"),
+            valid.replace(b"0.3", b"NaN"),
+            valid.replace(b"0.3", b"1e9"),
+        ]
+    )
+    assert [record is not None for record in records] == [
+        True,
+        False,
+        False,
+        False,
+        False,
+        False,
+    ]
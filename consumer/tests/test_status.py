@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from consumer.status import StatusCache
+from consumer.tests.test_writer import (
+    FakeConnection,
+    FakePool,
+    SlowConnection,
+    make_record,
+)
+from consumer.writer import DatabaseWriter
+from core.utils import utc
+
+START = datetime(2020, 1, 1, tzinfo=utc)
+
+
+def make_row(seconds, is_alive=True, site_id=1):
+    return {
+        "site_id": site_id,
+        "load_time": 0.5,
+        "status_code": 200 if is_alive else 500,
+        "is_alive": is_alive,
+        "error_id": None,
+        "request_date": START + timedelta(seconds=seconds),
+    }
+
+
+def test_prepare_tracks_changes_and_failures():
+    cache = StatusCache()
+    rows = [make_row(2, is_alive=False), make_row(1), make_row(3, is_alive=False)]
+    (status,) = cache.prepare(rows, lambda site_id: "https://google.com")
+    assert status.url == "https://google.com"
+    assert status.last_check == START + timedelta(seconds=3)
+    assert status.last_change == START + timedelta(seconds=2)
+    assert status.consecutive_failures == 2
+    # the cache is changed when statuses are written
+    assert len(cache) == 0
+    cache.apply([status])
+
+    # older rows are ignored
+    assert cache.prepare([make_row(0)]) == []
+    (status,) = cache.prepare([make_row(4)])
+    assert (status.is_alive, status.consecutive_failures) == (True, 0)
+    assert status.last_change == START + timedelta(seconds=4)
+
+
+@pytest.mark.asyncio
+async def test_save_writes_changed_statuses():
+    connection = FakeConnection()
+    cache = StatusCache(refresh_interval=60)
+    for seconds in (0, 10, 70):
+        statuses = cache.prepare([make_row(seconds), make_row(seconds, site_id=2)])
+        await cache.save(connection, cache.apply(statuses))
+    # new sites and the refresh of stable sites are written
+    assert [len(args) for _, args in connection.rollups] == [2, 2]
+
+    statuses = cache.prepare([make_row(71, is_alive=False)])
+    await cache.save(connection, cache.apply(statuses))
+    assert [args[0] for args in connection.rollups[-1][1]] == [1]
+
+    # a status which is not written is written with the next check
+    statuses = cache.prepare([make_row(72, is_alive=False)])
+    assert cache.apply(statuses) == statuses
+    assert cache.apply(cache.prepare([make_row(73, is_alive=False)]))
+
+
+@pytest.mark.asyncio
+async def test_writer_updates_status():
+    connection = FakeConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    await writer.write([make_record(), make_record(status_code=500)])
+    (status,) = writer.status.sites.values()
+    assert status.url == "https://google.com"
+    assert status.status_code == 500
+
+
+def test_apply_keeps_newer_status():
+    cache = StatusCache()
+    newer = cache.prepare([make_row(2, is_alive=False)])
+    older = cache.prepare([make_row(1)])
+    cache.apply(newer)
+    cache.apply(older)
+    assert cache.sites[1].last_check == START + timedelta(seconds=2)
+    assert not cache.sites[1].is_alive
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_count_failures():
+    connection = SlowConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    moment = datetime.now(utc)
+    records = [
+        make_record(request_time=moment + timedelta(seconds=seconds), error="timeout")
+        for seconds in range(3)
+    ]
+    await asyncio.gather(*(writer.write([record]) for record in records))
+    (status,) = writer.status.sites.values()
+    assert status.consecutive_failures == 3
@@ -0,0 +1,231 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import asyncpg
+import pytest
+
+from consumer.partitions import partition_day, record_day
+from consumer.records import CHECK_ID, REQUEST_TIME, to_record
+from consumer.writer import (
+    MONITORING_COLUMNS,
+    DatabaseWriter,
+    RecentIds,
+    collect_batch,
+)
+from core.models import Response
+from core.utils import now
+
+
+class FakeConnection:
+    def __init__(self, failures=0, partitions=None):
+        self.rows = []
+        self.staging = []
+        self.dimensions = {}
+        self.rollups = []
+        self.calls = 0
+        self.failures = failures
+        # days of partitions, rows of any day are accepted if None
+        self.partitions = partitions
+
+    @asynccontextmanager
+    async def transaction(self):
+        try:
+            yield
+        finally:
+            self.staging = []
+
+    async def copy_records_to_table(self, table, *, records, columns):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise asyncpg.exceptions.ConnectionDoesNotExistError("connection lost")
+        if any(record[2] is None for record in records):
+            raise asyncpg.exceptions.NotNullViolationError("status_code is null")
+        if any(record[2] is not None and record[2] > 32767 for record in records):
+            # the encoder error is raised as it is
+            raise OverflowError("value out of int16 range")
+        if self.partitions is not None and any(
+            record_day(record[REQUEST_TIME]) not in self.partitions
+            for record in records
+        ):
+            raise asyncpg.exceptions.CheckViolationError("no partition found for row")
+        self.staging.extend(records)
+
+    async def execute(self, query, *args):
+        if self.partitions is not None and query.startswith("CREATE TABLE"):
+            self.partitions.add(partition_day(query.split()[5]))
+
+    def value(self, dimension_id):
+        return next(
+            value
+            for (_, value), value_id in self.dimensions.items()
+            if value_id == dimension_id
+        )
+
+    async def fetch(self, query, *args):
+        if args:
+            # a query resolving identifiers of dimension values
+            ids = self.dimensions
+            for value in args[0]:
+                ids.setdefault((query, value), len(ids) + 1)
+            return [(ids[query, value], value) for value in args[0]]
+        written = {row[CHECK_ID] for row in self.rows}
+        inserted = [row for row in self.staging if row[CHECK_ID] not in written]
+        self.rows.extend(inserted)
+        return [dict(zip(MONITORING_COLUMNS, row)) for row in inserted]
+
+    async def executemany(self, query, args):
+        self.rollups.append((query, args))
+
+
+class SlowConnection(FakeConnection):
+    # switches to other writes in the middle of a transaction
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transactions = 0
+        self.max_transactions = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.transactions += 1
+        self.max_transactions = max(self.max_transactions, self.transactions)
+        try:
+            async with super().transaction():
+                yield
+        finally:
+            self.transactions -= 1
+
+    async def executemany(self, query, args):
+        await asyncio.sleep(0)
+        await super().executemany(query, args)
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+
+def make_record(status_code=200, request_time=None, error=None):
+    return to_record(
+        Response(
+            url="https://google.com",
+            status_code=status_code,
+            load_time=0.1,
+            request_time=request_time or now(),
+            error=error,
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_write_bisects_invalid_records():
+    connection = FakeConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    records = [make_record() for _ in range(16)]
+    records[5] = make_record(status_code=None)
+    records[9] = make_record(status_code=70000)
+
+    assert await writer.write(records) == 14
+    assert len(connection.rows) == 14
+    assert all(row[2] == 200 for row in connection.rows)
+    # checks of a new site are not scored
+    assert all(row[-1] is None for row in connection.rows)
+
+
+@pytest.mark.asyncio
+async def test_write_retries_failed_batch():
+    connection = FakeConnection(failures=2)
+    writer = DatabaseWriter(FakePool(connection), retries=2, retry_delay=0)
+    assert await writer.write([make_record(), make_record()]) == 2
+    assert connection.calls == 3
+
+    connection = FakeConnection(failures=3)
+    writer = DatabaseWriter(FakePool(connection), retries=2, retry_delay=0)
+    with pytest.raises(asyncpg.exceptions.ConnectionDoesNotExistError):
+        await writer.write([make_record()])
+    assert connection.rows == []
+
+
+@pytest.mark.asyncio
+async def test_write_skips_duplicates():
+    connection = FakeConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    records = [make_record() for _ in range(4)]
+
+    assert await writer.write(records + records[:2]) == 4
+    # duplicates are skipped by the cache of recent ids
+    assert await writer.write(records[2:]) == 0
+    assert connection.calls == 1
+
+    # and by the database when the cache does not have them anymore
+    writer = DatabaseWriter(FakePool(connection), recent_ids=RecentIds(1))
+    assert await writer.write(records + [make_record()]) == 1
+    assert len(connection.rows) == 5
+
+
+def test_recent_ids():
+    recent_ids = RecentIds(2)
+    for check_id in ("a", "b", "a", "c"):
+        recent_ids.add(check_id)
+    assert len(recent_ids) == 2
+    assert "a" not in recent_ids
+    assert "b" in recent_ids and "c" in recent_ids
+
+
+@pytest.mark.asyncio
+async def test_collect_batch():
+    queue = asyncio.Queue()
+    for item in range(5):
+        queue.put_nowait(item)
+    assert await collect_batch(queue, 3, 1) == [0, 1, 2]
+    assert await collect_batch(queue, 3, 0.01) == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_write_replaces_urls_and_errors_with_ids():
+    connection = FakeConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    records = [make_record(), make_record()]
+    records[1] = records[1][:4] + ("timeout",) + records[1][5:]
+
+    assert await writer.write(records) == 2
+    site_id = connection.rows[0][0]
+    assert connection.rows[1][0] == site_id
+    assert connection.value(site_id) == "https://google.com"
+    assert connection.rows[0][4] is None
+    assert connection.value(connection.rows[1][4]) == "timeout"
+    assert len(writer.sites) == 1 and len(writer.error_kinds) == 1
+
+
+@pytest.mark.asyncio
+async def test_write_creates_partitions_of_past_days():
+    connection = FakeConnection(partitions=set())
+    writer = DatabaseWriter(FakePool(connection), retention_days=30)
+    records = [
+        make_record(request_time=now() - timedelta(days=days)) for days in (0, 3, 3, 40)
+    ]
+    assert await writer.write(records) == 3
+    assert connection.partitions == {
+        (now() - timedelta(days=days)).date() for days in (0, 3)
+    }
+
+    # a partition is detached by the archive, it is created again
+    connection.partitions.clear()
+    assert await writer.write([make_record()]) == 1
+    assert connection.partitions == {now().date()}
+
+
+@pytest.mark.asyncio
+async def test_batches_are_copied_concurrently():
+    connection = SlowConnection()
+    writer = DatabaseWriter(FakePool(connection))
+    records = [make_record() for _ in range(3)]
+    assert sum(
+        await asyncio.gather(*(writer.write([record]) for record in records))
+    ) == 3
+    assert connection.max_transactions == 3
@@ -0,0 +1,392 @@
+"""
+Module for writing monitoring records to PostgreSQL in batches
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional, Dict, Sequence, Set, Tuple
+
+import asyncpg
+from loguru import logger
+
+from consumer.metrics import (
+    DB_INSERT_DURATION,
+    DB_BATCH_SIZE,
+    DB_ERRORS,
+    DB_DUPLICATES,
+    ANOMALIES,
+    RECORDS_EXPIRED,
+)
+from consumer.alerts import AlertEngine
+from consumer.baselines import Baseline, BaselineStore
+from consumer.dimensions import DimensionCache, sites_cache, error_kinds_cache
+from consumer.history import HistoryStore
+from consumer.offsets import OffsetManager
+from consumer.partitions import (
+    DEFAULT_RETENTION_DAYS,
+    MAINTENANCE_LOCK_ID,
+    create_partition_sql,
+    record_day,
+    today,
+)
+from consumer.records import (
+    CHECK_ID,
+    ERROR,
+    IS_ALIVE,
+    LOAD_TIME,
+    REQUEST_TIME,
+    URL,
+    Message,
+    Record,
+    Row,
+    ScoredRow,
+)
+from consumer.rollups import update_rollups
+from consumer.status import SiteStatus, StatusCache
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_LINGER = 0.2
+DEFAULT_RETRIES = 5
+DEFAULT_RETRY_DELAY = 0.5
+DEFAULT_RECENT_IDS = 100000
+
+MONITORING_TABLE = "monitoring"
+STAGING_TABLE = "monitoring_staging"
+# urls and errors are stored as identifiers of the sites and error_kinds tables
+MONITORING_COLUMNS = (
+    "site_id",
+    "load_time",
+    "status_code",
+    "is_alive",
+    "error_id",
+    "request_date",
+    "check_id",
+    "anomaly_score",
+)
+# every connection of the pool has its own staging table, rows are copied to it and
+# merged into the monitoring table skipping duplicates
+CREATE_STAGING_TABLE = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DELETE ROWS AS
+        SELECT {", ".join(MONITORING_COLUMNS)} FROM {MONITORING_TABLE} WITH NO DATA
+"""
+MERGE_STAGING_TABLE = f"""
+    INSERT INTO {MONITORING_TABLE} ({", ".join(MONITORING_COLUMNS)})
+    SELECT {", ".join(MONITORING_COLUMNS)} FROM {STAGING_TABLE}
+    ON CONFLICT DO NOTHING
+    RETURNING site_id, load_time, status_code, is_alive, error_id, request_date
+"""
+# errors caused by the content of a record, retrying such a batch does not help
+# COPY raises encoder errors of invalid values as they are
+RECORD_ERRORS = (
+    asyncpg.exceptions.DataError,
+    asyncpg.exceptions.IntegrityConstraintViolationError,
+    ValueError,
+    OverflowError,
+    TypeError,
+)
+
+
+async def collect_batch(
+    queue: asyncio.Queue, batch_size: int, batch_linger: float
+) -> list:
+    """
+    Wait for an item and collect a batch until it is full or the linger time is over
+    """
+    loop = asyncio.get_event_loop()
+    batch = [await queue.get()]
+    deadline = loop.time() + batch_linger
+    while len(batch) < batch_size:
+        try:
+            batch.append(queue.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+class RecentIds:
+    """
+    RecentIds keeps the most recent check identifiers
+
+    Attributes:
+       size: A maximum number of identifiers, the oldest ones are removed
+    """
+
+    def __init__(self, size: int = DEFAULT_RECENT_IDS) -> None:
+        self.size = size
+        # dictionaries keep the insertion order, the first key is the oldest one
+        self._ids: Dict[str, None] = {}
+
+    def __contains__(self, check_id: str) -> bool:
+        return check_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, check_id: str) -> None:
+        """
+        adds an identifier and removes the oldest one if the cache is full
+        """
+        ids = self._ids
+        if check_id in ids:
+            return
+        ids[check_id] = None
+        if len(ids) > self.size:
+            del ids[next(iter(ids))]
+
+
+@dataclass
+class DatabaseWriter:
+    """
+    DatabaseWriter writes records with COPY
+
+    A failed batch is retried, a batch rejected because of an invalid record is split
+    in halves until the invalid record is found, so valid records are still written.
+    Writes are idempotent: records are copied to a staging table and merged into the
+    monitoring table skipping check identifiers which are already written. Recently
+    written identifiers are cached to skip obvious duplicates before the database.
+    Urls and errors are replaced with identifiers of dimension tables. Rollups and
+    statuses of sites are updated with the written rows in the same transaction, so
+    they count every check once. Checks are scored against latency baselines of their
+    sites, the score is written with the check. Statuses and baselines in memory are
+    updated as soon as they are computed, so concurrent batches do not start from the
+    same state and are still copied in parallel.
+
+    Attributes:
+       pool: A connection pool, connections should be set up by ``init_connection``
+       retries: A number of retries of a batch failed with a database error
+       retry_delay: A delay before the first retry, it doubles on every retry
+       recent_ids: Recently written check identifiers
+       sites: A cache of site identifiers
+       error_kinds: A cache of error identifiers
+       rollups: Whether rollups are updated
+       status: Current statuses of sites, they are not kept if None
+       history: Recent checks of sites, they are not kept if None
+       baselines: Latency baselines of sites, checks are not scored if None
+       alerts: Alert rules evaluated on written rows, they are not evaluated if None
+       partitions: Whether partitions of days of records are created
+       retention_days: Records older than the retention period are skipped, their
+          partitions are dropped by the maintenance
+    """
+
+    pool: asyncpg.pool.Pool
+    retries: int = DEFAULT_RETRIES
+    retry_delay: float = DEFAULT_RETRY_DELAY
+    recent_ids: RecentIds = field(default_factory=RecentIds)
+    sites: DimensionCache = field(default_factory=sites_cache)
+    error_kinds: DimensionCache = field(default_factory=error_kinds_cache)
+    rollups: bool = True
+    status: Optional[StatusCache] = field(default_factory=StatusCache)
+    history: Optional[HistoryStore] = None
+    baselines: Optional[BaselineStore] = field(default_factory=BaselineStore)
+    alerts: Optional[AlertEngine] = None
+    partitions: bool = True
+    retention_days: int = DEFAULT_RETENTION_DAYS
+    _partition_days: Set[date] = field(default_factory=set, init=False)
+
+    @staticmethod
+    async def init_connection(connection: asyncpg.Connection) -> None:
+        """
+        creates the staging table of a new pool connection
+        """
+        await connection.execute(CREATE_STAGING_TABLE)
+
+    async def to_rows(self, records: List[Record]) -> List[Row]:
+        """
+        replaces urls and errors of records with their identifiers
+        """
+        async with self.pool.acquire() as connection:
+            site_ids = await self.sites.resolve(
+                connection, (record[URL] for record in records)
+            )
+            error_ids = await self.error_kinds.resolve(
+                connection, (record[ERROR] for record in records)
+            )
+        return [
+            (site_ids[record[URL]], *record[URL + 1 : ERROR])
+            + (error_ids.get(record[ERROR]), *record[ERROR + 1 :])  # type: ignore
+            for record in records
+        ]
+
+    async def ensure_partitions(self, rows: Sequence[ScoredRow]) -> None:
+        """
+        creates missing partitions of days of rows
+        """
+        days = {record_day(row[REQUEST_TIME]) for row in rows} - self._partition_days
+        if not days:
+            return
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                # partitions are not created while the maintenance drops them
+                await connection.execute(
+                    "SELECT pg_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID
+                )
+                for day in sorted(days):
+                    await connection.execute(create_partition_sql(day))
+        self._partition_days.update(days)
+
+    def _skip_expired(self, records: List[Record]) -> List[Record]:
+        oldest = today() - timedelta(days=self.retention_days)
+        fresh = [
+            record for record in records if record_day(record[REQUEST_TIME]) >= oldest
+        ]
+        if len(fresh) < len(records):
+            RECORDS_EXPIRED.inc(len(records) - len(fresh))
+            logger.warning(
+                "skip {} records older than the retention period of {} days",
+                len(records) - len(fresh),
+                self.retention_days,
+            )
+        return fresh
+
+    async def _copy(self, records: List[ScoredRow]) -> int:
+        statuses: List[SiteStatus] = []
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.copy_records_to_table(
+                    STAGING_TABLE, records=records, columns=MONITORING_COLUMNS
+                )
+                inserted = await connection.fetch(MERGE_STAGING_TABLE)
+                if self.rollups:
+                    await update_rollups(connection, inserted)
+                if self.status is not None:
+                    # the cache is updated at once, so concurrent batches do not
+                    # start from the same status
+                    statuses = self.status.apply(
+                        self.status.prepare(inserted, self.sites.value)
+                    )
+                    await self.status.save(connection, statuses)
+        if self.history is not None:
+            self.history.add(inserted)
+        if self.alerts is not None:
+            self.alerts.process(inserted, self.sites.value)
+        return len(inserted)
+
+    def _score(self, rows: List[Row]) -> Tuple[List[ScoredRow], Dict[int, Baseline]]:
+        if self.baselines is None:
+            return [(*row, None) for row in rows], {}
+        scores, baselines = self.baselines.prepare(
+            (row[URL], row[LOAD_TIME], row[IS_ALIVE], row[REQUEST_TIME]) for row in rows
+        )
+        # the store is updated at once, so retries and concurrent batches do not
+        # score checks against the same baseline twice
+        baselines = self.baselines.apply(baselines)
+        ANOMALIES.inc(self.baselines.anomalies(scores))
+        return [(*row, score) for row, score in zip(rows, scores)], baselines
+
+    async def _copy_with_retry(self, records: List[ScoredRow]) -> int:
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                inserted = await self._copy(records)
+            except RECORD_ERRORS:
+                raise
+            except Exception as err:  # pylint: disable=broad-except
+                DB_ERRORS.labels(type(err).__name__).inc()
+                if attempt == self.retries:
+                    raise
+                logger.warning(
+                    "cannot write {} records ({}), retry in {}s", len(records), err, delay
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+            else:
+                DB_INSERT_DURATION.observe(time.perf_counter() - start)
+                DB_BATCH_SIZE.observe(len(records))
+                DB_DUPLICATES.inc(len(records) - inserted)
+                return inserted
+        return 0
+
+    async def _write(
+        self, records: List[ScoredRow], refreshed: bool = False
+    ) -> int:
+        try:
+            return await self._copy_with_retry(records)
+        except RECORD_ERRORS as err:
+            if (
+                self.partitions
+                and not refreshed
+                and isinstance(err, asyncpg.exceptions.CheckViolationError)
+            ):
+                # a known partition may be dropped or detached by the archive
+                self._partition_days.clear()
+                await self.ensure_partitions(records)
+                return await self._write(records, refreshed=True)
+            if len(records) == 1:
+                DB_ERRORS.labels(type(err).__name__).inc()
+                logger.error("skip invalid record {} - {}", records[0], err)
+                return 0
+            middle = len(records) // 2
+            return await self._write(records[:middle], refreshed) + await self._write(
+                records[middle:], refreshed
+            )
+
+    async def write(self, records: List[Record]) -> int:
+        """
+        writes records and returns the number of written records
+
+        An error is raised if the batch cannot be written after all retries.
+        """
+        recent_ids = self.recent_ids
+        fresh: Dict[str, Record] = {}
+        for record in records:
+            check_id = record[CHECK_ID]
+            if check_id not in recent_ids and check_id not in fresh:
+                fresh[check_id] = record
+        DB_DUPLICATES.inc(len(records) - len(fresh))
+        new_records = list(fresh.values())
+        if self.partitions:
+            new_records = self._skip_expired(new_records)
+        if not new_records:
+            return 0
+        rows, baselines = self._score(await self.to_rows(new_records))
+        if self.partitions:
+            await self.ensure_partitions(rows)
+        written = await self._write(rows)
+        if baselines:
+            async with self.pool.acquire() as connection:
+                await self.baselines.save(connection, baselines)
+        for check_id in fresh:
+            recent_ids.add(check_id)
+        return written
+
+
+async def run_writer(
+    worker_id: int,
+    queue: asyncio.Queue[Message],
+    writer: DatabaseWriter,
+    offsets: OffsetManager,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batch_linger: float = DEFAULT_BATCH_LINGER,
+) -> None:
+    """
+    Collect messages from the queue, write them in batches and commit their offsets
+    """
+    while True:
+        batch = await collect_batch(queue, batch_size, batch_linger)
+        records = [record for _, _, record in batch]
+        while True:
+            try:
+                written = await writer.write(records)
+                break
+            except Exception as err:  # pylint: disable=broad-except
+                # offsets are not committed until the batch is written
+                logger.error(f"[{worker_id}] cannot write a batch, {err}")
+                await asyncio.sleep(writer.retry_delay)
+        logger.debug(f"[{worker_id}] {written} of {len(batch)} records written")
+        offsets.ack_many((partition, offset) for partition, offset, _ in batch)
+        await offsets.commit()
+        for _ in batch:
+            queue.task_done()
@@ -0,0 +1,55 @@
+"""
+This module represents in-memory caches
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class LRUCache:
+    """
+    LRUCache keeps recently used values for a limited time
+
+    Attributes:
+       size: A maximum number of values, the least recently used one is removed
+       ttl: A time in seconds while a value is fresh, values do not expire by default
+    """
+
+    def __init__(self, size: int = DEFAULT_CACHE_SIZE, ttl: float = math.inf):
+        self.size = size
+        self.ttl = ttl
+        self._values: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        returns a fresh value, None if there is no such value
+        """
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.ttl:
+            del self._values[key]
+            return None
+        self._values.move_to_end(key)
+        return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        adds a value
+        """
+        self._values[key] = (time.monotonic(), value)
+        self._values.move_to_end(key)
+        if len(self._values) > self.size:
+            self._values.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        removes a value
+        """
+        self._values.pop(key, None)
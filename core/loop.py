@@ -0,0 +1,30 @@
+"""
+This module represents the event loop selection
+"""
+import asyncio
+
+from loguru import logger
+
+LOOP_ASYNCIO = "asyncio"
+LOOP_UVLOOP = "uvloop"
+LOOP_TYPES = (LOOP_ASYNCIO, LOOP_UVLOOP)
+DEFAULT_LOOP = LOOP_ASYNCIO
+
+
+def new_event_loop(loop_type: str = DEFAULT_LOOP) -> asyncio.AbstractEventLoop:
+    """
+    Returns a new event loop of the type
+
+    uvloop is an optional dependency, the default asyncio loop is used if it is not
+    installed.
+    """
+    if loop_type not in LOOP_TYPES:
+        raise ValueError(f"unknown event loop type {loop_type}")
+    if loop_type == LOOP_UVLOOP:
+        try:
+            import uvloop  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            logger.warning("uvloop is not installed, using the asyncio event loop")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
@@ -0,0 +1,309 @@
+"""
+This module represents runtime metrics exposed in the Prometheus text format
+
+The implementation has no dependencies: metrics are kept in plain python objects
+and served by a tiny asyncio HTTP server.
+"""
+import asyncio
+import math
+from bisect import bisect_left
+from typing import Dict, Tuple, Callable, Optional, Sequence, List, Any
+
+from loguru import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_METRICS_HOST = "0.0.0.0"
+DEFAULT_LOOP_LAG_INTERVAL = 1.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """
+    Registry keeps metrics and renders them
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        """
+        register adds a metric to the registry
+        """
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        returns metrics in the Prometheus text format
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """
+    Base class for metrics
+
+    Attributes:
+       name: A metric name
+       documentation: A metric description
+       labelnames: Names of metric labels
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        registry.register(self)
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError()
+
+    def labels(self, *values: Any) -> Any:
+        """
+        returns a child metric for the label values
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> List[str]:
+        """
+        returns sample lines of the metric
+        """
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} "
+            f"{_format_value(child.get())}"
+            for key, child in self._children.items()
+        ]
+
+
+class _Value:
+    __slots__ = ("value", "function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Counter(Metric):
+    """
+    Counter is a monotonically increasing value
+    """
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        increases the counter
+        """
+        self._default.value += amount
+
+
+class Gauge(Metric):
+    """
+    Gauge is a value that can go up and down
+    """
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        increases the gauge
+        """
+        self._default.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        """
+        decreases the gauge
+        """
+        self._default.value -= amount
+
+    def set(self, value: float) -> None:
+        """
+        sets the gauge value
+        """
+        self._default.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        the gauge value is computed by the function on every scrape
+        """
+        self._default.function = function
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # a single binary search and two additions, cheap for the hot path
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """
+    Histogram counts observations in the fixed buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """
+        adds an observation
+        """
+        self._default.observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames + ("le",), key + (_format_value(float(bound)),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between the scheduled and the actual wake up of the event loop",
+)
+
+
+async def monitor_loop_lag(interval: float = DEFAULT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Periodically measure the event loop lag
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0.0))
+
+
+async def _handle_request(
+    registry: Registry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        return
+    request_line = request.split(b"\r\n", 1)[0].split()
+    path = request_line[1].split(b"?", 1)[0] if len(request_line) > 1 else b""
+    if path == b"/metrics":
+        status, body = "200 OK", registry.render().encode()
+    else:
+        status, body = "404 Not Found", b"not found\n"
+    writer.write(
+        f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(
+    host: str, port: int, registry: Registry = REGISTRY
+) -> asyncio.AbstractServer:
+    """
+    Start an HTTP server which serves metrics on the /metrics path
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_request(registry, reader, writer), host, port
+    )
+    logger.info("Serving metrics on http://{}:{}/metrics", host, port)
+    return server
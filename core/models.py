@@ -2,9 +2,10 @@
 This module represents a site status
 """
 import json
-from dataclasses import dataclass
+import uuid
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import TypeVar, Optional, Dict, Any
+from typing import TypeVar, Optional, Dict, Any, List
 
 from core.utils import JSONEncoder
 
@@ -23,18 +24,34 @@ class Response:
     status_code: Optional[int] = None
     load_time: Optional[float] = None
     body: Optional[str] = None
+    # a stable identifier of the check result, consumers use it to skip duplicates
+    check_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # a number of followed redirects and load times of requests of the redirect chain
+    redirects: int = 0
+    hop_times: Optional[List[float]] = None
+    # the peer certificate of a TLS connection
+    cert_expires: Optional[datetime] = None
+    cert_issuer: Optional[str] = None
 
     def to_dict(self) -> Dict[str, Any]:
         """
         returns a dictionary representation of an object
         """
-        return {
+        result = {
             "url": self.url,
             "error": self.error,
             "status_code": self.status_code,
             "load_time": self.load_time,
             "request_time": self.request_time,
+            "check_id": self.check_id,
         }
+        if self.hop_times is not None:
+            result["redirects"] = self.redirects
+            result["hop_times"] = self.hop_times
+        if self.cert_expires is not None:
+            result["cert_expires"] = self.cert_expires
+            result["cert_issuer"] = self.cert_issuer
+        return result
 
     def json_dumps(self) -> str:
         """
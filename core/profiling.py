@@ -0,0 +1,265 @@
+"""
+This module represents the built-in profiling mode
+
+The sampling profiler reads the stack of the event loop thread from a background
+thread and periodically dumps collapsed stacks, the format consumed by flamegraph.pl,
+speedscope and similar tools. The stall detector measures every event loop callback
+and logs the callbacks which block the loop longer than a threshold.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Optional, Any, Tuple
+
+from loguru import logger
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_SAMPLE_INTERVAL = 0.01
+DEFAULT_DUMP_INTERVAL = 60
+DEFAULT_SLOW_CALLBACK_DURATION = 0.1
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _format_stack(frame: Optional[FrameType], limit: int = 10) -> str:
+    lines = []
+    while frame is not None and len(lines) < limit:
+        lines.append(f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return " <- ".join(lines)
+
+
+def describe_handle(handle: asyncio.Handle) -> str:
+    """
+    returns a coroutine or a callback behind an event loop handle
+    """
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        frame = getattr(coro, "cr_frame", None)
+        location = (
+            f" at {frame.f_code.co_filename}:{frame.f_lineno}" if frame else ""
+        )
+        name = getattr(coro, "__qualname__", repr(coro))
+        return f"task {owner.get_name()} coroutine {name}{location}"
+    return repr(handle)
+
+
+class SamplingProfiler:
+    """
+    SamplingProfiler samples a thread stack and writes collapsed stacks
+
+    Attributes:
+       output_dir: A directory for profile dumps
+       interval: A sampling interval in seconds
+       dump_interval: A period of writing dumps in seconds
+       thread_id: An identifier of the sampled thread, the current thread by default
+    """
+
+    def __init__(
+        self,
+        output_dir: str = DEFAULT_PROFILE_DIR,
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+        dump_interval: float = DEFAULT_DUMP_INTERVAL,
+        thread_id: Optional[int] = None,
+    ) -> None:
+        self.output_dir = output_dir
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.thread_id = thread_id or threading.get_ident()
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        starts the sampling thread
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info("Sampling profiler writes dumps to {}", self.output_dir)
+
+    def stop(self) -> None:
+        """
+        stops the sampling thread and writes the last dump
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dump()
+
+    def sample(self) -> None:
+        """
+        records the current stack of the sampled thread
+        """
+        frame = sys._current_frames().get(  # pylint: disable=protected-access
+            self.thread_id
+        )
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def dump(self) -> Optional[str]:
+        """
+        writes collected stacks to a new file and resets them
+        """
+        if not self._stacks:
+            return None
+        stacks, self._stacks = self._stacks, Counter()
+        file_name = os.path.join(
+            self.output_dir,
+            f"profile-{os.getpid()}-{datetime.now():%Y%m%d%H%M%S%f}.folded",
+        )
+        with open(file_name, "w") as file_obj:
+            for stack, count in stacks.most_common():
+                file_obj.write(f"{stack} {count}\n")
+        logger.info("Profile dump written to {}", file_name)
+        return file_name
+
+    def _run(self) -> None:
+        last_dump = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() - last_dump >= self.dump_interval:
+                self.dump()
+                last_dump = time.monotonic()
+
+
+class SlowCallbackDetector:
+    """
+    SlowCallbackDetector logs event loop callbacks running longer than a threshold
+
+    It works like the ``slow_callback_duration`` of the asyncio debug mode, without the
+    debug mode overhead. A watchdog thread logs the stack of a callback which is
+    still blocking the loop, so long stalls are reported before they end.
+
+    Attributes:
+       threshold: A callback duration in seconds considered as a stall
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SLOW_CALLBACK_DURATION) -> None:
+        self.threshold = threshold
+        self.thread_id = threading.get_ident()
+        self._original_run: Any = None
+        self._running: Optional[Tuple[asyncio.Handle, float]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        patches the event loop handles and starts the watchdog
+
+        Other event loops (uvloop) do not run asyncio handles, slow callbacks of them
+        are logged by the debug mode of the loop.
+        """
+        if loop is not None and not isinstance(loop, asyncio.BaseEventLoop):
+            logger.warning(
+                "The stall detector does not support {}, slow callbacks are logged "
+                "by the event loop debug mode",
+                type(loop).__name__,
+            )
+            loop.slow_callback_duration = self.threshold
+            loop.set_debug(True)
+            return
+        original_run = self._original_run = asyncio.events.Handle._run
+        detector = self
+
+        def _run(handle: asyncio.Handle) -> None:
+            start = time.perf_counter()
+            detector._running = (handle, start)
+            try:
+                original_run(handle)
+            finally:
+                detector._running = None
+                duration = time.perf_counter() - start
+                if duration >= detector.threshold:
+                    logger.warning(
+                        "Event loop blocked for {:.3f}s by {}",
+                        duration,
+                        describe_handle(handle),
+                    )
+
+        asyncio.events.Handle._run = _run  # type: ignore
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="stall-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def uninstall(self) -> None:
+        """
+        restores the event loop handles and stops the watchdog
+        """
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run  # type: ignore
+            self._original_run = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold):
+            running = self._running
+            if running is None or running is reported:
+                continue
+            handle, start = running
+            duration = time.perf_counter() - start
+            if duration < self.threshold:
+                continue
+            reported = running
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                self.thread_id
+            )
+            logger.warning(
+                "Event loop is blocked for {:.3f}s so far by {} in {}",
+                duration,
+                describe_handle(handle),
+                _format_stack(frame),
+            )
+
+
+class Profiler:
+    """
+    Profiler runs the sampling profiler and the stall detector together
+    """
+
+    def __init__(
+        self,
+        output_dir: str = DEFAULT_PROFILE_DIR,
+        slow_callback_duration: float = DEFAULT_SLOW_CALLBACK_DURATION,
+    ) -> None:
+        self.sampler = SamplingProfiler(output_dir)
+        self.detector = SlowCallbackDetector(slow_callback_duration)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        starts profiling of the current thread running the loop
+        """
+        self.sampler.start()
+        self.detector.install(loop)
+
+    def stop(self) -> None:
+        """
+        stops profiling and writes the last dump
+        """
+        self.detector.uninstall()
+        self.sampler.stop()
@@ -1,5 +1,6 @@
 """
-This module represents a source readers
+This module represents a source readers, they read sites of the monitoring and alert
+rules of the consumer
 """
 import json
 from typing import List, Dict, Any, ClassVar
@@ -0,0 +1,20 @@
+import time
+
+from core.cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+    cache.pop("a")
+    assert cache.get("a") is None
+
+    cache = LRUCache(ttl=0)
+    cache.set("a", 1)
+    time.sleep(0.001)
+    assert cache.get("a") is None
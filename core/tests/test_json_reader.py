@@ -3,9 +3,11 @@ import re
 from json.decoder import JSONDecodeError
 
 import pytest
+import trafaret as t
 
-from monitoring.reader import JSONFileReader
-from monitoring.schema import FILE_SCHEMA
+from core.reader import JSONFileReader
+
+FILE_SCHEMA = t.List(t.Dict({"url": t.URL, "regexp_pattern": t.String & re.compile}))
 
 
 def test_read_invalid_file_type(tmpdir):
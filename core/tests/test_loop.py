@@ -0,0 +1,29 @@
+import asyncio
+import builtins
+
+import pytest
+
+from core.loop import new_event_loop, LOOP_ASYNCIO, LOOP_UVLOOP
+
+
+def test_new_event_loop():
+    loop = new_event_loop(LOOP_ASYNCIO)
+    assert isinstance(loop, asyncio.AbstractEventLoop)
+    loop.close()
+
+    with pytest.raises(ValueError):
+        new_event_loop("trio")
+
+
+def test_uvloop_fallback(monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "uvloop":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+    loop = new_event_loop(LOOP_UVLOOP)
+    assert type(loop).__module__.startswith("asyncio")
+    loop.close()
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from core.metrics import Registry, Counter, Gauge, Histogram, start_metrics_server
+
+
+def test_render():
+    registry = Registry()
+    counter = Counter("checks_total", "checks", ("error",), registry=registry)
+    gauge = Gauge("in_flight", "in flight", registry=registry)
+    histogram = Histogram(
+        "duration_seconds", "duration", registry=registry, buckets=(0.1, 1.0)
+    )
+    counter.labels("TimeoutError").inc()
+    counter.labels("TimeoutError").inc()
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    result = registry.render()
+    assert "# TYPE checks_total counter" in result
+    assert 'checks_total{error="TimeoutError"} 2' in result
+    assert "in_flight 1" in result
+    assert 'duration_seconds_bucket{le="0.1"} 1' in result
+    assert 'duration_seconds_bucket{le="1"} 2' in result
+    assert 'duration_seconds_bucket{le="+Inf"} 3' in result
+    assert "duration_seconds_count 3" in result
+    assert "duration_seconds_sum 5.6" in result
+
+    gauge.set_function(lambda: 42)
+    assert "in_flight 42" in registry.render()
+
+    with pytest.raises(ValueError):
+        counter.labels()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    registry = Registry()
+    Counter("requests_total", "requests", registry=registry).inc()
+    server = await start_metrics_server("127.0.0.1", 0, registry)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert b"requests_total 1" in response
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        assert response.startswith(b"HTTP/1.1 404")
+    finally:
+        server.close()
@@ -15,6 +15,7 @@ def test_model():
     assert obj.ok
     assert obj.to_dict()["url"] == "https://google.com"
     assert obj.to_dict()["load_time"] == 0.23
+    assert len(obj.to_dict()["check_id"]) == 32
 
     assert isinstance(obj.json_dumps(), str)
 
@@ -27,3 +28,4 @@ def test_model():
         body=None,
     )
     assert not error_status.ok
+    assert error_status.check_id != obj.check_id
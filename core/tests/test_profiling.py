@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from loguru import logger
+
+from core.profiling import SamplingProfiler, SlowCallbackDetector
+
+
+def test_sampling_profiler(tmpdir):
+    profiler = SamplingProfiler(str(tmpdir))
+    profiler.sample()
+    profiler.sample()
+    file_name = profiler.dump()
+    with open(file_name) as file_obj:
+        lines = file_obj.read().splitlines()
+    assert len(lines) == 1
+    stack, count = lines[0].rsplit(" ", 1)
+    assert count == "2"
+    assert "test_sampling_profiler" in stack
+    assert profiler.dump() is None
+
+
+def test_slow_callback_detector():
+    messages = []
+    handler_id = logger.add(messages.append, level="WARNING")
+
+    async def blocker():
+        await asyncio.sleep(0)
+        time.sleep(0.1)
+
+    detector = SlowCallbackDetector(threshold=0.05)
+    detector.install()
+    try:
+        asyncio.run(blocker())
+    finally:
+        detector.uninstall()
+        logger.remove(handler_id)
+    assert any("coroutine test_slow_callback_detector.<locals>.blocker" in m for m in messages)
+    assert any("Event loop blocked for" in m for m in messages)
+
+
+class OtherLoop:
+    slow_callback_duration = 0.1
+    debug = False
+
+    def set_debug(self, enabled):
+        self.debug = enabled
+
+
+def test_slow_callback_detector_falls_back_to_debug_mode():
+    loop = OtherLoop()
+    original_run = asyncio.events.Handle._run
+    detector = SlowCallbackDetector(threshold=0.05)
+    detector.install(loop)
+    try:
+        assert asyncio.events.Handle._run is original_run
+        assert detector._thread is None
+        assert loop.debug
+        assert loop.slow_callback_duration == 0.05
+    finally:
+        detector.uninstall()
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+MAIN = Path(__file__).parents[2] / "main.py"
+HEAVY_MODULES = {"aiohttp", "aiokafka", "asyncpg", "trafaret"}
+
+
+def _import_times(*args):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(MAIN), *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.rstrip()[1:]] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("args", [("--help",), ("init-migration", "--help")])
+def test_light_commands_skip_heavy_imports(args):
+    times = _import_times(*args)
+    imported = {name.strip().split(".")[0] for name in times}
+    assert not imported & HEAVY_MODULES
+
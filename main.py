@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
-"""See the docstring to main()."""
+"""See the docstring to main().
+
+Commands import their dependencies when they run, so ``--help`` and light commands
+do not pay for importing aiohttp, aiokafka, asyncpg and trafaret.
+"""
+from datetime import datetime
 from pathlib import Path
+from typing import Optional, Tuple
 
 import click
 
-from monitoring.processor import run_app as run_monitoring
-from consumer.consumer import run_app as run_consumer
-from consumer.migrations.init import run as run_migration
+from core.loop import DEFAULT_LOOP, LOOP_TYPES
+from core.metrics import DEFAULT_METRICS_HOST
+from core.profiling import DEFAULT_PROFILE_DIR, DEFAULT_SLOW_CALLBACK_DURATION
 
 CURRENT_DIR = Path(__file__).parent
 
@@ -25,11 +31,19 @@ def main():
             --kafka_ssl_cafile CA certificate \n
             --kafka_ssl_certfile access certificate \n
             --kafka_ssl_keyfile access key \n
+            --metrics_host host of the metrics endpoint \n
+            --metrics_port port of the metrics endpoint (disabled if not set) \n
+            --profile run the sampling profiler and the stall detector \n
+            --profile_dir directory for profile dumps \n
+            --slow_callback_duration report callbacks blocking the loop longer \n
+            --loop event loop implementation (asyncio or uvloop) \n
             --debug run application in the debug mode \n
 
         consumer Service for storing monitoring data \n
             --kafka_servers kafka bootstrap_servers \n
             --kafka_topic kafka topic \n
+            --kafka_group_id consumer group, processes of a group split partitions \n
+            --kafka_client_id kafka client id \n
             --kafka_ssl_cafile CA certificate \n
             --kafka_ssl_certfile access certificate \n
             --kafka_ssl_keyfile access key \n
@@ -39,6 +53,50 @@ def main():
             --postgres_user PostgreSQL user \n
             --postgres_password PostgreSQL password \n
             --postgres_ssl use PostgreSQL ssl connection \n
+            --batch_size max number of rows written at once \n
+            --batch_linger max time to wait for a full batch (seconds) \n
+            --high_water messages in flight which pause fetching from Kafka \n
+            --low_water messages in flight which resume fetching from Kafka \n
+            --retention_days days of data to keep, older checks are skipped \n
+            --premake_days days of partitions created ahead of time \n
+            --metrics_host host of the metrics endpoint \n
+            --metrics_port port of the metrics endpoint (disabled if not set) \n
+            --api_host host of the read API \n
+            --api_port port of the read API (disabled if not set) \n
+            --alert_rules JSON file of alert rules (alerting disabled if not set) \n
+            --alert_webhook URL receiving alerts as JSON \n
+            --alert_file file receiving alerts, a JSON document per line \n
+            --profile run the sampling profiler and the stall detector \n
+            --profile_dir directory for profile dumps \n
+            --slow_callback_duration report callbacks blocking the loop longer \n
+            --loop event loop implementation (asyncio or uvloop) \n
+            --debug run application in the debug mode \n
+
+        all-in-one runs the monitoring and the consumer without Kafka \n
+            --source-file filepath to the source file \n
+            --postgres_host PostgreSQL hostname \n
+            --postgres_port PostgreSQL port \n
+            --postgres_db PostgreSQL database \n
+            --postgres_user PostgreSQL user \n
+            --postgres_password PostgreSQL password \n
+            --postgres_ssl use PostgreSQL ssl connection \n
+            --batch_size max number of rows written at once \n
+            --batch_linger max time to wait for a full batch (seconds) \n
+            --high_water messages in flight which pause the monitoring \n
+            --low_water messages in flight which resume the monitoring \n
+            --retention_days days of data to keep, older checks are skipped \n
+            --premake_days days of partitions created ahead of time \n
+            --metrics_host host of the metrics endpoint \n
+            --metrics_port port of the metrics endpoint (disabled if not set) \n
+            --api_host host of the read API \n
+            --api_port port of the read API (disabled if not set) \n
+            --alert_rules JSON file of alert rules (alerting disabled if not set) \n
+            --alert_webhook URL receiving alerts as JSON \n
+            --alert_file file receiving alerts, a JSON document per line \n
+            --profile run the sampling profiler and the stall detector \n
+            --profile_dir directory for profile dumps \n
+            --slow_callback_duration report callbacks blocking the loop longer \n
+            --loop event loop implementation (asyncio or uvloop) \n
             --debug run application in the debug mode \n
 
         init-migration runs an init migration \n
@@ -48,11 +106,63 @@ def main():
             --postgres_user PostgreSQL user \n
             --postgres_password PostgreSQL password \n
             --postgres_ssl use PostgreSQL ssl connection \n
+            --retention_days days of data to keep, older checks are skipped \n
+            --premake_days days of partitions created ahead of time \n
+
+        history prints availability and latency of a site in time buckets \n
+            --url site url \n
+            --start start of the range (UTC), a day before the end by default \n
+            --end end of the range (UTC), now by default \n
+            --bucket bucket width (seconds) \n
+            --postgres_host PostgreSQL hostname \n
+            --postgres_port PostgreSQL port \n
+            --postgres_db PostgreSQL database \n
+            --postgres_user PostgreSQL user \n
+            --postgres_password PostgreSQL password \n
+            --postgres_ssl use PostgreSQL ssl connection \n
+
+        archive writes closed days of monitoring data to columnar files \n
+            --archive_dir directory of archive files \n
+            --start first day (the oldest partition by default) \n
+            --end day after the last one, today at most (today by default) \n
+            --cleanup keep, detach or drop partitions of archived days \n
+            --chunk_rows rows fetched and written at once \n
+            --postgres_host PostgreSQL hostname \n
+            --postgres_port PostgreSQL port \n
+            --postgres_db PostgreSQL database \n
+            --postgres_user PostgreSQL user \n
+            --postgres_password PostgreSQL password \n
+            --postgres_ssl use PostgreSQL ssl connection \n
+
+        replay writes check results of files or Kafka again \n
+            --file JSON lines file of messages, can be repeated \n
+            --kafka_servers kafka bootstrap_servers (if no files are given) \n
+            --kafka_topic kafka topic \n
+            --kafka_partition partition to replay, can be repeated (all by default) \n
+            --start_offset first offset (the beginning by default) \n
+            --end_offset offset after the last one (the end by default) \n
+            --kafka_ssl_cafile CA certificate \n
+            --kafka_ssl_certfile access certificate \n
+            --kafka_ssl_keyfile access key \n
+            --batch_size max number of rows written at once \n
+            --workers number of batches written in parallel \n
+            --rate max messages per second (unlimited if 0) \n
+            --retention_days days of data to keep, older checks are skipped \n
+            --postgres_host PostgreSQL hostname \n
+            --postgres_port PostgreSQL port \n
+            --postgres_db PostgreSQL database \n
+            --postgres_user PostgreSQL user \n
+            --postgres_password PostgreSQL password \n
+            --postgres_ssl use PostgreSQL ssl connection \n
 
     Example:\n
         >>> ./main.py monitoring --debug \n
         >>> ./main.py consumer --debug \n
         >>> ./main.py init-migration\n
+        >>> ./main.py all-in-one --api_port 8080\n
+        >>> ./main.py history --url https://google.com --bucket 300\n
+        >>> ./main.py archive --archive_dir archive --cleanup drop\n
+        >>> ./main.py replay --file results.jsonl --workers 4\n
     """
 
 
@@ -78,6 +188,28 @@ def main():
     "--kafka_ssl_keyfile",
     type=click.Path(exists=False, file_okay=True, dir_okay=False),
 )
+@click.option("--metrics_host", default=DEFAULT_METRICS_HOST, show_default=True)
+@click.option("--metrics_port", type=int, help="Serve metrics on this port")
+@click.option("--profile", default=False, show_default=True, is_flag=True)
+@click.option(
+    "--profile_dir",
+    default=DEFAULT_PROFILE_DIR,
+    show_default=True,
+    type=click.Path(file_okay=False, dir_okay=True),
+)
+@click.option(
+    "--slow_callback_duration",
+    default=DEFAULT_SLOW_CALLBACK_DURATION,
+    show_default=True,
+    help="Report callbacks blocking the event loop longer (seconds)",
+)
+@click.option(
+    "--loop",
+    "loop_type",
+    default=DEFAULT_LOOP,
+    show_default=True,
+    type=click.Choice(LOOP_TYPES),
+)
 @click.option("--debug", default=False, show_default=True, is_flag=True)
 def monitoring(
     source_file: str,
@@ -86,6 +218,12 @@ def monitoring(
     kafka_ssl_cafile: str,
     kafka_ssl_certfile: str,
     kafka_ssl_keyfile: str,
+    metrics_host: str,
+    metrics_port: int,
+    profile: bool,
+    profile_dir: str,
+    slow_callback_duration: float,
+    loop_type: str,
     debug: bool,
 ) -> None:
     """
@@ -99,6 +237,10 @@ def monitoring(
             "validator": <regexp>
         }
     """
+    from monitoring.processor import (  # pylint: disable=import-outside-toplevel
+        run_app as run_monitoring,
+    )
+
     click.echo("Starting monitoring service ...")
     run_monitoring(
         source_file,
@@ -107,6 +249,12 @@ def monitoring(
         kafka_ssl_cafile=kafka_ssl_cafile,
         kafka_ssl_certfile=kafka_ssl_certfile,
         kafka_ssl_keyfile=kafka_ssl_keyfile,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        profile=profile,
+        profile_dir=profile_dir,
+        slow_callback_duration=slow_callback_duration,
+        loop_type=loop_type,
         debug=debug,
     )
 
@@ -114,6 +262,8 @@ def monitoring(
 @click.command()
 @click.option("--kafka_servers", default="kafka:9093")
 @click.option("--kafka_topic", default="monitoring")
+@click.option("--kafka_group_id", default="my-group", show_default=True)
+@click.option("--kafka_client_id", default="client-storage", show_default=True)
 @click.option(
     "--kafka_ssl_cafile",
     type=click.Path(exists=False, file_okay=True, dir_okay=False),
@@ -132,10 +282,53 @@ def monitoring(
 @click.option("--postgres_user", default="demo")
 @click.option("--postgres_password", default="demopassword")
 @click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+@click.option("--batch_size", default=500, show_default=True)
+@click.option("--batch_linger", default=0.2, show_default=True)
+@click.option("--high_water", default=4000, show_default=True)
+@click.option("--low_water", default=2000, show_default=True)
+@click.option("--retention_days", default=30, show_default=True)
+@click.option("--premake_days", default=7, show_default=True)
+@click.option("--metrics_host", default=DEFAULT_METRICS_HOST, show_default=True)
+@click.option("--metrics_port", type=int, help="Serve metrics on this port")
+@click.option("--api_host", default="0.0.0.0", show_default=True)
+@click.option("--api_port", type=int, help="Serve the read API on this port")
+@click.option(
+    "--alert_rules",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Evaluate alert rules from this file",
+)
+@click.option("--alert_webhook", help="Post alerts to this URL")
+@click.option(
+    "--alert_file",
+    type=click.Path(dir_okay=False),
+    help="Append alerts to this file",
+)
+@click.option("--profile", default=False, show_default=True, is_flag=True)
+@click.option(
+    "--profile_dir",
+    default=DEFAULT_PROFILE_DIR,
+    show_default=True,
+    type=click.Path(file_okay=False, dir_okay=True),
+)
+@click.option(
+    "--slow_callback_duration",
+    default=DEFAULT_SLOW_CALLBACK_DURATION,
+    show_default=True,
+    help="Report callbacks blocking the event loop longer (seconds)",
+)
+@click.option(
+    "--loop",
+    "loop_type",
+    default=DEFAULT_LOOP,
+    show_default=True,
+    type=click.Choice(LOOP_TYPES),
+)
 @click.option("--debug", default=False, show_default=True, is_flag=True)
 def consumer(
     kafka_servers: str,
     kafka_topic: str,
+    kafka_group_id: str,
+    kafka_client_id: str,
     kafka_ssl_cafile: str,
     kafka_ssl_certfile: str,
     kafka_ssl_keyfile: str,
@@ -145,15 +338,38 @@ def consumer(
     postgres_user: str,
     postgres_password: str,
     postgres_ssl: bool,
+    batch_size: int,
+    batch_linger: float,
+    high_water: int,
+    low_water: int,
+    retention_days: int,
+    premake_days: int,
+    metrics_host: str,
+    metrics_port: int,
+    api_host: str,
+    api_port: int,
+    alert_rules: Optional[str],
+    alert_webhook: Optional[str],
+    alert_file: Optional[str],
+    profile: bool,
+    profile_dir: str,
+    slow_callback_duration: float,
+    loop_type: str,
     debug: bool,
 ) -> None:
     """
     Service reads data from Kafka and writes to the database
     """
+    from consumer.consumer import (  # pylint: disable=import-outside-toplevel
+        run_app as run_consumer,
+    )
+
     click.echo("Starting consumer service ...")
     run_consumer(
         kafka_servers=kafka_servers,
         kafka_topic=kafka_topic,
+        kafka_group_id=kafka_group_id,
+        kafka_client_id=kafka_client_id,
         kafka_ssl_cafile=kafka_ssl_cafile,
         kafka_ssl_certfile=kafka_ssl_certfile,
         kafka_ssl_keyfile=kafka_ssl_keyfile,
@@ -163,6 +379,143 @@ def consumer(
         postgres_user=postgres_user,
         postgres_password=postgres_password,
         postgres_ssl=postgres_ssl,
+        batch_size=batch_size,
+        batch_linger=batch_linger,
+        high_water=high_water,
+        low_water=low_water,
+        retention_days=retention_days,
+        premake_days=premake_days,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        api_host=api_host,
+        api_port=api_port,
+        alert_rules=alert_rules,
+        alert_webhook=alert_webhook,
+        alert_file=alert_file,
+        profile=profile,
+        profile_dir=profile_dir,
+        slow_callback_duration=slow_callback_duration,
+        loop_type=loop_type,
+        debug=debug,
+    )
+
+
+@click.command()
+@click.option(
+    "--source-file",
+    help="Read websites from this file",
+    default=str(CURRENT_DIR / "monitoring-sites.json"),
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+    show_default=True,
+)
+@click.option("--postgres_host", default="postgres")
+@click.option("--postgres_port", default=5432)
+@click.option("--postgres_db", default="monitoring")
+@click.option("--postgres_user", default="demo")
+@click.option("--postgres_password", default="demopassword")
+@click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+@click.option("--batch_size", default=500, show_default=True)
+@click.option("--batch_linger", default=0.2, show_default=True)
+@click.option("--high_water", default=4000, show_default=True)
+@click.option("--low_water", default=2000, show_default=True)
+@click.option("--retention_days", default=30, show_default=True)
+@click.option("--premake_days", default=7, show_default=True)
+@click.option("--metrics_host", default=DEFAULT_METRICS_HOST, show_default=True)
+@click.option("--metrics_port", type=int, help="Serve metrics on this port")
+@click.option("--api_host", default="0.0.0.0", show_default=True)
+@click.option("--api_port", type=int, help="Serve the read API on this port")
+@click.option(
+    "--alert_rules",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Evaluate alert rules from this file",
+)
+@click.option("--alert_webhook", help="Post alerts to this URL")
+@click.option(
+    "--alert_file",
+    type=click.Path(dir_okay=False),
+    help="Append alerts to this file",
+)
+@click.option("--profile", default=False, show_default=True, is_flag=True)
+@click.option(
+    "--profile_dir",
+    default=DEFAULT_PROFILE_DIR,
+    show_default=True,
+    type=click.Path(file_okay=False, dir_okay=True),
+)
+@click.option(
+    "--slow_callback_duration",
+    default=DEFAULT_SLOW_CALLBACK_DURATION,
+    show_default=True,
+    help="Report callbacks blocking the event loop longer (seconds)",
+)
+@click.option(
+    "--loop",
+    "loop_type",
+    default=DEFAULT_LOOP,
+    show_default=True,
+    type=click.Choice(LOOP_TYPES),
+)
+@click.option("--debug", default=False, show_default=True, is_flag=True)
+def all_in_one(
+    source_file: str,
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    postgres_ssl: bool,
+    batch_size: int,
+    batch_linger: float,
+    high_water: int,
+    low_water: int,
+    retention_days: int,
+    premake_days: int,
+    metrics_host: str,
+    metrics_port: int,
+    api_host: str,
+    api_port: int,
+    alert_rules: Optional[str],
+    alert_webhook: Optional[str],
+    alert_file: Optional[str],
+    profile: bool,
+    profile_dir: str,
+    slow_callback_duration: float,
+    loop_type: str,
+    debug: bool,
+) -> None:
+    """
+    Service checks sites and writes results to the database without Kafka
+    """
+    from consumer.embedded import (  # pylint: disable=import-outside-toplevel
+        run_app as run_embedded,
+    )
+
+    click.echo("Starting all-in-one service ...")
+    run_embedded(
+        source_file,
+        postgres_host,
+        postgres_port,
+        postgres_db,
+        postgres_user,
+        postgres_password,
+        postgres_ssl=postgres_ssl,
+        batch_size=batch_size,
+        batch_linger=batch_linger,
+        high_water=high_water,
+        low_water=low_water,
+        retention_days=retention_days,
+        premake_days=premake_days,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        api_host=api_host,
+        api_port=api_port,
+        alert_rules=alert_rules,
+        alert_webhook=alert_webhook,
+        alert_file=alert_file,
+        profile=profile,
+        profile_dir=profile_dir,
+        slow_callback_duration=slow_callback_duration,
+        loop_type=loop_type,
         debug=debug,
     )
 
@@ -174,6 +527,8 @@ def consumer(
 @click.option("--postgres_user", default="demo")
 @click.option("--postgres_password", default="demopassword")
 @click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+@click.option("--retention_days", default=30, show_default=True)
+@click.option("--premake_days", default=7, show_default=True)
 def init_migration(
     postgres_host: str,
     postgres_port: int,
@@ -181,10 +536,16 @@ def init_migration(
     postgres_user: str,
     postgres_password: str,
     postgres_ssl: bool,
+    retention_days: int,
+    premake_days: int,
 ) -> None:
     """
     runs init migration
     """
+    from consumer.migrations.init import (  # pylint: disable=import-outside-toplevel
+        run as run_migration,
+    )
+
     click.echo("runs a migration ...")
     run_migration(
         postgres_host,
@@ -193,12 +554,217 @@ def init_migration(
         postgres_user,
         postgres_password,
         postgres_ssl,
+        retention_days,
+        premake_days,
+    )
+
+
+@click.command()
+@click.option("--url", required=True)
+@click.option("--start", type=click.DateTime())
+@click.option("--end", type=click.DateTime())
+@click.option("--bucket", default=3600, show_default=True)
+@click.option("--postgres_host", default="postgres")
+@click.option("--postgres_port", default=5432)
+@click.option("--postgres_db", default="monitoring")
+@click.option("--postgres_user", default="demo")
+@click.option("--postgres_password", default="demopassword")
+@click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+def history(
+    url: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    bucket: int,
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    postgres_ssl: bool,
+) -> None:
+    """
+    prints the history of a site in time buckets
+    """
+    from consumer.postgres import (  # pylint: disable=import-outside-toplevel
+        pg_params,
+    )
+    from consumer.queries import (  # pylint: disable=import-outside-toplevel
+        run as run_query,
+    )
+
+    pg_connection_params = pg_params(
+        postgres_host,
+        postgres_port,
+        postgres_db,
+        postgres_user,
+        postgres_password,
+        postgres_ssl,
+    )
+    run_query(url, start, end, bucket, pg_connection_params)
+
+
+@click.command()
+@click.option(
+    "--archive_dir",
+    required=True,
+    type=click.Path(file_okay=False, dir_okay=True),
+)
+@click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--end", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option(
+    "--cleanup",
+    default="keep",
+    show_default=True,
+    type=click.Choice(["keep", "detach", "drop"]),
+    help="What to do with partitions of archived days",
+)
+@click.option("--chunk_rows", default=100000, show_default=True)
+@click.option("--postgres_host", default="postgres")
+@click.option("--postgres_port", default=5432)
+@click.option("--postgres_db", default="monitoring")
+@click.option("--postgres_user", default="demo")
+@click.option("--postgres_password", default="demopassword")
+@click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+def archive(
+    archive_dir: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    cleanup: str,
+    chunk_rows: int,
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    postgres_ssl: bool,
+) -> None:
+    """
+    writes closed days of monitoring data to columnar files
+    """
+    from consumer.archive import (  # pylint: disable=import-outside-toplevel
+        run as run_archive,
+    )
+    from consumer.postgres import (  # pylint: disable=import-outside-toplevel
+        pg_params,
+    )
+
+    pg_connection_params = pg_params(
+        postgres_host,
+        postgres_port,
+        postgres_db,
+        postgres_user,
+        postgres_password,
+        postgres_ssl,
+    )
+    run_archive(
+        archive_dir,
+        start.date() if start else None,
+        end.date() if end else None,
+        cleanup,
+        chunk_rows,
+        pg_connection_params,
+    )
+
+
+@click.command()
+@click.option(
+    "--file",
+    "file_names",
+    multiple=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+    help="Replay messages of this JSON lines file",
+)
+@click.option("--kafka_servers", default="kafka:9093")
+@click.option("--kafka_topic", default="monitoring")
+@click.option("--kafka_partition", "kafka_partitions", type=int, multiple=True)
+@click.option("--start_offset", type=int)
+@click.option("--end_offset", type=int)
+@click.option(
+    "--kafka_ssl_cafile",
+    type=click.Path(exists=False, file_okay=True, dir_okay=False),
+)
+@click.option(
+    "--kafka_ssl_certfile",
+    type=click.Path(exists=False, file_okay=True, dir_okay=False),
+)
+@click.option(
+    "--kafka_ssl_keyfile",
+    type=click.Path(exists=False, file_okay=True, dir_okay=False),
+)
+@click.option("--batch_size", default=500, show_default=True)
+@click.option("--workers", default=3, show_default=True)
+@click.option("--rate", default=0.0, show_default=True, help="Messages per second")
+@click.option("--retention_days", default=30, show_default=True)
+@click.option("--postgres_host", default="postgres")
+@click.option("--postgres_port", default=5432)
+@click.option("--postgres_db", default="monitoring")
+@click.option("--postgres_user", default="demo")
+@click.option("--postgres_password", default="demopassword")
+@click.option("--postgres_ssl", default=False, show_default=True, is_flag=True)
+def replay(
+    file_names: Tuple[str, ...],
+    kafka_servers: str,
+    kafka_topic: str,
+    kafka_partitions: Tuple[int, ...],
+    start_offset: Optional[int],
+    end_offset: Optional[int],
+    kafka_ssl_cafile: str,
+    kafka_ssl_certfile: str,
+    kafka_ssl_keyfile: str,
+    batch_size: int,
+    workers: int,
+    rate: float,
+    retention_days: int,
+    postgres_host: str,
+    postgres_port: int,
+    postgres_db: str,
+    postgres_user: str,
+    postgres_password: str,
+    postgres_ssl: bool,
+) -> None:
+    """
+    writes check results of files or Kafka again
+    """
+    from consumer.postgres import (  # pylint: disable=import-outside-toplevel
+        pg_params,
+    )
+    from consumer.replay import (  # pylint: disable=import-outside-toplevel
+        run as run_replay,
+    )
+
+    pg_connection_params = pg_params(
+        postgres_host,
+        postgres_port,
+        postgres_db,
+        postgres_user,
+        postgres_password,
+        postgres_ssl,
+    )
+    run_replay(
+        file_names,
+        pg_connection_params,
+        kafka_servers=kafka_servers,
+        kafka_topic=kafka_topic,
+        kafka_partitions=kafka_partitions,
+        start_offset=start_offset,
+        end_offset=end_offset,
+        kafka_ssl_cafile=kafka_ssl_cafile,
+        kafka_ssl_certfile=kafka_ssl_certfile,
+        kafka_ssl_keyfile=kafka_ssl_keyfile,
+        batch_size=batch_size,
+        workers=workers,
+        rate=rate,
+        retention_days=retention_days,
     )
 
 
 main.add_command(monitoring)
 main.add_command(consumer)
+main.add_command(all_in_one)
 main.add_command(init_migration)
+main.add_command(history)
+main.add_command(archive)
+main.add_command(replay)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,44 @@
+"""
+This module represents metrics of the monitoring service
+"""
+from core.metrics import Counter, Gauge, Histogram
+
+CHECKS_STARTED = Counter(
+    "monitoring_checks_started_total", "Number of started site checks"
+)
+CHECKS_COMPLETED = Counter(
+    "monitoring_checks_completed_total", "Number of site checks returned a result"
+)
+CHECKS_FAILED = Counter(
+    "monitoring_checks_failed_total",
+    "Number of failed site checks by the error class",
+    ("error",),
+)
+CHECKS_IN_FLIGHT = Gauge(
+    "monitoring_checks_in_flight", "Number of site checks in progress"
+)
+CHECK_DURATION = Histogram(
+    "monitoring_check_duration_seconds", "Duration of a site check"
+)
+QUEUE_SIZE = Gauge(
+    "monitoring_queue_size", "Number of results waiting to be sent to Kafka"
+)
+KAFKA_SEND_DURATION = Histogram(
+    "monitoring_kafka_send_duration_seconds", "Duration of sending a result to Kafka"
+)
+CONDITIONAL_REQUESTS = Counter(
+    "monitoring_conditional_requests_total",
+    "Number of conditional content checks by the cache result",
+    ("result",),
+)
+CONDITIONAL_CACHE_SIZE = Gauge(
+    "monitoring_conditional_cache_size", "Number of cached content check verdicts"
+)
+PROBES = Counter(
+    "monitoring_probes_total", "Number of site probes by the result", ("result",)
+)
+TLS_HANDSHAKES = Counter(
+    "monitoring_tls_connections_total",
+    "Number of TLS connections of site checks by the handshake (full, resumed, reused)",
+    ("handshake",),
+)
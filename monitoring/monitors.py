@@ -3,22 +3,53 @@ This module represents site inspectors
 """
 import asyncio
 import re
+import ssl
+import time
+import weakref
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from datetime import datetime
 from functools import partial
-from typing import Dict, Any, Callable
+from http import HTTPStatus
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
 
 import aiohttp
-from aiohttp import ClientSession
+from aiohttp import ClientSession, TooManyRedirects
 from loguru import logger
+from yarl import URL
 
+from core.cache import LRUCache
 from core.models import Response
-from core.utils import now
+from core.utils import now, utc
+from monitoring.metrics import (
+    CHECKS_FAILED,
+    CONDITIONAL_CACHE_SIZE,
+    CONDITIONAL_REQUESTS,
+    PROBES,
+    TLS_HANDSHAKES,
+)
 
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36"
 }
+DEFAULT_CONDITIONAL_CACHE_SIZE = 10000
+DEFAULT_REDIRECT_CACHE_SIZE = 10000
+DEFAULT_MAX_REDIRECTS = 10
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+PERMANENT_REDIRECT_STATUSES = {301, 308}
+DEFAULT_PROBE_TIMEOUT = 5  # seconds
+DEFAULT_CERTIFICATE_CACHE_SIZE = 10000
+DEFAULT_CERTIFICATE_TTL = 3600  # seconds
 
 
 @dataclass
@@ -29,9 +60,12 @@ class ProviderList:
 
     HttpMonitor: int  # pylint: disable=invalid-name
     RegexpMonitor: int  # pylint: disable=invalid-name
+    ConditionalRegexpMonitor: int  # pylint: disable=invalid-name
+    TcpProbeMonitor: int  # pylint: disable=invalid-name
+    TlsProbeMonitor: int  # pylint: disable=invalid-name
 
 
-Provider = ProviderList(0, 1)
+Provider = ProviderList(0, 1, 2, 3, 4)
 
 
 @dataclass
@@ -48,6 +82,43 @@ class Monitor(ABC):
         raise NotImplementedError()
 
 
+def _transport(response: aiohttp.ClientResponse) -> Optional[asyncio.BaseTransport]:
+    """
+    returns the transport of the connection of a response
+    """
+    # the connection is released as soon as a short body is read with headers, the
+    # protocol of the response keeps the transport
+    protocol = getattr(response, "_protocol", None)
+    return protocol.transport if protocol is not None else None
+
+
+@dataclass
+class Certificate:
+    """
+    Certificate keeps details of a peer certificate
+
+    Attributes:
+       expires: A time when the certificate expires
+       issuer: An organization or a common name of the issuer
+    """
+
+    expires: datetime
+    issuer: Optional[str]
+
+    @classmethod
+    def parse(cls, peercert: Optional[Dict[str, Any]]) -> Optional["Certificate"]:
+        """
+        returns details of a certificate returned by SSLObject.getpeercert()
+        """
+        if not peercert or "notAfter" not in peercert:
+            return None
+        issuer = dict(name for rdn in peercert.get("issuer", ()) for name in rdn)
+        return cls(
+            datetime.fromtimestamp(ssl.cert_time_to_seconds(peercert["notAfter"]), utc),
+            issuer.get("organizationName") or issuer.get("commonName"),
+        )
+
+
 @dataclass
 class HttpMonitor(Monitor):
     """
@@ -55,49 +126,182 @@ class HttpMonitor(Monitor):
     """
 
     headers: Dict[str, str] = field(default_factory=lambda: DEFAULT_HEADERS)
+    redirects: LRUCache = field(
+        default_factory=lambda: LRUCache(DEFAULT_REDIRECT_CACHE_SIZE)
+    )
+    certificates: LRUCache = field(
+        default_factory=lambda: LRUCache(
+            DEFAULT_CERTIFICATE_CACHE_SIZE, DEFAULT_CERTIFICATE_TTL
+        )
+    )
+    _connections: "weakref.WeakSet[asyncio.BaseTransport]" = field(
+        default_factory=weakref.WeakSet, init=False
+    )
 
     async def check(  # pylint: disable=arguments-differ
-        self, session: ClientSession, *, url: str = None, **kwargs: Any
+        self,
+        session: ClientSession,
+        *,
+        url: str = None,
+        redirect_ttl: float = 0,
+        **kwargs: Any,
     ) -> Response:
         """
         Fetching page HTML
         """
+        response, _ = await self.fetch(session, url, self.headers, redirect_ttl)
+        return response
+
+    def _count_handshake(self, response: aiohttp.ClientResponse) -> None:
+        """
+        counts TLS connections by the handshake: a reused connection does not make it
+        """
+        transport = _transport(response)
+        if transport is None or transport.get_extra_info("ssl_object") is None:
+            return
+        if transport in self._connections:
+            TLS_HANDSHAKES.labels("reused").inc()
+            return
+        self._connections.add(transport)
+        if transport.get_extra_info("ssl_object").session_reused:
+            TLS_HANDSHAKES.labels("resumed").inc()
+        else:
+            TLS_HANDSHAKES.labels("full").inc()
+
+    def _certificate(self, response: aiohttp.ClientResponse) -> Optional[Certificate]:
+        """
+        returns the certificate of the TLS connection of a response, certificates are
+        parsed once in a ttl for a host
+        """
+        transport = _transport(response)
+        if transport is None:
+            return None
+        ssl_object = transport.get_extra_info("ssl_object")
+        if ssl_object is None:
+            return None
+        key = (response.url.host, response.url.port)
+        certificate = self.certificates.get(key)
+        if certificate is None:
+            # the certificate is empty if it is not validated
+            certificate = Certificate.parse(ssl_object.getpeercert())
+            if certificate is not None:
+                self.certificates.set(key, certificate)
+        return certificate
+
+    async def _follow(
+        self, session: ClientSession, url: str, headers: Mapping[str, str]
+    ) -> Tuple[aiohttp.ClientResponse, str, List[float], bool]:
+        """
+        follows redirects, returns the last response, its url, load times of hops
+        and whether all redirects are permanent
+        """
+        hop_times: List[float] = []
+        permanent = True
+        while True:
+            start = now()
+            response = await session.get(url, headers=headers, allow_redirects=False)
+            hop_times.append((now() - start).total_seconds())
+            self._count_handshake(response)
+            location = response.headers.get("Location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response, url, hop_times, permanent
+            if len(hop_times) > DEFAULT_MAX_REDIRECTS:
+                response.release()
+                raise TooManyRedirects(
+                    response.request_info,
+                    (),
+                    status=response.status,
+                    message=f"more than {DEFAULT_MAX_REDIRECTS} redirects",
+                )
+            permanent = permanent and response.status in PERMANENT_REDIRECT_STATUSES
+            response.release()
+            url = str(response.url.join(URL(location)))
+
+    async def fetch(
+        self,
+        session: ClientSession,
+        url: str,
+        headers: Mapping[str, str],
+        redirect_ttl: float = 0,
+    ) -> Tuple[Response, Mapping[str, str]]:
+        """
+        fetches a page, returns a result and headers of the response
+
+        Redirects are followed and timed hop by hop. If redirect_ttl is set, the target
+        of permanent redirects is requested directly for redirect_ttl seconds, then the
+        redirects are followed again. The body of a 304 response is not read.
+        """
         if not url:
             raise TypeError("url doen not set")
+        target = url
+        cached = self.redirects.get(url) if redirect_ttl else None
+        if cached is not None and cached[1] > time.monotonic():
+            target = cached[0]
         start = now()
         try:
-            response = await session.get(url, headers=self.headers)
+            response, final_url, hop_times, permanent = await self._follow(
+                session, target, headers
+            )
         except asyncio.TimeoutError:
             logger.warning("cannot reach {}, host does not respond (timeout)", url)
-            return Response(
-                url,
-                error="host does not respond (timeout)",
-                status_code=-1,
-                load_time=0,
-                request_time=now(),
-                body=None,
+            CHECKS_FAILED.labels("TimeoutError").inc()
+            self.redirects.pop(url)
+            return (
+                Response(
+                    url,
+                    error="host does not respond (timeout)",
+                    status_code=-1,
+                    load_time=0,
+                    request_time=now(),
+                    body=None,
+                ),
+                {},
             )
         except aiohttp.ClientError as err:
             logger.warning("cannot reach {}, {}", url, err)
-            return Response(
-                url,
-                error=f"{err}",
-                status_code=-1,
-                load_time=0,
-                request_time=now(),
-                body=None,
+            CHECKS_FAILED.labels(type(err).__name__).inc()
+            self.redirects.pop(url)
+            return (
+                Response(
+                    url,
+                    error=f"{err}",
+                    status_code=-1,
+                    load_time=0,
+                    request_time=now(),
+                    body=None,
+                ),
+                {},
             )
         load_time = (now() - start).total_seconds()
         logger.debug("{} returns {} -- {}", url, response.status, load_time)
-        body = await response.text()
-        return Response(
+        certificate = self._certificate(response)
+        if response.status == HTTPStatus.NOT_MODIFIED:
+            body = None
+            response.release()
+        else:
+            body = await response.text()
+        if not response.ok:
+            CHECKS_FAILED.labels("HTTPStatusError").inc()
+            self.redirects.pop(url)
+        elif redirect_ttl and final_url != target:
+            if permanent:
+                self.redirects.set(url, (final_url, time.monotonic() + redirect_ttl))
+            else:
+                self.redirects.pop(url)
+        result = Response(
             url,
             error=None if response.ok else f"returns {response.status} response",
             status_code=response.status,
             load_time=load_time,
             request_time=now(),
             body=body,
+            redirects=len(hop_times) - 1,
+            hop_times=hop_times,
         )
+        if certificate is not None:
+            result.cert_expires = certificate.expires
+            result.cert_issuer = certificate.issuer
+        return result, response.headers
 
 
 class RegexpMonitor(HttpMonitor):
@@ -118,24 +322,215 @@ class RegexpMonitor(HttpMonitor):
         """
         if not regexp_pattern:
             raise TypeError("cannot find a regexp pattern")
-        response = await super().check(session, url=url)
+        response = await super().check(session, url=url, **kwargs)
+        return self.match(response, regexp_pattern)
+
+    @staticmethod
+    def match(response: Response, regexp_pattern: re.Pattern) -> Response:
+        """
+        sets an error of a result if the page does not contain a pattern
+        """
         if not response.ok or response.body is None:
             return response
         if regexp_pattern.search(response.body) is not None:
             return response
+        CHECKS_FAILED.labels("PatternNotFound").inc()
         response.error = "cannot find a pattern on the page"
         return response
 
 
-def get_provider_type(item: Dict[str, str]):
+@dataclass
+class Verdict:
     """
-    get_provider_type returns a provider base on object
+    Verdict is a result of a content check of a page version
+
+    Attributes:
+       etag: An ETag header of the page
+       last_modified: A Last-Modified header of the page
+       status_code: A status code of the page
+       error: An error of the check, None if the pattern is found
+    """
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    status_code: int
+    error: Optional[str]
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        returns headers of a request for another version of the page
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass
+class ConditionalRegexpMonitor(RegexpMonitor):
+    """
+    ConditionalRegexpMonitor checks a pattern only when the page changes
+
+    The ETag and Last-Modified headers of a page are kept with the verdict of the
+    check and sent back in If-None-Match and If-Modified-Since headers. The server
+    answers 304 if the page is not changed, the verdict is reused without
+    downloading and matching the page.
+
+    Attributes:
+       cache: Verdicts of recently checked pages
+    """
+
+    cache: LRUCache = field(
+        default_factory=lambda: LRUCache(DEFAULT_CONDITIONAL_CACHE_SIZE)
+    )
+
+    async def check(  # pylint: disable=arguments-differ
+        self,
+        session: ClientSession,
+        *,
+        url: str = "",
+        regexp_pattern: re.Pattern = None,
+        redirect_ttl: float = 0,
+        **kwargs: Any,
+    ) -> Response:
+        """
+        Fetching page HTML if it is changed & check the regexp value
+        """
+        if not regexp_pattern:
+            raise TypeError("cannot find a regexp pattern")
+        key = (url, regexp_pattern.pattern)
+        verdict: Optional[Verdict] = self.cache.get(key)
+        headers = self.headers
+        if verdict is not None:
+            headers = {**headers, **verdict.conditional_headers()}
+        response, response_headers = await self.fetch(
+            session, url, headers, redirect_ttl
+        )
+        if verdict is not None and response.status_code == HTTPStatus.NOT_MODIFIED:
+            CONDITIONAL_REQUESTS.labels("hit").inc()
+            response.status_code = verdict.status_code
+            response.error = verdict.error
+            if response.error is not None:
+                CHECKS_FAILED.labels("PatternNotFound").inc()
+            return response
+        CONDITIONAL_REQUESTS.labels("miss").inc()
+        response = self.match(response, regexp_pattern)
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if response.status_code == HTTPStatus.OK and (etag or last_modified):
+            self.cache.set(
+                key, Verdict(etag, last_modified, response.status_code, response.error)
+            )
+        else:
+            self.cache.pop(key)
+        CONDITIONAL_CACHE_SIZE.set(len(self.cache))
+        return response
+
+
+@dataclass
+class ProbeMonitor(Monitor):
+    """
+    ProbeMonitor runs a cheap probe of a site and a full check of it when it is due
+
+    A probe opens a TCP connection to the host of a site or makes a TLS handshake with
+    it. A successful probe returns no result, the full check runs once in a period of
+    the site and right away when a probe fails.
+
+    Attributes:
+       tls: Whether a probe makes a TLS handshake
+       timeout: A timeout of a probe in seconds
+       last_checks: Monotonic times of the last full check of sites
+    """
+
+    tls: bool = False
+    timeout: float = DEFAULT_PROBE_TIMEOUT
+    last_checks: Dict[str, float] = field(default_factory=dict)
+    _ssl_context: Optional[ssl.SSLContext] = field(default=None, init=False)
+
+    @property
+    def ssl_context(self) -> ssl.SSLContext:
+        """
+        returns a shared context of TLS handshakes
+        """
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    async def probe(self, url: str) -> bool:
+        """
+        returns whether the host of a site accepts a connection
+        """
+        parsed = URL(url)
+        tls = self.tls and parsed.scheme == "https"
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    parsed.host, parsed.port, ssl=self.ssl_context if tls else None
+                ),
+                self.timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as err:
+            reason = str(err) or type(err).__name__
+            logger.warning("probe of {} failed, {}", url, reason)
+            PROBES.labels("failed").inc()
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        PROBES.labels("ok").inc()
+        return True
+
+    async def check(  # pylint: disable=arguments-differ
+        self,
+        session: ClientSession,
+        *,
+        url: str = "",
+        full_check: Callable[[ClientSession], Awaitable[Response]] = None,
+        period: float = 0,
+        **kwargs: Any,
+    ) -> Optional[Response]:
+        """
+        probes a site, returns a result of the full check if it runs
+        """
+        if full_check is None:
+            raise TypeError("cannot find a full check")
+        start = time.monotonic()
+        last_check = self.last_checks.get(url)
+        if last_check is not None and start - last_check < period:
+            if await self.probe(url):
+                return None
+            logger.info("probe of {} failed, running the full check", url)
+        self.last_checks[url] = start
+        return await full_check(session)
+
+
+def get_check_type(item: Dict[str, Any]) -> int:
+    """
+    get_check_type returns a provider of the full check of a site
     """
     if isinstance(item.get("regexp_pattern"), re.Pattern):
+        if item.get("conditional"):
+            return Provider.ConditionalRegexpMonitor
         return Provider.RegexpMonitor
     return Provider.HttpMonitor
 
 
+def get_provider_type(item: Dict[str, Any]) -> int:
+    """
+    get_provider_type returns a provider base on object
+    """
+    probe = item.get("probe")
+    if probe == "tcp":
+        return Provider.TcpProbeMonitor
+    if probe == "tls":
+        return Provider.TlsProbeMonitor
+    return get_check_type(item)
+
+
 @dataclass
 class MonitorFactory:
     """
@@ -154,7 +549,7 @@ class MonitorFactory:
         """
         self._providers[provider_id] = provider
 
-    def _get_provider(self, provider_id: int, item: Dict[str, str]) -> Callable:
+    def _get_provider(self, provider_id: int, item: Dict[str, Any]) -> Callable:
         """
         _get_provider returns a callable function base on provider id
         """
@@ -163,17 +558,28 @@ class MonitorFactory:
             raise ValueError("cannot get a provider")
         return partial(provider.check, **item)
 
-    def get_provider(self, item: Dict[str, str]) -> Callable:
+    def get_provider(self, item: Dict[str, Any]) -> Callable:
         """
         get_provider returns a callable function
+
+        A probe provider gets the full check of a site as the full_check argument.
         """
         provider_type = get_provider_type(item)
-        return self._get_provider(provider_type, item)
+        provider = self._get_provider(provider_type, item)
+        if provider_type in (Provider.TcpProbeMonitor, Provider.TlsProbeMonitor):
+            full_check = self._get_provider(get_check_type(item), item)
+            return partial(provider, full_check=full_check)
+        return provider
 
 
 ProviderPool = MonitorFactory()
 ProviderPool.register_format(Provider.HttpMonitor, HttpMonitor())
 ProviderPool.register_format(Provider.RegexpMonitor, RegexpMonitor())
+ProviderPool.register_format(
+    Provider.ConditionalRegexpMonitor, ConditionalRegexpMonitor()
+)
+ProviderPool.register_format(Provider.TcpProbeMonitor, ProbeMonitor())
+ProviderPool.register_format(Provider.TlsProbeMonitor, ProbeMonitor(tls=True))
 
 
 def get_monitor_instance(item: Dict[str, str]) -> Callable:
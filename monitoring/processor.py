@@ -5,23 +5,43 @@ from __future__ import annotations
 
 import asyncio
 import sys
-from functools import partial
+import time
 from typing import List, Dict, Set, Any, Callable
 
 import aiohttp
 from aiohttp import ClientSession
 from loguru import logger
 
+from core.loop import DEFAULT_LOOP, new_event_loop
+from core.metrics import (
+    DEFAULT_METRICS_HOST,
+    monitor_loop_lag,
+    start_metrics_server,
+)
 from core.models import Response
+from core.profiling import (
+    DEFAULT_PROFILE_DIR,
+    DEFAULT_SLOW_CALLBACK_DURATION,
+    Profiler,
+)
+from core.reader import JSONFileReader
+from monitoring.metrics import (
+    CHECKS_STARTED,
+    CHECKS_COMPLETED,
+    CHECKS_FAILED,
+    CHECKS_IN_FLIGHT,
+    CHECK_DURATION,
+    QUEUE_SIZE,
+)
 from monitoring.monitors import get_monitor_instance
 from monitoring.producer import run_worker
-from monitoring.reader import JSONFileReader
 from monitoring.schema import FILE_SCHEMA
-from monitoring.writers import KafkaWriter
+from monitoring.writers import BaseWriter, KafkaWriter
 
 DEFAULT_TIMEOUT = 10
 DEFAULT_CHECK_PERIOD = 60
 DEFAULT_WORKERS = 3
+DEFAULT_PROBE_PERIOD = 10
 
 
 def _cancel_tasks(to_cancel: Set["asyncio.Task[Any]"], loop: asyncio.AbstractEventLoop):
@@ -48,40 +68,113 @@ def _cancel_tasks(to_cancel: Set["asyncio.Task[Any]"], loop: asyncio.AbstractEve
             )
 
 
-def callback(queue: asyncio.Queue[Response], fut: asyncio.Task):
+async def _check(
+    monitor: Callable, session: ClientSession, queue: asyncio.Queue[Response]
+) -> None:
     """
-    callback calls when coroutine returns a result
+    runs a monitor, records the check metrics and sends the response to the queue
+
+    The response waits for free space in the queue, so a slow writer holds the checks.
     """
+    CHECKS_STARTED.inc()
+    CHECKS_IN_FLIGHT.inc()
+    start = time.perf_counter()
     try:
-        response = fut.result()
+        response = await monitor(session)
     except Exception as err:  # pylint: disable=broad-except
         logger.error("Unexpected error for getting content - {}", err)
+        CHECKS_FAILED.labels(type(err).__name__).inc()
         return
-    try:
-        asyncio.get_event_loop().call_soon_threadsafe(queue.put_nowait, response)
-    except asyncio.QueueFull as err:
-        logger.error("queue is full cannot send a response - {}", err)
+    finally:
+        CHECK_DURATION.observe(time.perf_counter() - start)
+        CHECKS_IN_FLIGHT.dec()
+    if response is None:
+        # a probe passed, there is nothing to send
+        return
+    CHECKS_COMPLETED.inc()
+    await queue.put(response)
 
 
 async def _run_monitoring(
-    queue,
+    queue: asyncio.Queue[Response],
     period: int,
     session: ClientSession,
     monitors: List[Callable],
 ):
     """
     Periodically poll for monitoring
+
+    A round of checks starts when the previous one is sent to the queue.
     """
     iteration = 1
+    checks: List[asyncio.Future] = []
+    try:
+        while True:
+            if checks:
+                await asyncio.wait(checks)
+            logger.debug("Checking sites ({})", iteration)
+            checks = [
+                asyncio.ensure_future(_check(monitor, session, queue))
+                for monitor in monitors
+            ]
+            logger.debug("Waiting for {} seconds...".format(period))
+            iteration += 1
+            await asyncio.sleep(period)
+    finally:
+        for check in checks:
+            check.cancel()
+
+
+def schedule_groups(
+    sources: List[Dict[str, Any]], period: int = DEFAULT_CHECK_PERIOD
+) -> Dict[int, List[Callable]]:
+    """
+    returns callable objects to check sources grouped by the period of checks
+
+    A site is checked once in its own period or the default one, a site with a probe
+    is probed once in its probe period.
+    """
+    groups: Dict[int, List[Callable]] = {}
+    for source in sources:
+        source = {**source, "period": source.get("period", period)}
+        if source.get("probe"):
+            group_period = source.get("probe_period", DEFAULT_PROBE_PERIOD)
+        else:
+            group_period = source["period"]
+        groups.setdefault(group_period, []).append(get_monitor_instance(source))
+    return groups
+
+
+async def monitor_sites(
+    sources: List[Dict[str, str]],
+    writer: BaseWriter,
+    period: int = DEFAULT_CHECK_PERIOD,
+) -> None:
+    """
+    checks sites periodically and sends responses to the writer until it is cancelled
+    """
+    queue: asyncio.Queue[Response] = asyncio.Queue(maxsize=512)
+    QUEUE_SIZE.set_function(queue.qsize)
+    # create workers to process the queue.
+    worker_tasks = []
+    for index in range(DEFAULT_WORKERS):
+        worker_tasks.append(asyncio.create_task(run_worker(index, queue, writer)))
 
-    while True:
-        logger.debug("Checking sites ({})", iteration)
-        for monitor in monitors:
-            future = asyncio.ensure_future(monitor(session))
-            future.add_done_callback(partial(callback, queue))
-        logger.debug("Waiting for {} seconds...".format(period))
-        iteration += 1
-        await asyncio.sleep(period)
+    groups = schedule_groups(sources, period)
+    timeout = aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await asyncio.gather(
+                *(
+                    _run_monitoring(queue, group_period, session, monitors)
+                    for group_period, monitors in groups.items()
+                )
+            )
+    finally:
+        # cancel workers
+        for task in worker_tasks:
+            task.cancel()
+        logger.debug("workers stopped")
 
 
 async def _run_app(
@@ -92,8 +185,13 @@ async def _run_app(
     kafka_ssl_cafile: str = None,
     kafka_ssl_certfile: str = None,
     kafka_ssl_keyfile: str = None,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: int = None,
 ):
-    queue: asyncio.Queue[Response] = asyncio.Queue(maxsize=512)
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await start_metrics_server(metrics_host, metrics_port)
+        asyncio.create_task(monitor_loop_lag())
     # setup a kafka producer
     producer = KafkaWriter(
         kafka_servers,
@@ -103,24 +201,13 @@ async def _run_app(
         kafka_ssl_keyfile=kafka_ssl_keyfile,
     )
     await producer.start()
-    # create workers to process the queue.
-    worker_tasks = []
-    for index in range(DEFAULT_WORKERS):
-        worker_tasks.append(asyncio.create_task(run_worker(index, queue, producer)))
-
-    # create callable objects to check a source
-    monitors = [get_monitor_instance(source) for source in sources]
-    timeout = aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT)
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            await _run_monitoring(queue, DEFAULT_CHECK_PERIOD, session, monitors)
-    except asyncio.CancelledError:
-        # cancel workers
-        for task in worker_tasks:
-            task.cancel()
-        logger.debug("workers stopped")
+        await monitor_sites(sources, producer)
+    finally:
         await producer.stop()
         logger.debug("kafka producer stopped")
+        if metrics_server is not None:
+            metrics_server.close()
 
 
 def run_app(
@@ -131,10 +218,17 @@ def run_app(
     kafka_ssl_cafile: str = None,
     kafka_ssl_certfile: str = None,
     kafka_ssl_keyfile: str = None,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+    metrics_port: int = None,
+    profile: bool = False,
+    profile_dir: str = DEFAULT_PROFILE_DIR,
+    slow_callback_duration: float = DEFAULT_SLOW_CALLBACK_DURATION,
+    loop_type: str = DEFAULT_LOOP,
     debug: bool = False,
 ) -> None:
     """Run an app locally"""
-    loop = asyncio.get_event_loop()
+    loop = new_event_loop(loop_type)
+    asyncio.set_event_loop(loop)
     loop.set_debug(debug)
 
     logger.remove()
@@ -144,6 +238,7 @@ def run_app(
         format="<green>{time}</green> <level>{level}</level>: {message}",
         level="DEBUG" if debug else "INFO",
     )
+    profiler = Profiler(profile_dir, slow_callback_duration) if profile else None
 
     with JSONFileReader(source_file, FILE_SCHEMA) as r:
         try:
@@ -152,6 +247,8 @@ def run_app(
             return
 
     logger.debug(raw_data)
+    if profiler is not None:
+        profiler.start(loop)
     try:
         main_task = loop.create_task(
             _run_app(
@@ -161,6 +258,8 @@ def run_app(
                 kafka_ssl_cafile=kafka_ssl_cafile,
                 kafka_ssl_certfile=kafka_ssl_certfile,
                 kafka_ssl_keyfile=kafka_ssl_keyfile,
+                metrics_host=metrics_host,
+                metrics_port=metrics_port,
             )
         )
         loop.run_until_complete(main_task)
@@ -172,3 +271,5 @@ def run_app(
         loop.run_until_complete(loop.shutdown_asyncgens())
         loop.close()
         asyncio.set_event_loop(None)
+        if profiler is not None:
+            profiler.stop()
@@ -20,5 +20,6 @@ async def run_worker(
         logger.debug(f"[{worker_id}] message received")
         # create the message
         message = response.serialize()
-        await writer.write(message)
+        # results of a site are keyed by the url to keep them in one partition
+        await writer.write(message, key=response.url.encode())
         queue.task_done()
@@ -40,6 +40,11 @@ SITE_SCHEMA = t.Dict(
     {
         t.Key("url"): t.URL,
         OptKey("regexp_pattern"): ToRegexp,
+        OptKey("conditional"): t.Bool,
+        OptKey("redirect_ttl"): t.ToInt(gte=0),
+        OptKey("period"): t.ToInt(gte=1),
+        OptKey("probe"): t.Enum("tcp", "tls"),
+        OptKey("probe_period"): t.ToInt(gte=1),
     }
 ).ignore_extra("*")
 
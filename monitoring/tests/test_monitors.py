@@ -1,10 +1,29 @@
 import asyncio
 import re
+import ssl
+import subprocess
+from datetime import datetime
+from unittest.mock import patch
 
 import aiohttp
 import pytest
+from aiohttp import web
+from yarl import URL
 
-from monitoring.monitors import HttpMonitor, RegexpMonitor, get_monitor_instance
+from core.models import Response
+from core.utils import now, utc
+from monitoring.metrics import TLS_HANDSHAKES
+from monitoring.monitors import (
+    Certificate,
+    ConditionalRegexpMonitor,
+    HttpMonitor,
+    ProbeMonitor,
+    Provider,
+    RegexpMonitor,
+    get_check_type,
+    get_monitor_instance,
+    get_provider_type,
+)
 
 
 @pytest.mark.asyncio
@@ -140,3 +159,221 @@ async def test_monitor_factory(aioresponses):
         resp = await provider3(session)
         assert resp.url == "http://getstatuscode.com/check_regexp_error"
         assert not resp.ok
+
+
+@pytest.mark.asyncio
+async def test_conditional_regexp_inspector(aioresponses):
+    url = "http://getstatuscode.com/conditional"
+    pattern = re.compile(r'href="https://example.com(.*?)"')
+    aioresponses.get(
+        url,
+        status=200,
+        body='Go to <a href="https://site.com/about">Demo</a>',
+        headers={"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2020 00:00:00 GMT"},
+    )
+    aioresponses.get(url, status=304)
+    aioresponses.get(
+        url,
+        status=200,
+        body='Go to <a href="https://example.com/about">Demo</a>',
+    )
+    aioresponses.get(url, status=200, body="")
+    client = ConditionalRegexpMonitor()
+    async with aiohttp.ClientSession() as session:
+        resp = await client.check(session, url=url, regexp_pattern=pattern)
+        assert resp.status_code == 200
+        assert not resp.ok
+        assert len(client.cache) == 1
+
+        # the page is not changed, the verdict is reused
+        resp = await client.check(session, url=url, regexp_pattern=pattern)
+        assert resp.status_code == 200
+        assert resp.error == "cannot find a pattern on the page"
+        requests = [
+            call.kwargs["headers"] for call in aioresponses.requests[("GET", URL(url))]
+        ]
+        assert "If-None-Match" not in requests[0]
+        assert requests[1]["If-None-Match"] == '"v1"'
+        assert requests[1]["If-Modified-Since"] == "Wed, 01 Jan 2020 00:00:00 GMT"
+
+        # a page without validators is not cached
+        resp = await client.check(session, url=url, regexp_pattern=pattern)
+        assert resp.ok
+        assert len(client.cache) == 0
+        await client.check(session, url=url, regexp_pattern=pattern)
+        requests = aioresponses.requests[("GET", URL(url))]
+        assert "If-None-Match" not in requests[3].kwargs["headers"]
+
+
+def test_conditional_provider_type():
+    pattern = re.compile("Demo")
+    item = {"url": "http://getstatuscode.com", "regexp_pattern": pattern}
+    assert get_provider_type(item) == Provider.RegexpMonitor
+    assert get_provider_type({**item, "conditional": True}) == (
+        Provider.ConditionalRegexpMonitor
+    )
+    assert get_provider_type({"url": item["url"], "conditional": True}) == (
+        Provider.HttpMonitor
+    )
+
+
+@pytest.mark.asyncio
+async def test_inspector_times_redirects(aioresponses):
+    aioresponses.get(
+        "http://redirect.com/", status=301, headers={"Location": "http://b.com/x"}
+    )
+    aioresponses.get("http://b.com/x", status=302, headers={"Location": "/y"})
+    aioresponses.get("http://b.com/y", status=200, body="test")
+    aioresponses.get("http://loop.com/", status=302, headers={"Location": "/"})
+    aioresponses.get("http://loop.com/", status=302, headers={"Location": "/"})
+    client = HttpMonitor()
+    async with aiohttp.ClientSession() as session:
+        resp = await client.check(session, url="http://redirect.com/")
+        assert resp.url == "http://redirect.com/"
+        assert resp.ok
+        assert resp.redirects == 2
+        assert len(resp.hop_times) == 3
+        assert resp.load_time >= sum(resp.hop_times)
+        assert resp.to_dict()["redirects"] == 2
+
+        client = HttpMonitor()
+        with patch("monitoring.monitors.DEFAULT_MAX_REDIRECTS", 1):
+            resp = await client.check(session, url="http://loop.com/")
+        assert resp.status_code == -1
+        assert "more than 1 redirects" in resp.error
+
+
+@pytest.mark.asyncio
+async def test_inspector_caches_permanent_redirects(aioresponses):
+    url = "http://redirect.com/"
+    target = "http://www.redirect.com/"
+    aioresponses.get(url, status=301, headers={"Location": target})
+    aioresponses.get(target, status=200, body="test", repeat=True)
+    client = HttpMonitor()
+    async with aiohttp.ClientSession() as session:
+        resp = await client.check(session, url=url, redirect_ttl=60)
+        assert resp.redirects == 1
+
+        # the target is checked directly
+        resp = await client.check(session, url=url, redirect_ttl=60)
+        assert resp.url == url
+        assert resp.ok
+        assert resp.redirects == 0
+        assert len(aioresponses.requests[("GET", URL(target))]) == 2
+
+        # the redirect is validated again when the ttl expires
+        client.redirects.set(url, (target, 0))
+        aioresponses.get(url, status=302, headers={"Location": target})
+        resp = await client.check(session, url=url, redirect_ttl=60)
+        assert resp.redirects == 1
+        assert len(aioresponses.requests[("GET", URL(url))]) == 2
+        # a temporary redirect is not cached
+        assert client.redirects.get(url) is None
+
+
+@pytest.mark.asyncio
+async def test_probe_runs_full_check_when_due_or_failed():
+    server = await asyncio.start_server(
+        lambda reader, writer: writer.close(), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/"
+    full_checks = []
+
+    async def full_check(session):
+        full_checks.append(session)
+        return Response(url, request_time=now(), status_code=200)
+
+    client = ProbeMonitor()
+    # the first check is full
+    resp = await client.check(None, url=url, full_check=full_check, period=60)
+    assert resp.status_code == 200
+    # the host accepts connections, the full check is not due
+    assert await client.check(None, url=url, full_check=full_check, period=60) is None
+    assert len(full_checks) == 1
+
+    server.close()
+    await server.wait_closed()
+    resp = await client.check(None, url=url, full_check=full_check, period=60)
+    assert resp.status_code == 200
+    assert len(full_checks) == 2
+
+    # the full check is due
+    resp = await client.check(None, url=url, full_check=full_check, period=0)
+    assert len(full_checks) == 3
+
+
+def test_probe_provider_type():
+    item = {"url": "https://getstatuscode.com", "probe": "tls"}
+    assert get_provider_type(item) == Provider.TlsProbeMonitor
+    assert get_provider_type({**item, "probe": "tcp"}) == Provider.TcpProbeMonitor
+    assert get_check_type(item) == Provider.HttpMonitor
+
+
+@pytest.fixture
+def certificate(tmp_path):
+    cert_file, key_file = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "30",
+            "-subj",
+            "/O=Test Issuer/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout",
+            str(key_file),
+            "-out",
+            str(cert_file),
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return str(cert_file), str(key_file)
+
+
+@pytest.mark.asyncio
+async def test_inspector_reads_peer_certificate(certificate):
+    cert_file, key_file = certificate
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_file, key_file)
+    async def handler(request):
+        return web.Response(text="test")
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=server_context)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f"https://127.0.0.1:{port}/"
+
+    full, reused = (TLS_HANDSHAKES.labels(name).get() for name in ("full", "reused"))
+    client = HttpMonitor()
+    connector = aiohttp.TCPConnector(ssl=ssl.create_default_context(cafile=cert_file))
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            resp = await client.check(session, url=url)
+            assert resp.ok
+            assert resp.cert_issuer == "Test Issuer"
+            days = (resp.cert_expires - datetime.now(utc)).days
+            assert 28 <= days <= 30
+            assert resp.to_dict()["cert_issuer"] == "Test Issuer"
+
+            # the connection is reused, the certificate is not parsed again
+            with patch.object(Certificate, "parse") as parse:
+                resp = await client.check(session, url=url)
+            parse.assert_not_called()
+            assert resp.cert_issuer == "Test Issuer"
+            assert TLS_HANDSHAKES.labels("full").get() == full + 1
+            assert TLS_HANDSHAKES.labels("reused").get() == reused + 1
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from core.models import Response
+from core.utils import now
+from monitoring.processor import _run_monitoring, schedule_groups
+
+
+def test_schedule_groups():
+    sources = [
+        {"url": "https://site-1.com"},
+        {"url": "https://site-2.com", "period": 300},
+        {"url": "https://site-3.com", "probe": "tcp", "probe_period": 5},
+        {"url": "https://site-4.com", "probe": "tls"},
+    ]
+    groups = schedule_groups(sources, 60)
+    assert {period: len(monitors) for period, monitors in groups.items()} == {
+        60: 1,
+        300: 1,
+        5: 1,
+        10: 1,
+    }
+    probe = groups[5][0]
+    assert probe.keywords["period"] == 60
+    assert probe.keywords["full_check"].keywords["url"] == "https://site-3.com"
+
+
+@pytest.mark.asyncio
+async def test_full_queue_holds_checks():
+    queue = asyncio.Queue(1)
+    calls = []
+
+    async def monitor(session):
+        calls.append(session)
+        return Response(url="https://google.com", request_time=now())
+
+    task = asyncio.ensure_future(_run_monitoring(queue, 0, None, [monitor, monitor]))
+    await asyncio.sleep(0.05)
+    # a response waits for free space, the next round waits for it
+    assert (len(calls), queue.qsize()) == (2, 1)
+
+    queue.get_nowait()
+    await asyncio.sleep(0.05)
+    assert (len(calls), queue.qsize()) == (4, 1)
+    task.cancel()
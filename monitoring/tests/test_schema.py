@@ -38,3 +38,20 @@ def test_schema():
             "url": "https://google.com",
         }
     ]
+    assert SITE_SCHEMA.check({"url": "https://google.com", "conditional": True}) == {
+        "url": "https://google.com",
+        "conditional": True,
+    }
+    with pytest.raises(t.DataError):
+        SITE_SCHEMA.check({"url": "https://google.com", "conditional": "yes"})
+    assert SITE_SCHEMA.check({"url": "https://google.com", "redirect_ttl": "3600"}) == {
+        "url": "https://google.com",
+        "redirect_ttl": 3600,
+    }
+    with pytest.raises(t.DataError):
+        SITE_SCHEMA.check({"url": "https://google.com", "redirect_ttl": -1})
+    assert SITE_SCHEMA.check(
+        {"url": "https://google.com", "probe": "tls", "probe_period": "5"}
+    ) == {"url": "https://google.com", "probe": "tls", "probe_period": 5}
+    with pytest.raises(t.DataError):
+        SITE_SCHEMA.check({"url": "https://google.com", "probe": "icmp"})
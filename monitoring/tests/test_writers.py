@@ -0,0 +1,29 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core.models import Response
+from core.utils import now
+from monitoring.producer import run_worker
+from monitoring.writers import KafkaWriter
+
+
+@pytest.mark.asyncio
+async def test_results_of_a_site_are_keyed_by_url():
+    writer = KafkaWriter("localhost:9092", "checks")
+    writer.producer = AsyncMock()
+    queue = asyncio.Queue()
+    for url in ("https://site-1.com", "https://site-2.com", "https://site-1.com"):
+        queue.put_nowait(Response(url, request_time=now(), status_code=200))
+    worker = asyncio.ensure_future(run_worker(0, queue, writer))
+    await asyncio.wait_for(queue.join(), 1)
+    worker.cancel()
+
+    calls = writer.producer.send_and_wait.await_args_list
+    assert [call.args[0] for call in calls] == ["checks"] * 3
+    assert [call.kwargs["key"] for call in calls] == [
+        b"https://site-1.com",
+        b"https://site-2.com",
+        b"https://site-1.com",
+    ]
@@ -2,15 +2,18 @@
 This module represents writers
 """
 import asyncio
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Any
+from typing import Any, Optional
 
 from aiokafka import AIOKafkaProducer
 from aiokafka.helpers import create_ssl_context
 
 from loguru import logger
 
+from monitoring.metrics import KAFKA_SEND_DURATION
+
 
 @dataclass
 class BaseWriter(ABC):
@@ -72,9 +75,14 @@ class KafkaWriter(BaseWriter):
         await self.producer.stop()
         logger.debug("Stopping kafka producer...")
 
-    async def write(self, message: bytes, *args: Any, **kwargs: Any) -> None:
+    async def write(  # pylint: disable=arguments-differ
+        self, message: bytes, *args: Any, key: Optional[bytes] = None, **kwargs: Any
+    ) -> None:
         """
-        check a resource
+        sends a message to the topic, messages with the same key are sent to the same
+        partition and consumed in order
         """
-        await self.producer.send_and_wait("monitoring", message)
+        start = time.perf_counter()
+        await self.producer.send_and_wait(self.topic, message, key=key)
+        KAFKA_SEND_DURATION.observe(time.perf_counter() - start)
         logger.debug("Sending event: {}", message)